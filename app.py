@@ -1,16 +1,103 @@
+import argparse
 import logging
+import os
 
 from wikibaseintegrator.wbi_config import config as wbconfig  # type:ignore
 
 import config
+from src.exceptions import UnfinishedQueueError
 from src.models.enrich_hiking_trails import EnrichHikingTrails
+from src.models.review_queue import ReviewQueue
+from src.models.route_name_corpus import RouteNameCorpus
+from src.models.shard_runner import Shard, ShardRunner
 
 logging.basicConfig(level=config.loglevel)
 wbconfig["USER_AGENT"] = config.user_agent
 
-print(
-    f"Checking trails not updated for {config.max_days_between_new_check} "
-    f"days for lang:{config.language_code} and country:{config.country_qid}"
-)
-eht = EnrichHikingTrails()
-eht.add_osm_property_to_items()
+# Guarded because sharded runs start worker processes that import this module
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Match hiking trails in Wikidata with relations in OpenStreetMap"
+    )
+    parser.add_argument(
+        "mode",
+        nargs="?",
+        choices=["interactive", "prepare", "review", "match"],
+        default="interactive",
+        help="prepare looks up every due item without prompting and writes a "
+        "review queue, review prompts for the items in that queue, match compares "
+        "the labels of all due items with the local route name corpus",
+    )
+    current_shard = Shard(
+        country_qid=config.country_qid, language_code=config.language_code
+    )
+    parser.add_argument(
+        "--queue",
+        default=current_shard.queue_path,
+        help="path of the review queue",
+    )
+    parser.add_argument(
+        "--matches",
+        default=current_shard.matches_path,
+        help="where match writes the candidates",
+    )
+    parser.add_argument(
+        "--shards",
+        type=Shard.parse_list,
+        help="run prepare or match for several countries and languages in parallel, "
+        "e.g. Q34:sv,Q20:nb,Q33:fi. Each shard writes its own queue or matches file",
+    )
+    parser.add_argument(
+        "--retry-failed-edits",
+        action="store_true",
+        help="write the edits that failed in an earlier session again",
+    )
+    parser.add_argument(
+        "--overwrite",
+        action="store_true",
+        help="let prepare replace a review queue that has unreviewed items",
+    )
+    args = parser.parse_args()
+
+    if args.shards:
+        if args.mode not in ShardRunner.modes:
+            parser.error("--shards only works with the prepare and match modes")
+        if args.mode == "match" and not os.path.exists(config.route_name_corpus_path):
+            raise SystemExit(
+                f"{config.route_name_corpus_path} does not exist, "
+                f"build it with app_index.py route-names"
+            )
+        try:
+            ShardRunner(shards=args.shards, overwrite=args.overwrite).run(
+                mode=args.mode
+            )
+        except UnfinishedQueueError as e:
+            raise SystemExit(str(e))
+        raise SystemExit(0)
+
+    print(
+        f"Checking trails not updated for {config.max_days_between_new_check} "
+        f"days for lang:{config.language_code} and country:{config.country_qid}"
+    )
+    eht = EnrichHikingTrails(retry_failed_edits=args.retry_failed_edits)
+    if args.mode == "prepare":
+        try:
+            eht.prepare_review_queue(
+                queue=ReviewQueue(args.queue, overwrite=args.overwrite)
+            )
+        except UnfinishedQueueError as e:
+            raise SystemExit(str(e))
+    elif args.mode == "review":
+        eht.review_queue(queue=ReviewQueue(args.queue))
+    elif args.mode == "match":
+        if not os.path.exists(config.route_name_corpus_path):
+            raise SystemExit(
+                f"{config.route_name_corpus_path} does not exist, "
+                f"build it with app_index.py route-names"
+            )
+        eht.match_labels_in_bulk(
+            corpus=RouteNameCorpus.load(config.route_name_corpus_path),
+            output_path=args.matches,
+        )
+    else:
+        eht.add_osm_property_to_items()
@@ -0,0 +1,104 @@
+import argparse
+import logging
+
+import config
+from src.console import console
+from src.models.osm_relation_index import OsmRelationIndex
+from src.models.osm_relation_store import default_relation_store
+from src.models.route_location_index import RouteLocationIndex
+from src.models.route_name_corpus import RouteNameCorpus
+from src.models.wikidata_tag_index import WikidataTagIndex
+
+logging.basicConfig(level=config.loglevel)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Build local indexes from an OSM extract"
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    relations = subparsers.add_parser(
+        "relations", help="build the memory-mapped relation index"
+    )
+    relations.add_argument("extract", help="path to a .osm or .osm.bz2 extract")
+    relations.add_argument(
+        "--output",
+        default=config.relation_index_path or "cache/osm_relations.idx",
+        help="where to write the index",
+    )
+    relations.add_argument(
+        "--all",
+        action="store_true",
+        help="index all relations, not only route and superroute relations",
+    )
+    wikidata_tags = subparsers.add_parser(
+        "wikidata-tags",
+        help="build the QID to OSM objects index used instead of OSM Wikidata Link",
+    )
+    source = wikidata_tags.add_mutually_exclusive_group(required=True)
+    source.add_argument("--extract", help="path to a .osm or .osm.bz2 extract")
+    source.add_argument(
+        "--from-store",
+        action="store_true",
+        help="use the relations in the local relation store",
+    )
+    wikidata_tags.add_argument(
+        "--output",
+        default=config.wikidata_tag_index_path or "cache/wikidata_tags.json",
+        help="where to write the index",
+    )
+    route_names = subparsers.add_parser(
+        "route-names",
+        help="collect the names of hiking routes for the bulk label matcher",
+    )
+    source = route_names.add_mutually_exclusive_group(required=True)
+    source.add_argument("--extract", help="path to a .osm or .osm.bz2 extract")
+    source.add_argument(
+        "--from-store",
+        action="store_true",
+        help="use the relations in the local relation store",
+    )
+    route_names.add_argument(
+        "--output",
+        default=config.route_name_corpus_path or "cache/route_names.json",
+        help="where to write the corpus",
+    )
+    route_locations = subparsers.add_parser(
+        "route-locations",
+        help="collect the bounding boxes of hiking routes to drop far candidates",
+    )
+    route_locations.add_argument("extract", help="path to a .osm or .osm.bz2 extract")
+    route_locations.add_argument(
+        "--output",
+        default=config.route_location_index_path or "cache/route_locations.json",
+        help="where to write the index",
+    )
+    args = parser.parse_args()
+    if args.command == "relations":
+        count = OsmRelationIndex.build_from_extract(
+            args.extract, args.output, only_routes=not args.all
+        )
+        console.print(f"Indexed {count} relations in {args.output}")
+    elif args.command == "wikidata-tags":
+        if args.extract:
+            index = WikidataTagIndex.build_from_extract(args.extract)
+        else:
+            store = default_relation_store()
+            if not store:
+                raise SystemExit("config.relation_store_path is not set")
+            index = WikidataTagIndex.build_from_relations(store.iter_relations())
+        index.save(args.output)
+        console.print(f"Indexed {len(index)} QIDs in {args.output}")
+    elif args.command == "route-names":
+        if args.extract:
+            corpus = RouteNameCorpus.build_from_extract(args.extract)
+        else:
+            store = default_relation_store()
+            if not store:
+                raise SystemExit("config.relation_store_path is not set")
+            corpus = RouteNameCorpus.build_from_relations(store.iter_relations())
+        corpus.save(args.output)
+        console.print(f"Collected {len(corpus)} route names in {args.output}")
+    elif args.command == "route-locations":
+        locations = RouteLocationIndex.build_from_extract(args.extract)
+        locations.save(args.output)
+        console.print(f"Located {len(locations)} routes in {args.output}")
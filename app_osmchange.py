@@ -1,3 +1,4 @@
+import argparse
 import logging
 
 from OSMPythonTools.api import Api  # noqa: F401 - ensures dep loaded
@@ -8,5 +9,44 @@ from src.models.generate_osmchange import OsmChangeGenerator
 logging.basicConfig(level=config.loglevel)
 
 if __name__ == "__main__":
-    gen = OsmChangeGenerator()
+    parser = argparse.ArgumentParser(
+        description="Generate an osmChange file adding missing wikidata tags"
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=config.osm_workers,
+        help="number of threads fetching relations from the OSM API",
+    )
+    parser.add_argument(
+        "--processes",
+        type=int,
+        default=config.osm_processes,
+        help="number of processes examining ranges of the relations in parallel, "
+        "each with its own fetching threads",
+    )
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="only examine relations that are new or changed since the last run",
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="continue an interrupted run from its journal",
+    )
+    parser.add_argument(
+        "--extract",
+        default=config.osm_extract_path,
+        help="read relations from a local .osm or .osm.bz2 extract "
+        "instead of the OSM API",
+    )
+    args = parser.parse_args()
+    gen = OsmChangeGenerator(
+        workers=args.workers,
+        processes=args.processes,
+        incremental=args.incremental,
+        resume=args.resume,
+        extract_path=args.extract,
+    )
     gen.generate()
@@ -0,0 +1,74 @@
+"""Memory and throughput of the queue and candidate records.
+
+Compares holding a TrailItem per due item with DueItem and parsing
+every search result into a WaymarkedResult with WaymarkedCandidate.
+Run with: python -m benchmarks.compact_records 10000 100000"""
+
+import argparse
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from typing import Callable
+
+from wikibaseintegrator import WikibaseIntegrator  # type: ignore
+
+from src.console import console
+from src.models.due_item import DueItem
+from src.models.trail_item import TrailItem
+from src.models.waymarked_candidate import WaymarkedCandidate
+from src.models.waymarked_result import WaymarkedResult
+
+
+def measure(build: Callable[[], object]) -> tuple[float, float]:
+    """Seconds and peak MiB needed to build and hold the records"""
+    tracemalloc.start()
+    start = time.perf_counter()
+    records = build()
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del records
+    return elapsed, peak / 2**20
+
+
+def run(count: int) -> None:
+    wbi = WikibaseIntegrator()
+    last_update = datetime(2023, 6, 23, tzinfo=timezone.utc)
+    qids = [f"Q{number}" for number in range(count)]
+    results = {
+        "results": [
+            {
+                "id": number,
+                "name": f"Leden {number}",
+                "group": "LOC",
+                "ref": str(number % 100),
+                "itinerary": ["Falerum", "Åtvidaberg"],
+            }
+            for number in range(count)
+        ]
+    }
+    cases = {
+        "TrailItem": lambda: [
+            TrailItem(qid=qid, wbi=wbi, last_update=last_update) for qid in qids
+        ],
+        "DueItem": lambda: [DueItem(qid=qid, last_update=last_update) for qid in qids],
+        "WaymarkedResult": lambda: [
+            WaymarkedResult(**result) for result in results["results"]
+        ],
+        "WaymarkedCandidate": lambda: WaymarkedCandidate.parse_results(results),
+    }
+    for name, build in cases.items():
+        elapsed, peak = measure(build)
+        console.print(
+            f"{count} x {name}: {count / elapsed:,.0f} records/s, "
+            f"peak {peak:,.1f} MiB"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "counts", nargs="*", type=int, default=[10_000, 100_000], help="record counts"
+    )
+    for count in parser.parse_args().counts:
+        run(count)
@@ -17,6 +17,12 @@ debug_json = getenv("DEBUG_JSON", "false").lower() == "true"
 validate_before_upload = getenv("VALIDATE_BEFORE_UPLOAD", "true").lower() == "true"
 upload_to_wikidata = getenv("UPLOAD_TO_WIKIDATA", "true").lower() == "true"
 request_timeout = int(getenv("REQUEST_TIMEOUT", "10"))
+connect_timeout: float = float(getenv("CONNECT_TIMEOUT", "5"))
+# Retries with exponential backoff on connection errors and 429/5xx answers
+http_retries: int = int(getenv("HTTP_RETRIES", "3"))
+http_backoff_factor: float = float(getenv("HTTP_BACKOFF_FACTOR", "0.5"))
+# Kept-alive connections per host in the shared HTTP transport
+http_pool_size: int = int(getenv("HTTP_POOL_SIZE", "10"))
 user_agent = (
     f"hiking_trail_matcher, "
     f"see https://github.com/dpriskorn/hiking_trail_matcher/ "
@@ -27,8 +33,84 @@ language_code = getenv("LANGUAGE_CODE", "sv")
 country_qid = getenv("COUNTRY_QID", "Q34")
 
 max_days_between_new_check: int = int(getenv("MAX_DAYS_BETWEEN_NEW_CHECK", "182"))
+# Due items fetched from WDQS per query, 0 fetches them all at once
+wdqs_page_size: int = int(getenv("WDQS_PAGE_SIZE", "10000"))
 min_similarity: float = float(getenv("MIN_SIMILARITY", "0.8"))
 
+# Number of relations fetched per OSM API multi-fetch request
+osm_batch_size: int = int(getenv("OSM_BATCH_SIZE", "100"))
+# Number of threads fetching from the OSM API, 1 means serial
+osm_workers: int = int(getenv("OSM_WORKERS", "1"))
+# Fetched chunks allowed to wait for classification in concurrent mode
+osm_queue_size: int = int(getenv("OSM_QUEUE_SIZE", "4"))
+# Processes examining ranges of the relations in parallel, 1 means one process
+osm_processes: int = int(getenv("OSM_PROCESSES", "1"))
+# Incremental runs examine relations again when their outcome is older than this
+osm_snapshot_max_age_days: float = float(getenv("OSM_SNAPSHOT_MAX_AGE_DAYS", "30"))
+# Shared limit for all threads talking to the same host
+requests_per_second_per_host: float = float(
+    getenv("REQUESTS_PER_SECOND_PER_HOST", "2.0")
+)
+# Concurrent requests to one host when fetching details of WT candidates
+max_requests_per_host: int = int(getenv("MAX_REQUESTS_PER_HOST", "4"))
+# Only the best candidates get their details fetched before prompting
+max_detailed_candidates: int = int(getenv("MAX_DETAILED_CANDIDATES", "5"))
+
+# Local store of OSM relations, set the path to "" to always use the API
+relation_store_path = getenv("RELATION_STORE_PATH", "cache/osm_relations.sqlite")
+relation_store_ttl_days: float = float(getenv("RELATION_STORE_TTL_DAYS", "7"))
+relation_store_max_entries: int = int(getenv("RELATION_STORE_MAX_ENTRIES", "200000"))
+
+# Local .osm/.osm.bz2 extract to generate osmChange files from instead of the API
+osm_extract_path = getenv("OSM_EXTRACT_PATH", "")
+# Relation index built from an extract with app_index.py, used before the API
+relation_index_path = getenv("RELATION_INDEX_PATH", "")
+# QID to OSM objects index built with app_index.py, replaces OSM Wikidata Link
+wikidata_tag_index_path = getenv("WIKIDATA_TAG_INDEX_PATH", "")
+
+# On-disk cache of Waymarked Trails search and details responses,
+# set the path to "" or HTTP_CACHE_BYPASS=true to always ask the API
+http_cache_path = getenv("HTTP_CACHE_PATH", "cache/http.sqlite")
+http_cache_max_mb: float = float(getenv("HTTP_CACHE_MAX_MB", "200"))
+http_cache_bypass = getenv("HTTP_CACHE_BYPASS", "false").lower() == "true"
+waymarked_search_ttl_hours: float = float(getenv("WAYMARKED_SEARCH_TTL_HOURS", "24"))
+waymarked_details_ttl_days: float = float(getenv("WAYMARKED_DETAILS_TTL_DAYS", "7"))
+
+# Edits are saved to Wikidata in the background from this queue,
+# set the path to "" to save every edit before moving on
+wikidata_write_queue_path = getenv(
+    "WIKIDATA_WRITE_QUEUE_PATH", "output/wikidata-write-queue.sqlite"
+)
+wikidata_edits_per_minute: float = float(getenv("WIKIDATA_EDITS_PER_MINUTE", "30"))
+# Attempts before an edit is reported as failed and left for the next session
+wikidata_write_attempts: int = int(getenv("WIKIDATA_WRITE_ATTEMPTS", "5"))
+wikidata_maxlag: int = int(getenv("WIKIDATA_MAXLAG", "5"))
+
+# Route names from an extract built with app_index.py, used by "app.py match"
+route_name_corpus_path = getenv("ROUTE_NAME_CORPUS_PATH", "cache/route_names.json")
+# Candidates kept per item by the bulk matcher and its processes, -1 is all cores
+matcher_top_k: int = int(getenv("MATCHER_TOP_K", "5"))
+matcher_workers: int = int(getenv("MATCHER_WORKERS", "-1"))
+
+# Bounding boxes of the routes in an extract built with app_index.py.
+# Candidates farther than candidate_radius_km from the coordinates of the item
+# are dropped before fetching their details, 0 disables this
+route_location_index_path = getenv(
+    "ROUTE_LOCATION_INDEX_PATH", "cache/route_locations.json"
+)
+candidate_radius_km: float = float(getenv("CANDIDATE_RADIUS_KM", "50"))
+
+# Items fetched per wbgetentities request, the API allows at most 50
+wikidata_prefetch_batch_size: int = int(getenv("WIKIDATA_PREFETCH_BATCH_SIZE", "50"))
+# Threads preparing items in the headless prepare mode
+prepare_workers: int = int(getenv("PREPARE_WORKERS", "4"))
+# Processes running the shards of "app.py prepare/match --shards" in parallel
+shard_workers: int = int(getenv("SHARD_WORKERS", "4"))
+# Per-phase latency, byte and error metrics of every run are appended here
+run_metrics_path: str = getenv("RUN_METRICS_PATH", "RUNLOG-metrics.jsonl")
+# Items prepared in the background while the current one is on screen, 0 disables
+lookahead_depth: int = int(getenv("LOOKAHEAD_DEPTH", "3"))
+
 EXCLUDED_TERM_WORDS = {
     "roundtrip",
     "rundslinga",
@@ -9,6 +9,10 @@ debug_json = False
 validate_before_upload = True
 upload_to_wikidata = True
 request_timeout = 10
+connect_timeout = 5
+http_retries = 3
+http_backoff_factor = 0.5
+http_pool_size = 10
 user_agent = (
     f"hiking_trail_matcher, "
     f"see https://github.com/dpriskorn/hiking_trail_matcher/ "
@@ -19,7 +23,52 @@ language_code = "sv"
 country_qid = "Q34"
 
 max_days_between_new_check: int = int(365 * 0.5)
+wdqs_page_size = 10000
 min_similarity: float = 0.8
+
+# Number of relations fetched per OSM API multi-fetch request
+osm_batch_size: int = 100
+# Number of threads fetching from the OSM API, 1 means serial
+osm_workers: int = 1
+# Fetched chunks allowed to wait for classification in concurrent mode
+osm_queue_size: int = 4
+osm_processes: int = 1
+osm_snapshot_max_age_days: float = 30
+# Shared limit for all threads talking to the same host
+requests_per_second_per_host: float = 2.0
+max_requests_per_host: int = 4
+max_detailed_candidates: int = 5
+
+# Local store of OSM relations, set the path to "" to always use the API
+relation_store_path = "cache/osm_relations.sqlite"
+relation_store_ttl_days: float = 7
+relation_store_max_entries: int = 200_000
+
+# Local .osm/.osm.bz2 extract to generate osmChange files from instead of the API
+osm_extract_path = ""
+# Relation index built from an extract with app_index.py, used before the API
+relation_index_path = ""
+# QID to OSM objects index built with app_index.py, replaces OSM Wikidata Link
+wikidata_tag_index_path = ""
+http_cache_path = "cache/http.sqlite"
+http_cache_max_mb = 200
+http_cache_bypass = False
+waymarked_search_ttl_hours = 24
+waymarked_details_ttl_days = 7
+wikidata_write_queue_path = "output/wikidata-write-queue.sqlite"
+wikidata_edits_per_minute = 30
+wikidata_write_attempts = 5
+wikidata_maxlag = 5
+route_name_corpus_path = "cache/route_names.json"
+matcher_top_k = 5
+matcher_workers = -1
+route_location_index_path = "cache/route_locations.json"
+candidate_radius_km = 50
+wikidata_prefetch_batch_size = 50
+lookahead_depth = 3
+prepare_workers = 4
+shard_workers = 4
+run_metrics_path = "RUNLOG-metrics.jsonl"
 EXCLUDED_TERM_WORDS = {
     "roundtrip",
     "rundslinga",
@@ -9,6 +9,9 @@ class Property(Enum):
     NOT_FOUND_IN = "P9660"
     LAST_UPDATE = "P5017"
     BASED_ON_HEURISTIC = "P887"
+    OSM_WAY_ID = "P10689"
+    NATURKARTAN_ID = "P10467"
+    COORDINATE_LOCATION = "P625"
 
 
 class ItemEnum(Enum):
@@ -25,3 +28,16 @@ class OsmIdSource(Enum):
 class Status(Enum):
     ACCEPTED = auto()
     DECLINED = auto()
+
+
+class Phase(Enum):
+    """The operations of a run we measure"""
+
+    SPARQL_QUERY = "sparql_query"
+    ENTITY_FETCH = "entity_fetch"
+    OSM_WIKIDATA_LINK = "osm_wikidata_link"
+    WT_SEARCH = "wt_search"
+    WT_DETAILS = "wt_details"
+    OSM_TAG_LOOKUP = "osm_tag_lookup"
+    WIKIDATA_WRITE = "wikidata_write"
+    THINK_TIME = "think_time"
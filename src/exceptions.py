@@ -20,3 +20,7 @@ class WBIError(BaseException):
 
 class QidException(BaseException):
     pass
+
+
+class UnfinishedQueueError(BaseException):
+    pass
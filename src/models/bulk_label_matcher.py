@@ -0,0 +1,101 @@
+import logging
+from typing import Dict, List, Tuple
+
+from pydantic import BaseModel
+from rapidfuzz import fuzz, process
+
+import config
+from src.models.route_name_corpus import RouteNameCorpus
+from src.models.trail_item import TrailItem
+
+logger = logging.getLogger(__name__)
+
+
+class LabelMatch(BaseModel):
+    osm_id: int
+    name: str
+    # Same scale as config.min_similarity
+    similarity: float
+
+
+class BulkLabelMatcher:
+    """Matches many labels against the route name corpus in one pass.
+
+    Names are cleaned like in TrailItem and only compared with labels they
+    share a token with. Labels with the same candidates are scored together
+    in blocks of up to block_size with rapidfuzz.process.cdist on all cores,
+    so every label is only compared with its own candidates."""
+
+    def __init__(
+        self,
+        corpus: RouteNameCorpus,
+        block_size: int = 256,
+        workers: int = config.matcher_workers,
+    ):
+        self.corpus = corpus
+        self.block_size = block_size
+        self.workers = workers
+        # Label and name pairs scored by the last match()
+        self.comparisons = 0
+        self.clean_names = [TrailItem.__clean_name__(name) for _, name in corpus.names]
+        self.postings: Dict[str, List[int]] = {}
+        for position, clean_name in enumerate(self.clean_names):
+            for token in set(clean_name.split()):
+                self.postings.setdefault(token, []).append(position)
+
+    def __candidates__(self, clean_label: str) -> set[int]:
+        candidates: set[int] = set()
+        for token in set(clean_label.split()):
+            candidates.update(self.postings.get(token, []))
+        return candidates
+
+    def match(
+        self,
+        labels: Dict[str, str],
+        top_k: int = config.matcher_top_k,
+        min_similarity: float = config.min_similarity,
+    ) -> Dict[str, List[LabelMatch]]:
+        """Return the top_k names with at least min_similarity for each
+        QID in labels, best first"""
+        qids = list(labels)
+        clean_labels = [TrailItem.__clean_name__(labels[qid]) for qid in qids]
+        results: Dict[str, List[LabelMatch]] = {qid: [] for qid in qids}
+        groups: Dict[Tuple[int, ...], List[int]] = {}
+        for row, clean_label in enumerate(clean_labels):
+            candidates = tuple(sorted(self.__candidates__(clean_label)))
+            if candidates:
+                groups.setdefault(candidates, []).append(row)
+        self.comparisons = 0
+        for candidates, rows in groups.items():
+            names = [self.clean_names[position] for position in candidates]
+            for start in range(0, len(rows), self.block_size):
+                block = rows[start : start + self.block_size]
+                self.comparisons += len(block) * len(candidates)
+                scores = process.cdist(
+                    [clean_labels[row] for row in block],
+                    names,
+                    scorer=fuzz.token_sort_ratio,
+                    score_cutoff=min_similarity * 100,
+                    # Threads only pay off for several labels
+                    workers=self.workers if len(block) > 1 else 1,
+                )
+                for row, row_scores in zip(block, scores):
+                    matches = [
+                        (float(score), position)
+                        for score, position in zip(row_scores, candidates)
+                        if score > 0
+                    ]
+                    matches.sort(key=lambda match: (-match[0], match[1]))
+                    results[qids[row]] = [
+                        LabelMatch(
+                            osm_id=self.corpus.names[position][0],
+                            name=self.corpus.names[position][1],
+                            similarity=score / 100,
+                        )
+                        for score, position in matches[:top_k]
+                    ]
+        logger.info(
+            f"Made {self.comparisons} comparisons for {len(qids)} labels "
+            f"instead of {len(qids) * len(self.corpus)}"
+        )
+        return results
@@ -0,0 +1,34 @@
+from datetime import datetime
+
+from wikibaseintegrator import WikibaseIntegrator  # type: ignore
+
+from src.models.trail_item import TrailItem
+from src.models.wikidata_write_queue import WikidataWriteQueue
+
+
+class DueItem:
+    """A trail from WDQS waiting to be worked on.
+
+    Only the QID and last update are kept until the item is reached,
+    the TrailItem with its entity and candidates is built then and
+    released when the item is done."""
+
+    __slots__ = ("qid", "last_update")
+
+    def __init__(self, qid: str, last_update: datetime | None = None):
+        self.qid = qid
+        self.last_update = last_update
+
+    @property
+    def is_due(self) -> bool:
+        return TrailItem.is_due(last_update=self.last_update)
+
+    def to_trail_item(
+        self, wbi: WikibaseIntegrator, write_queue: WikidataWriteQueue | None = None
+    ) -> TrailItem:
+        return TrailItem(
+            qid=self.qid,
+            wbi=wbi,
+            last_update=self.last_update,
+            write_queue=write_queue,
+        )
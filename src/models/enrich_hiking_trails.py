@@ -1,18 +1,35 @@
+import json
 import logging
-from datetime import date, datetime
-from typing import Any, Dict
+import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta, timezone
+from itertools import islice
+from typing import Any, ClassVar, Deque, Dict, Iterator
 
+import requests
 from pydantic import validate_arguments
-from wikibaseintegrator import WikibaseIntegrator  # type: ignore
-from wikibaseintegrator.wbi_helpers import execute_sparql_query  # type: ignore
+from wikibaseintegrator import WikibaseIntegrator, wbi_config  # type: ignore
+from wikibaseintegrator.entities import ItemEntity  # type: ignore
+from wikibaseintegrator.wbi_helpers import mediawiki_api_call_helper  # type: ignore
 from wikibaseintegrator.wbi_login import Login  # type: ignore
 
 import config
 from src.console import console
-from src.enums import OsmIdSource, Status
+from src.enums import OsmIdSource, Phase, Property, Status
 from src.exceptions import MissingInformationError, NoItemError
+from src.models.bulk_label_matcher import BulkLabelMatcher
+from src.models.due_item import DueItem
+from src.models.http_cache import http_cache
+from src.models.http_transport import transport
 from src.models.project_base_model import ProjectBaseModel
+from src.models.review_queue import ReviewQueue, ReviewQueueEntry
+from src.models.route_name_corpus import RouteNameCorpus
+from src.models.run_metrics import run_metrics
+from src.models.sparql_binding_stream import BackgroundBindingReader
 from src.models.trail_item import TrailItem
+from src.models.trail_item_prefetcher import TrailItemPrefetcher
+from src.models.wikidata_write_queue import WikidataWriteQueue
 
 logging.basicConfig(level=config.loglevel)
 logger = logging.getLogger(__name__)
@@ -21,83 +38,150 @@ logger = logging.getLogger(__name__)
 class EnrichHikingTrails(ProjectBaseModel):
     rdf_entity_prefix = "http://www.wikidata.org/entity/"
     wbi: WikibaseIntegrator | None = None
-    items: list[TrailItem] = list()
-    sparql_result: Any = dict()
     matched_count: int = 0
+    due_count: int = 0
+    skipped_count: int = 0
+    write_queue: WikidataWriteQueue | None = None
+    # Write the edits that failed in an earlier session again
+    retry_failed_edits: bool = False
+    prefetch_batch_size: int = min(config.wikidata_prefetch_batch_size, 50)
+    # The only properties TrailItem looks at
+    used_properties: ClassVar[set[str]] = {
+        Property.OSM_RELATION_ID.value,
+        Property.NOT_FOUND_IN.value,
+        Property.OSM_WAY_ID.value,
+        Property.NATURKARTAN_ID.value,
+        Property.COORDINATE_LOCATION.value,
+    }
 
     class Config:
         arbitrary_types_allowed = True
 
-    def __get_hiking_trails_missing_osm_id__(self) -> None:
-        """Fetch hiking trails missing OSM ID and populate TrailItem objects"""
-        # with console.status("Getting hiking paths from WDQS"):
-        self.__get_sparql_result__()
-        self.__extract_items_from_sparql__()
-
-    def __extract_items_from_sparql__(self) -> None:
-        """Create TrailItem objects from SPARQL results including last_update"""
-        if self.sparql_result:
-            for binding in self.sparql_result["results"]["bindings"]:
-                # pprint(binding)
-                qid = self.__extract_wcdqs_json_entity_id__(data=binding)
-                # Extract last_update if present
-                last_update_str = binding.get("lastUpdate", {}).get("value")
-                logger.debug(f"got last update string: {last_update_str}")
-                last_update = None
-                if last_update_str:
-                    try:
-                        last_update = datetime.fromisoformat(last_update_str)
-                    except ValueError:
-                        raise Exception(
-                            f"Failed to parse last_update for {qid}: {last_update_str}"
-                        )
-                trail_item = TrailItem(qid=qid, wbi=self.wbi, last_update=last_update)
-                # pprint(trail_item)
-                # input("press enter to cont")
-                self.items.append(trail_item)
-        print(f"Got {len(self.items)} TrailItems from WDQS")
-        # exit(0)
-
-    @property
-    def number_of_items(self) -> int:
-        return len(self.items)
-
-    def __iterate_items__(self):
-        logger.debug("__iterate_items__: running")
-        for count, trail_item in enumerate(self.items, start=1):
-            console.print(f"Working on {count}/{self.number_of_items}")
-            if trail_item.time_to_check_again():
-                logger.debug("It's time to check")
-                trail_item = self.__lookup_in_osm_wikidata_link__(trail_item=trail_item)
-                if (
-                    trail_item.osm_wikidata_link_match_prompt_return == Status.DECLINED
-                    or trail_item.osm_wikidata_link_return.no_match is True
-                ):
-                    logger.info("Falling back to Waymarked Trails API")
-                    self.__lookup_in_waymarked_trails__(trail_item=trail_item)
+    def __iter_due_items__(self) -> Iterator[DueItem]:
+        """Yield every hiking trail missing an OSM ID that is due
+        for a check, while the SPARQL result is still arriving"""
+        self.due_count = self.skipped_count = 0
+        for binding in self.__iter_sparql_bindings__():
+            due_item = self.__due_item_from_binding__(binding=binding)
+            if due_item.is_due:
+                self.due_count += 1
+                yield due_item
             else:
+                self.skipped_count += 1
                 logger.info(
                     f"Skipping item with recent last update statement, "
-                    f"see {trail_item.qid}"
+                    f"see {due_item.qid}"
+                )
+        console.print(
+            f"Got {self.due_count} due items from WDQS, "
+            f"skipped {self.skipped_count} checked recently"
+        )
+
+    def __iter_due_trail_items__(self) -> Iterator[TrailItem]:
+        for due_item in self.__iter_due_items__():
+            yield due_item.to_trail_item(wbi=self.wbi, write_queue=self.write_queue)
+
+    def __iter_due_batches__(self) -> Iterator[list[TrailItem]]:
+        """Due items in batches with their entities prefetched"""
+        trail_items = self.__iter_due_trail_items__()
+        while batch := list(islice(trail_items, self.prefetch_batch_size)):
+            self.__prefetch_item_entities__(items=batch)
+            yield batch
+
+    def __due_item_from_binding__(self, binding: Dict) -> DueItem:
+        """Create a DueItem from a SPARQL binding including last_update"""
+        qid = self.__extract_wcdqs_json_entity_id__(data=binding)
+        last_update_str = binding.get("lastUpdate", {}).get("value")
+        logger.debug(f"got last update string: {last_update_str}")
+        last_update = None
+        if last_update_str:
+            try:
+                last_update = datetime.fromisoformat(last_update_str)
+            except ValueError:
+                raise Exception(
+                    f"Failed to parse last_update for {qid}: {last_update_str}"
                 )
+        return DueItem(qid=qid, last_update=last_update)
+
+    def __iterate_items__(self):
+        """Review the due items as they arrive. The stream is read ahead
+        only as far as the entity batch and the lookahead need."""
+        logger.debug("__iterate_items__: running")
+        prefetcher = TrailItemPrefetcher(lookahead=config.lookahead_depth)
+        pending: Deque[TrailItem] = deque()
+        due_items = self.__iter_due_trail_items__()
+        count = 0
+        try:
+            while True:
+                self.__read_ahead__(pending, due_items, prefetcher.lookahead + 1)
+                if not pending:
+                    break
+                trail_item = pending.popleft()
+                count += 1
+                console.print(f"Working on due item {count}")
+                prefetcher.wait(trail_item)
+                upcoming = [trail_item, *list(pending)[: prefetcher.lookahead]]
+                if any(not upcoming_item.item for upcoming_item in upcoming):
+                    # Fetch a whole batch of entities here so the background
+                    # thread does not have to get them one by one. Scheduled
+                    # items belong to that thread until we wait for them.
+                    self.__read_ahead__(
+                        pending, due_items, self.prefetch_batch_size - 1
+                    )
+                    self.__prefetch_item_entities__(
+                        items=[
+                            trail_item,
+                            *(
+                                pending_item
+                                for pending_item in pending
+                                if not prefetcher.is_scheduled(pending_item)
+                            ),
+                        ]
+                    )
+                for upcoming_item in upcoming[1:]:
+                    prefetcher.schedule(upcoming_item)
+                self.__review_item__(trail_item=trail_item)
+                trail_item.release()
+        finally:
+            prefetcher.close()
         logger.debug("Finished iterating over items")
 
-    # def __get_hiking_trails_missing_osm_id__(self) -> None:
-    #     with console.status("Getting hiking paths from WDQS"):
-    #         self.__get_sparql_result__()
-    #         # if config.loglevel == logging.DEBUG:
-    #         #     console.print(result)
-    #         self.__extract_item_ids__()
+    @staticmethod
+    def __read_ahead__(
+        pending: Deque[TrailItem], due_items: Iterator[TrailItem], size: int
+    ) -> None:
+        while len(pending) < size:
+            trail_item = next(due_items, None)
+            if trail_item is None:
+                return
+            pending.append(trail_item)
+
+    def __review_item__(self, trail_item: TrailItem) -> None:
+        trail_item = self.__lookup_in_osm_wikidata_link__(trail_item=trail_item)
+        if (
+            trail_item.osm_wikidata_link_match_prompt_return == Status.DECLINED
+            or trail_item.osm_wikidata_link_return.no_match is True
+        ):
+            logger.info("Falling back to Waymarked Trails API")
+            self.__lookup_in_waymarked_trails__(trail_item=trail_item)
 
-    def __get_sparql_result__(self):
-        """Get all hiking trails and subtrails in the specified country and
-        with labels in the specified language"""
-        self.setup_wbi()
-        # Support all subclasses of Q2143825 hiking trail
-        # minus paths that already have a link to OSM relation
-        # minus discontinued hiking paths
-        self.sparql_result = execute_sparql_query(
-            f"""
+    @classmethod
+    def __sparql_query__(
+        cls, cutoff: datetime, after: Dict[str, Any] | None = None, limit: int = 0
+    ) -> str:
+        """All hiking trails and subtrails in the specified country
+        that were not checked since cutoff, oldest check first.
+        Support all subclasses of Q2143825 hiking trail
+        minus paths that already have a link to OSM relation
+        minus discontinued hiking paths
+
+        Unbound ?lastUpdate sorts first. The pages continue after the
+        last binding of the previous page instead of using OFFSET because
+        items we match meanwhile drop out of the result."""
+        cutoff_literal = cls.__datetime_literal__(cutoff.strftime("%Y-%m-%dT%H:%M:%SZ"))
+        page_filter = cls.__page_filter__(after) if after else ""
+        limit_clause = f"LIMIT {limit}" if limit else ""
+        return f"""
             SELECT distinct ?item ?lastUpdate WHERE {{
               ?item wdt:P31/wdt:P279* wd:Q2143825;
                     wdt:P17 wd:{config.country_qid}.
@@ -110,10 +194,111 @@ class EnrichHikingTrails(ProjectBaseModel):
                 ?statement ps:P9660 wd:Q936.      # must be OpenStreetMap
                 ?statement pq:P5017 ?lastUpdate.  # qualifier date
               }}
+              FILTER(!BOUND(?lastUpdate) || ?lastUpdate < {cutoff_literal})
+              {page_filter}
             }}
+            ORDER BY ?lastUpdate STR(?item)
+            {limit_clause}
             """
+
+    @staticmethod
+    def __datetime_literal__(value: str) -> str:
+        return f'"{value}"^^<http://www.w3.org/2001/XMLSchema#dateTime>'
+
+    @classmethod
+    def __page_filter__(cls, after: Dict[str, Any]) -> str:
+        item = json.dumps(after["item"]["value"])
+        last_update = after.get("lastUpdate", {}).get("value")
+        if not last_update:
+            return f"FILTER(BOUND(?lastUpdate) || STR(?item) > {item})"
+        literal = cls.__datetime_literal__(last_update)
+        return (
+            f"FILTER(BOUND(?lastUpdate) && (?lastUpdate > {literal} || "
+            f"(?lastUpdate = {literal} && STR(?item) > {item})))"
+        )
+
+    def __iter_sparql_bindings__(self) -> Iterator[Dict[str, Any]]:
+        """Stream the bindings of the due items from WDQS page by page
+        instead of loading the whole result. Each page is read in the
+        background so the response is not left open while we review"""
+        self.setup_wbi()
+        cutoff = datetime.now(tz=timezone.utc) - timedelta(
+            days=config.max_days_between_new_check
+        )
+        page_size = config.wdqs_page_size
+        after = None
+        while True:
+            count = 0
+            query = self.__sparql_query__(cutoff=cutoff, after=after, limit=page_size)
+            chunks = run_metrics.stream(Phase.SPARQL_QUERY, self.__query_wdqs__(query))
+            for binding in BackgroundBindingReader(chunks):
+                count += 1
+                after = binding
+                yield binding
+            if not page_size or count < page_size:
+                return
+            logger.info(f"Fetching the next page of {page_size} items from WDQS")
+
+    @staticmethod
+    def __query_wdqs__(query: str) -> Iterator[str]:
+        return transport.stream(
+            wbi_config.config["SPARQL_ENDPOINT_URL"],
+            params={"query": query},
+            headers={"Accept": "application/sparql-results+json"},
+            # WDQS answers when the query is done, after up to 60s
+            timeout=(config.connect_timeout, max(config.request_timeout, 65)),
         )
 
+    def __prefetch_item_entities__(self, items: list[TrailItem]) -> None:
+        """Fetch the entities of the given due items in one wbgetentities
+        request, only with the label and description in our language.
+
+        The API cannot filter claims by property so we drop the ones
+        we do not use before building the ItemEntity objects. That is safe
+        when writing because edits without clear=True leave claims
+        missing from the data untouched."""
+        batch = []
+        for trail_item in items:
+            if not trail_item.item:
+                batch.append(trail_item)
+                if len(batch) == self.prefetch_batch_size:
+                    break
+        if not batch:
+            return
+        logger.info(f"Prefetching {len(batch)} items from Wikidata")
+        entities = self.__get_entities__([trail_item.qid for trail_item in batch])
+        for trail_item in batch:
+            data = entities.get(trail_item.qid)
+            if data and "missing" not in data:
+                trail_item.entity_json = self.__filter_entity_json__(data)
+                trail_item.item = ItemEntity(api=self.wbi).from_json(
+                    trail_item.entity_json
+                )
+
+    def __get_entities__(self, qids: list[str]) -> Dict[str, Any]:
+        with run_metrics.measure(Phase.ENTITY_FETCH):
+            result = mediawiki_api_call_helper(
+                data={
+                    "action": "wbgetentities",
+                    "ids": "|".join(qids),
+                    "props": "info|labels|descriptions|claims",
+                    "languages": config.language_code,
+                    "format": "json",
+                },
+                login=self.wbi.login if self.wbi else None,
+                allow_anonymous=True,
+            )
+        return dict(result.get("entities", {}))
+
+    def __filter_entity_json__(self, data: Dict[str, Any]) -> Dict[str, Any]:
+        claims = data.get("claims", {})
+        data["claims"] = {
+            property_: claim
+            for property_, claim in claims.items()
+            if property_ in self.used_properties
+        }
+        return data
+
     @validate_arguments
     def __extract_wcdqs_json_entity_id__(
         self, data: Dict, sparql_variable: str = "item"
@@ -140,9 +325,106 @@ class EnrichHikingTrails(ProjectBaseModel):
         # We set up WBI once here and reuse it for every TrailItem
         self.setup_wbi()
         self.__login_to_wikidata__()
-        self.__get_hiking_trails_missing_osm_id__()
-        self.__iterate_items__()
+        self.__start_write_queue__()
+        try:
+            self.__iterate_items__()
+        except (requests.RequestException, ValueError) as e:
+            # WDQS dropped the connection or cut the result short. We still
+            # save the queued edits and log the matches of this session.
+            console.print(f"Stopping because reading the due items failed: {e}")
+        self.__stop_write_queue__()
+        self.__add_to_runlog__()
+        transport.log_stats()
+        http_cache.log_stats()
+
+    def prepare_review_queue(self, queue: ReviewQueue) -> int:
+        """Do the network work for every due item in parallel without
+        prompting and write the results to the review queue in order.
+        No login is needed because nothing is written to Wikidata."""
+        self.setup_wbi()
+        self.wbi = WikibaseIntegrator()
+        queue.start()
+        prepared_count = written = 0
+        try:
+            with ThreadPoolExecutor(max_workers=config.prepare_workers) as executor:
+                # Only one batch is held at a time
+                for batch in self.__iter_due_batches__():
+                    for trail_item, prepared in zip(
+                        batch, executor.map(self.__prepare_item__, batch)
+                    ):
+                        if prepared:
+                            queue.append(ReviewQueueEntry.from_trail_item(trail_item))
+                            written += 1
+                        trail_item.release()
+                    prepared_count += len(batch)
+                    console.print(f"Prepared {prepared_count} items")
+        finally:
+            queue.close()
+        console.print(f"Wrote {written} items to {queue.path}")
+        self.__add_to_runlog__(action="prepared", count=written)
+        transport.log_stats()
+        http_cache.log_stats()
+        return written
+
+    def match_labels_in_bulk(self, corpus: RouteNameCorpus, output_path: str) -> int:
+        """Match the labels of all due items against the local route name
+        corpus in one pass and write the top candidates of each item
+        to a JSON lines file"""
+        self.setup_wbi()
+        self.wbi = WikibaseIntegrator()
+        labels = {}
+        for batch in self.__iter_due_batches__():
+            for trail_item in batch:
+                if trail_item.item:
+                    trail_item.__get_item_details__()
+                    if trail_item.label:
+                        labels[trail_item.qid] = trail_item.label
+                trail_item.release()
+        console.print(f"Matching {len(labels)} labels against {len(corpus)} routes")
+        matches = BulkLabelMatcher(corpus=corpus).match(labels)
+        directory = os.path.dirname(output_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(output_path, "w", encoding="utf-8") as f:
+            for qid, label in labels.items():
+                entry = {
+                    "qid": qid,
+                    "label": label,
+                    "candidates": [match.dict() for match in matches[qid]],
+                }
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        matched = sum(1 for candidates in matches.values() if candidates)
+        console.print(f"Found candidates for {matched} items, see {output_path}")
+        self.__add_to_runlog__(action="found candidates for", count=matched)
+        return matched
+
+    @staticmethod
+    def __prepare_item__(trail_item: TrailItem) -> bool:
+        if not trail_item.entity_json:
+            logger.warning(f"Could not get {trail_item.qid} from Wikidata, skipping")
+            return False
+        try:
+            trail_item.prepare(complete=True)
+        except Exception as e:
+            logger.error(f"Could not prepare {trail_item.qid}: {e}")
+            return False
+        return True
+
+    def review_queue(self, queue: ReviewQueue) -> None:
+        """Prompt for every prepared item in the queue and write the
+        answers to Wikidata. Only the writes use the network."""
+        self.setup_wbi()
+        self.__login_to_wikidata__()
+        self.__start_write_queue__()
+        for count, entry in enumerate(queue, start=1):
+            console.print(f"Reviewing item {count} from the queue")
+            trail_item = entry.to_trail_item(wbi=self.wbi)
+            trail_item.write_queue = self.write_queue
+            self.__review_item__(trail_item=trail_item)
+            queue.mark_reviewed(entry.qid)
+        self.__stop_write_queue__()
         self.__add_to_runlog__()
+        transport.log_stats()
 
     @staticmethod
     def __lookup_in_osm_wikidata_link__(trail_item: TrailItem) -> TrailItem:
@@ -184,16 +466,47 @@ class EnrichHikingTrails(ProjectBaseModel):
         self.wbi = WikibaseIntegrator(
             login=Login(user=config.user_name, password=config.bot_password),
         )
+        transport.instrument(self.wbi.login.get_session())
         print(f"Successfully logged in to Wikidata as {config.user_name}")
 
-    def __add_to_runlog__(self):
+    def __start_write_queue__(self):
+        """Edits that are not saved when we stop, e.g. on Ctrl+C,
+        stay in the queue and are written in the next session"""
+        if config.upload_to_wikidata and config.wikidata_write_queue_path:
+            self.write_queue = WikidataWriteQueue(
+                path=config.wikidata_write_queue_path, wbi=self.wbi
+            )
+            if self.retry_failed_edits:
+                self.write_queue.retry_failed()
+            self.write_queue.start()
+
+    def __stop_write_queue__(self):
+        if self.write_queue:
+            self.write_queue.close()
+            self.write_queue = None
+
+    def __add_to_runlog__(self, action: str = "matched", count: int | None = None):
         """Append an entry like "* 2024-02-20 matched 1 trail"
-        to the file 'RUNLOG.md' using self.matched_count and the current date"""
+        to the file 'RUNLOG.md' using self.matched_count and the current date.
+        The headless modes log what they did with their own count.
+
+        The metrics of the run are shown and appended to
+        config.run_metrics_path next to it."""
+        if count is None:
+            count = self.matched_count
         today_str = date.today().isoformat()
-        entry = f"* {today_str} matched {self.matched_count} trail"
-        if self.matched_count != 1:
+        entry = f"* {today_str} {action} {count} trail"
+        if count != 1:
             entry += "s"
         entry += f" lang:{config.language_code} country:{config.country_qid}\n"
 
         with open("RUNLOG.md", "a", encoding="utf-8") as f:
             f.write(entry)
+        run_metrics.log_summary()
+        run_metrics.save(
+            config.run_metrics_path,
+            action=action,
+            count=count,
+            lang=config.language_code,
+            country=config.country_qid,
+        )
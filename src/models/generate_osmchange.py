@@ -1,38 +1,64 @@
+import csv
+import heapq
 import logging
 import os
+import queue
 import xml.etree.ElementTree as ET
-from datetime import date
-from typing import Any
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+from multiprocessing import get_context
+from typing import Any, ClassVar, Iterator
 
-from OSMPythonTools.api import Api
 from wikibaseintegrator.wbi_helpers import execute_sparql_query
 
 import config
 from src.console import console
+from src.enums import Phase
+from src.models.http_transport import transport
+from src.models.osm_extract_reader import OsmExtractReader
+from src.models.osm_relation import OSMRelation
+from src.models.osm_relation_lookup import OsmRelationLookup, relation_lookup
+from src.models.osmchange_journal import JournalEntry, JournalHeader, OsmChangeJournal
+from src.models.osmchange_shard import OsmChangeShard, OsmChangeShardResult
+from src.models.osmchange_snapshot import OsmChangeSnapshot
+from src.models.osmchange_writer import OsmChangeWriter
 from src.models.project_base_model import ProjectBaseModel
+from src.models.relation_outcome import RelationOutcome
+from src.models.run_metrics import run_metrics
+from src.models.worker_environment import per_host_limits, worker_environment
 
 logger = logging.getLogger(__name__)
 
 
-class OSMRelation:
-    def __init__(self, osm_id: int, version: int, tags: dict[str, str], members: list[tuple[str, int, str]]):
-        self.id = osm_id
-        self.version = version
-        self.tags = tags
-        self.members = members
-
-
 class OsmChangeGenerator(ProjectBaseModel):
     rdf_entity_prefix = "http://www.wikidata.org/entity/"
-    api = Api()
+    lookup: ClassVar[OsmRelationLookup] = relation_lookup
     output_path: str = ""
     mismatch_report_path: str = ""
+    # Only used when no writer is open, e.g. when classifying outside generate()
     modify_blocks: list = []
+    writer: OsmChangeWriter | None = None
     mismatches: list[tuple[int, str, str]] = []
     mismatch_count: int = 0
     examined_count: int = 0
     already_tagged_count: int = 0
     patched_count: int = 0
+    reused_count: int = 0
+    resumed_count: int = 0
+    # Outcome of every relation examined in this run, saved as the next snapshot
+    outcomes: dict[int, RelationOutcome] = {}
+    incremental: bool = False
+    snapshot_path: str = ""
+    resume: bool = False
+    journal_path: str = ""
+    journal: OsmChangeJournal | None = None
+    # Read relations from this local extract instead of the OSM API
+    extract_path: str = config.osm_extract_path
+    batch_size: int = config.osm_batch_size
+    workers: int = config.osm_workers
+    queue_size: int = config.osm_queue_size
+    # Worker processes examining contiguous ranges of the relations
+    processes: int = config.osm_processes
 
     class Config:
         arbitrary_types_allowed = True
@@ -43,73 +69,433 @@ class OsmChangeGenerator(ProjectBaseModel):
         today = date.today().isoformat()
         self.output_path = f"output/osmchange-{today}.osc"
         self.mismatch_report_path = f"output/osmchange-{today}-mismatches.csv"
+        self.snapshot_path = f"output/osmchange-snapshot-{config.country_qid}.json"
+        self.journal_path = f"output/osmchange-journal-{config.country_qid}.jsonl"
         os.makedirs("output", exist_ok=True)
         console.print(
             f"Generating osmChange for {len(items)} Swedish hiking trails "
             f"with P402 set"
         )
-        for item in items:
-            wd_qid = item["item"]["value"].replace(self.rdf_entity_prefix, "")
-            osm_id = int(item["osm"]["value"])
-            self.__process_relation__(wd_qid, osm_id)
-            if self.examined_count % 100 == 0:
-                console.print(f"Processed {self.examined_count}/{len(items)} relations...")
+        pairs = self.__extract_qid_and_osm_id__(items)
+        total = len(pairs)
+        if self.__sharded__:
+            if self.resume:
+                raise ValueError("resuming does not work with several processes")
+            if self.incremental:
+                # Kept in memory and merged with the shards in relation id order
+                pairs = self.__reuse_previous_outcomes__(pairs)
+            self.__generate_in_shards__(pairs)
+        else:
+            pairs = self.__start_or_resume_journal__(pairs)
+            if self.incremental:
+                pairs = self.__reuse_previous_outcomes__(pairs)
+            try:
+                self.__process_pairs__(pairs, total)
+            except BaseException:
+                # Network errors, Ctrl+C etc. Keep what we have and let it propagate
+                self.__flush_partial_results__()
+                raise
         self.__write_mismatch_report__()
         self.__write_osmchange__()
+        self.__save_snapshot__()
+        if self.journal:
+            self.journal.remove()
         summary = {
             "examined": self.examined_count,
             "already_tagged": self.already_tagged_count,
             "patched": self.patched_count,
             "mismatched": self.mismatch_count,
+            "reused": self.reused_count,
+            "resumed": self.resumed_count,
         }
         console.print(
             f"Done. Examined: {summary['examined']}, "
             f"already tagged: {summary['already_tagged']}, "
             f"patched: {summary['patched']}, "
-            f"mismatches: {summary['mismatched']}"
+            f"mismatches: {summary['mismatched']}, "
+            f"reused from last run: {summary['reused']}, "
+            f"resumed from journal: {summary['resumed']}"
+        )
+        transport.log_stats()
+        run_metrics.log_summary()
+        run_metrics.save(
+            config.run_metrics_path,
+            action="osmchange",
+            count=self.examined_count,
+            country=config.country_qid,
         )
         return summary
 
-    def __get_items_with_osm_id__(self) -> list[dict[str, Any]]:
-        result = execute_sparql_query(
-            f"""
-            SELECT distinct ?item ?osm ?lastUpdate WHERE {{
-              ?item wdt:P31/wdt:P279* wd:Q2143825;
-                    wdt:P17 wd:{config.country_qid};
-                    wdt:P402 ?osm.
-              MINUS {{ ?item wdt:P31 wd:Q116787033 }}
-              OPTIONAL {{
-                ?item p:P9660 ?statement.
-                ?statement ps:P9660 wd:Q936.
-                ?statement pq:P5017 ?lastUpdate.
-              }}
-            }}
-            """
+    def __process_pairs__(self, pairs: list[tuple[str, int]], total: int) -> None:
+        chunks = self.__chunk__(pairs, self.batch_size)
+        for chunk, relations in self.__iterate_fetched_chunks__(chunks):
+            for wd_qid, osm_id in chunk:
+                self.__process_fetched_relation__(wd_qid, osm_id, relations.get(osm_id))
+            if self.journal:
+                self.journal.sync()
+            console.print(f"Processed {self.examined_count}/{total} relations...")
+
+    @property
+    def __sharded__(self) -> bool:
+        # Reading an extract is one pass over the file, shards would repeat it
+        return self.processes > 1 and not self.extract_path
+
+    def __generate_in_shards__(self, pairs: list[tuple[str, int]]) -> None:
+        """Examine contiguous ranges of the pairs in worker processes and
+        merge their partial files in relation id order"""
+        shards = OsmChangeShard.split(
+            pairs,
+            count=self.processes,
+            output_path=self.output_path,
+            mismatch_report_path=self.mismatch_report_path,
+            batch_size=self.batch_size,
+            workers=self.workers,
+            queue_size=self.queue_size,
         )
-        return result["results"]["bindings"]
+        console.print(f"Examining {len(pairs)} relations in {len(shards)} processes")
+        results = self.__map_shards__(shards)
+        failed = [result for result in results if result.error]
+        if failed:
+            # The partial files are kept for inspection
+            raise RuntimeError(
+                "; ".join(f"shard {result.index}: {result.error}" for result in failed)
+            )
+        self.__merge_shards__(shards, results)
+
+    def __map_shards__(
+        self, shards: list[OsmChangeShard]
+    ) -> list[OsmChangeShardResult]:
+        if not shards:
+            return []
+        with worker_environment(per_host_limits(processes=len(shards))):
+            with ProcessPoolExecutor(
+                max_workers=len(shards), mp_context=get_context("spawn")
+            ) as executor:
+                return list(executor.map(generate_osmchange_shard, shards))
 
-    def __fetch_osm_relation__(self, osm_id: int) -> OSMRelation | None:
+    def __merge_shards__(
+        self, shards: list[OsmChangeShard], results: list[OsmChangeShardResult]
+    ) -> None:
+        """Sum the counters and merge the blocks kept in memory, e.g. reused
+        from the last run, with the blocks of the shards by relation id"""
+        for result in results:
+            self.examined_count += result.examined_count
+            self.already_tagged_count += result.already_tagged_count
+            self.patched_count += result.patched_count
+            self.mismatch_count += result.mismatch_count
+            self.outcomes.update(result.outcomes)
+            run_metrics.merge(result.metrics)
+        for shard in shards:
+            self.mismatches.extend(shard.read_mismatches())
+        self.writer = OsmChangeWriter(self.output_path)
+        for block in heapq.merge(
+            self.modify_blocks,
+            *(shard.read_blocks() for shard in shards),
+            key=self.__block_relation_id__,
+        ):
+            self.writer.write_block(block)
+        self.modify_blocks = []
+        for shard in shards:
+            shard.remove_files()
+
+    @staticmethod
+    def __block_relation_id__(block: ET.Element) -> int:
+        relation = block.find("relation")
+        return int(relation.get("id", 0)) if relation is not None else 0
+
+    @classmethod
+    def run_shard(cls, shard: OsmChangeShard) -> OsmChangeShardResult:
+        """Examine one shard in a worker process and write its partial
+        osmChange and mismatch files"""
+        gen = cls(
+            output_path=shard.output_path,
+            mismatch_report_path=shard.mismatch_report_path,
+            extract_path="",
+            batch_size=shard.batch_size,
+            workers=shard.workers,
+            queue_size=shard.queue_size,
+            processes=1,
+        )
+        gen.writer = OsmChangeWriter(shard.output_path)
+        result = OsmChangeShardResult(index=shard.index)
         try:
-            relation = self.api.query(f"relation/{osm_id}")
-            if not relation.isValid():
-                logger.warning(f"Relation {osm_id} not found in OSM")
-                return None
-            tags = relation.tags()
-            version = relation.version()
-            soup_members = getattr(relation, "_soup", None).find_all("member") if hasattr(relation, "_soup") else []
-            members = [(m.get("type", ""), int(m.get("ref", 0)), m.get("role", "")) for m in soup_members]
-            return OSMRelation(osm_id=osm_id, version=int(version), tags=tags, members=members)
+            gen.__process_pairs__(shard.pairs, total=len(shard.pairs))
         except Exception as e:
-            logger.error(f"Failed to fetch relation {osm_id}: {e}")
-            return None
+            logger.exception(f"Shard {shard.index} failed")
+            result.error = f"{type(e).__name__}: {e}"
+        gen.__write_mismatch_report__()
+        gen.writer.close()
+        gen.writer = None
+        result.examined_count = gen.examined_count
+        result.already_tagged_count = gen.already_tagged_count
+        result.patched_count = gen.patched_count
+        result.mismatch_count = gen.mismatch_count
+        result.outcomes = gen.outcomes
+        return result
+
+    def __start_or_resume_journal__(
+        self, pairs: list[tuple[str, int]]
+    ) -> list[tuple[str, int]]:
+        """Replay the journal of an interrupted run if we resume and return
+        the pairs that are left. Otherwise start a new journal"""
+        journal = OsmChangeJournal(self.journal_path)
+        header, entries = journal.read() if self.resume else (None, [])
+        if self.resume and (not header or header.country_qid != config.country_qid):
+            console.print("No journal to resume from, starting from the beginning")
+            header, entries = None, []
+        if header:
+            # Finish the files the interrupted run started on
+            self.output_path = header.output_path
+            self.mismatch_report_path = header.mismatch_report_path
+        else:
+            header = JournalHeader(
+                country_qid=config.country_qid,
+                output_path=self.output_path,
+                mismatch_report_path=self.mismatch_report_path,
+                started=datetime.now(),
+            )
+        self.writer = OsmChangeWriter(self.output_path)
+        # Bindings may have changed in Wikidata since we were interrupted
+        current = set(pairs)
+        entries = [entry for entry in entries if (entry.qid, entry.osm_id) in current]
+        journal.reopen(entries, header)
+        self.journal = journal
+        for entry in entries:
+            self.__apply_previous_outcome__(entry)
+            self.resumed_count += 1
+        if entries:
+            console.print(
+                f"Resumed {self.resumed_count} relations from {self.journal_path}"
+            )
+        done = {entry.osm_id for entry in entries}
+        return [(wd_qid, osm_id) for wd_qid, osm_id in pairs if osm_id not in done]
+
+    def __flush_partial_results__(self) -> None:
+        if self.journal:
+            self.journal.close()
+        self.__write_mismatch_report__()
+        self.__write_osmchange__()
+        console.print(
+            f"Interrupted after {self.examined_count} relations. "
+            f"Rerun with --resume to continue"
+        )
+
+    def __reuse_previous_outcomes__(
+        self, pairs: list[tuple[str, int]]
+    ) -> list[tuple[str, int]]:
+        """Count the relations we can reuse from the last snapshot
+        and return the ones that have to be fetched again"""
+        snapshot = OsmChangeSnapshot.load(self.snapshot_path)
+        if not snapshot or snapshot.country_qid != config.country_qid:
+            console.print("No snapshot from an earlier run found, examining everything")
+            return pairs
+        # Versions of the relations we have locally, e.g. refetched lately
+        known = self.lookup.get_local(osm_id for _, osm_id in pairs)
+        max_age = timedelta(days=config.osm_snapshot_max_age_days)
+        remaining = []
+        for wd_qid, osm_id in pairs:
+            relation = known.get(osm_id)
+            previous = snapshot.reusable_outcome(
+                wd_qid,
+                osm_id,
+                current_version=relation.version if relation else 0,
+                max_age=max_age,
+            )
+            if previous:
+                self.__apply_previous_outcome__(JournalEntry(**previous.dict()))
+                self.__record_outcome__(previous)
+                self.reused_count += 1
+            else:
+                remaining.append((wd_qid, osm_id))
+        console.print(
+            f"Reusing {self.reused_count} outcomes from the run at "
+            f"{snapshot.created:%Y-%m-%d %H:%M}, fetching {len(remaining)} relations"
+        )
+        return remaining
+
+    def __apply_previous_outcome__(self, previous: JournalEntry) -> None:
+        """Update the counters and outputs like __classify__ would have"""
+        self.examined_count += 1
+        if previous.outcome == "skip":
+            self.already_tagged_count += 1
+        elif previous.outcome == "patch":
+            relation = OSMRelation(
+                osm_id=previous.osm_id,
+                version=previous.version,
+                tags=previous.tags,
+                members=previous.members,
+            )
+            self.__build_modify_block__(relation, previous.qid)
+            self.patched_count += 1
+        elif previous.outcome == "mismatch":
+            self.__append_mismatch__(
+                previous.osm_id, previous.qid, previous.osm_wikidata
+            )
+            self.mismatch_count += 1
+        self.outcomes[previous.osm_id] = RelationOutcome(
+            **previous.dict(include=set(RelationOutcome.__fields__))
+        )
+
+    def __record_outcome__(
+        self, outcome: RelationOutcome, relation: OSMRelation | None = None
+    ) -> None:
+        self.outcomes[outcome.osm_id] = outcome
+        entry = JournalEntry(**outcome.dict())
+        if relation and outcome.outcome == "patch":
+            entry.tags = relation.tags
+            entry.members = relation.members
+        if self.journal:
+            self.journal.append(entry)
+
+    def __save_snapshot__(self) -> None:
+        snapshot = OsmChangeSnapshot(
+            country_qid=config.country_qid,
+            created=datetime.now(),
+            outcomes=self.outcomes,
+        )
+        snapshot.save(self.snapshot_path)
+
+    def __get_items_with_osm_id__(self) -> list[dict[str, Any]]:
+        with run_metrics.measure(Phase.SPARQL_QUERY):
+            result = execute_sparql_query(
+                f"""
+                SELECT distinct ?item ?osm ?lastUpdate WHERE {{
+                  ?item wdt:P31/wdt:P279* wd:Q2143825;
+                        wdt:P17 wd:{config.country_qid};
+                        wdt:P402 ?osm.
+                  MINUS {{ ?item wdt:P31 wd:Q116787033 }}
+                  OPTIONAL {{
+                    ?item p:P9660 ?statement.
+                    ?statement ps:P9660 wd:Q936.
+                    ?statement pq:P5017 ?lastUpdate.
+                  }}
+                }}
+                """
+            )
+        return result["results"]["bindings"]
 
-    def __process_relation__(self, wd_qid: str, osm_id: int) -> None:
+    def __extract_qid_and_osm_id__(
+        self, items: list[dict[str, Any]]
+    ) -> list[tuple[str, int]]:
+        """Return (qid, osm_id) pairs sorted by relation id so that
+        consecutive ids end up in the same multi-fetch request"""
+        pairs = []
+        for item in items:
+            wd_qid = item["item"]["value"].replace(self.rdf_entity_prefix, "")
+            try:
+                osm_id = int(item["osm"]["value"])
+            except ValueError:
+                logger.warning(
+                    f"Skipping {wd_qid} with invalid P402 value {item['osm']['value']}"
+                )
+                continue
+            pairs.append((wd_qid, osm_id))
+        pairs.sort(key=lambda pair: pair[1])
+        return pairs
+
+    @staticmethod
+    def __chunk__(sequence: list, size: int) -> list[list]:
+        if size < 1:
+            raise ValueError("size must be at least 1")
+        return [sequence[i : i + size] for i in range(0, len(sequence), size)]
+
+    def __iterate_fetched_chunks__(
+        self, chunks: list[list[tuple[str, int]]]
+    ) -> Iterator[tuple[list[tuple[str, int]], dict[int, OSMRelation]]]:
+        """Yield each chunk together with its fetched relations, in the
+        order of the chunks no matter how many workers fetch them"""
+        if self.extract_path:
+            yield from self.__read_chunks_from_extract__(chunks)
+        elif self.workers <= 1:
+            for chunk in chunks:
+                yield chunk, self.__fetch_chunk__(chunk)
+        else:
+            yield from self.__fetch_chunks_concurrently__(chunks)
+
+    def __read_chunks_from_extract__(
+        self, chunks: list[list[tuple[str, int]]]
+    ) -> Iterator[tuple[list[tuple[str, int]], dict[int, OSMRelation]]]:
+        """One pass over the extract keeping only the relations we need"""
+        wanted = {osm_id for chunk in chunks for _, osm_id in chunk}
+        console.print(f"Reading {len(wanted)} relations from {self.extract_path}")
+        relations = OsmExtractReader(self.extract_path).read_relations(wanted)
+        for chunk in chunks:
+            yield chunk, {
+                osm_id: relations[osm_id] for _, osm_id in chunk if osm_id in relations
+            }
+
+    def __fetch_chunk__(self, chunk: list[tuple[str, int]]) -> dict[int, OSMRelation]:
+        return self.__fetch_osm_relations__([osm_id for _, osm_id in chunk])
+
+    def __fetch_chunks_concurrently__(
+        self, chunks: list[list[tuple[str, int]]]
+    ) -> Iterator[tuple[list[tuple[str, int]], dict[int, OSMRelation]]]:
+        """Fetch chunks in a thread pool and hand them to the caller in order.
+
+        At most workers + queue_size chunks are in flight at any time, so the
+        queue between the fetch stage and the classify stage never grows beyond
+        that and the workers never block on it. Classification happens in the
+        calling thread only which keeps the counters correct without locks."""
+        window = self.workers + self.queue_size
+        fetched: queue.Queue = queue.Queue(maxsize=window)
+
+        def fetch(index: int) -> None:
+            relations: dict[int, OSMRelation] = {}
+            try:
+                relations = self.__fetch_chunk__(chunks[index])
+            except Exception as e:
+                logger.error(f"Failed to fetch chunk {index}: {e}")
+            finally:
+                fetched.put((index, relations))
+
+        executor = ThreadPoolExecutor(max_workers=self.workers)
+        try:
+            submitted = 0
+            while submitted < min(window, len(chunks)):
+                executor.submit(fetch, submitted)
+                submitted += 1
+            waiting: dict[int, dict[int, OSMRelation]] = {}
+            for next_index, chunk in enumerate(chunks):
+                while next_index not in waiting:
+                    index, relations = fetched.get()
+                    waiting[index] = relations
+                yield chunk, waiting.pop(next_index)
+                if submitted < len(chunks):
+                    executor.submit(fetch, submitted)
+                    submitted += 1
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    def __fetch_osm_relations__(self, osm_ids: list[int]) -> dict[int, OSMRelation]:
+        # The modify blocks need the current version and tags, a stored
+        # copy could make the upload conflict or drop newer tags
+        return self.lookup.get_relations(osm_ids, current=True)
+
+    def __process_fetched_relation__(
+        self, wd_qid: str, osm_id: int, relation: OSMRelation | None
+    ) -> None:
         self.examined_count += 1
         logger.info(f"Processing relation {osm_id} (Q{wd_qid})")
-        relation = self.__fetch_osm_relation__(osm_id)
         if not relation:
+            logger.warning(f"Relation {osm_id} not found in OSM")
+            self.__record_outcome__(
+                RelationOutcome(osm_id=osm_id, qid=wd_qid, outcome="missing")
+            )
             return
-        self.__classify__(wd_qid, relation)
+        outcome = self.__classify__(wd_qid, relation)
+        self.__record_outcome__(
+            RelationOutcome(
+                osm_id=osm_id,
+                qid=wd_qid,
+                outcome=outcome,
+                version=relation.version,
+                osm_wikidata=(
+                    relation.tags.get("wikidata", "") if outcome == "mismatch" else ""
+                ),
+                checked=datetime.now(),
+            ),
+            relation=relation,
+        )
 
     def __classify__(self, wd_qid: str, relation: OSMRelation) -> str:
         existing = relation.tags.get("wikidata", "")
@@ -141,11 +527,17 @@ class OsmChangeGenerator(ProjectBaseModel):
             version=str(relation.version),
         )
         for mem_type, mem_ref, mem_role in relation.members:
-            ET.SubElement(elem, "member", type=mem_type, ref=str(mem_ref), role=mem_role)
+            ET.SubElement(
+                elem, "member", type=mem_type, ref=str(mem_ref), role=mem_role
+            )
         for k, v in relation.tags.items():
             ET.SubElement(elem, "tag", k=k, v=v)
         ET.SubElement(elem, "tag", k="wikidata", v=wd_qid)
-        self.modify_blocks.append(modify)
+        if self.writer:
+            # Stream it to disk right away instead of keeping it around
+            self.writer.write_block(modify)
+        else:
+            self.modify_blocks.append(modify)
 
     def __append_mismatch__(self, osm_id: int, wd_qid: str, osm_wikidata: str) -> None:
         self.mismatches.append((osm_id, wd_qid, osm_wikidata))
@@ -153,20 +545,31 @@ class OsmChangeGenerator(ProjectBaseModel):
     def __write_mismatch_report__(self) -> None:
         if not self.mismatches:
             return
-        with open(self.mismatch_report_path, "w", encoding="utf-8") as f:
-            f.write("osm_id,wd_qid,osm_wikidata\n")
-            for osm_id, wd_qid, osm_wikidata in self.mismatches:
-                f.write(f"{osm_id},{wd_qid},{osm_wikidata}\n")
+        with open(self.mismatch_report_path, "w", encoding="utf-8", newline="") as f:
+            # The wikidata tag can hold several QIDs separated by commas
+            writer = csv.writer(f, lineterminator="\n")
+            writer.writerow(["osm_id", "wd_qid", "osm_wikidata"])
+            writer.writerows(sorted(self.mismatches))
         logger.info(f"Mismatch report written to {self.mismatch_report_path}")
 
     def __write_osmchange__(self) -> None:
-        if not self.modify_blocks:
+        """Finish the streamed document or write the blocks kept in memory"""
+        if not self.writer:
+            self.writer = OsmChangeWriter(self.output_path)
+            for block in self.modify_blocks:
+                self.writer.write_block(block)
+        written = self.writer.close()
+        self.writer = None
+        if not written:
             console.print("No patches to write")
             return
-        root = ET.Element("osmChange", version="0.6", generator="hiking_trail_matcher")
-        for block in self.modify_blocks:
-            root.append(block)
-        tree = ET.ElementTree(root)
-        ET.indent(tree, space="  ")
-        tree.write(self.output_path, encoding="UTF-8", xml_declaration=True)
         console.print(f"osmChange written to {self.output_path}")
+
+
+def generate_osmchange_shard(shard: OsmChangeShard) -> OsmChangeShardResult:
+    """Entry point of the worker processes"""
+    # A worker can be handed several shards, report each one on its own
+    run_metrics.reset()
+    result = OsmChangeGenerator.run_shard(shard)
+    result.metrics = run_metrics.stats()
+    return result
@@ -0,0 +1,191 @@
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+import config
+from src.models.http_transport import HttpTransport, transport
+
+logger = logging.getLogger(__name__)
+
+
+class HttpCache:
+    """Local SQLite cache of GET responses for APIs whose data changes slowly.
+
+    A response younger than the ttl given by the caller is served from disk.
+    An older one is revalidated with If-None-Match/If-Modified-Since when the
+    server sent an ETag or Last-Modified, so a 304 only refreshes its
+    timestamp. The bodies never take up more than max_bytes; the least
+    recently used responses are evicted first."""
+
+    def __init__(
+        self,
+        path: str,
+        max_bytes: int,
+        bypass: bool = False,
+        http: HttpTransport = transport,
+    ):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.bypass = bypass
+        self.http = http
+        self.lock = threading.Lock()
+        self.connection: sqlite3.Connection | None = None
+        self.hits = 0
+        self.revalidated = 0
+        self.misses = 0
+
+    def __connect__(self) -> sqlite3.Connection:
+        if self.connection is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            # We serialize access with self.lock so threads can share it
+            self.connection = sqlite3.connect(
+                self.path, check_same_thread=False, timeout=30
+            )
+            # Lets the processes of a sharded run read while one writes
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS responses (
+                    url TEXT PRIMARY KEY,
+                    body BLOB NOT NULL,
+                    etag TEXT NOT NULL,
+                    last_modified TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    fetched_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL
+                )
+                """
+            )
+            self.connection.execute(
+                "CREATE INDEX IF NOT EXISTS responses_accessed_at "
+                "ON responses (accessed_at)"
+            )
+            self.connection.commit()
+        return self.connection
+
+    def get(self, url: str, ttl_seconds: float) -> tuple[int, bytes]:
+        """Return the status code and body for url. Only 200 answers
+        are cached, everything else is returned as is."""
+        if self.bypass:
+            response = self.http.get(url)
+            return response.status_code, response.content
+        now = time.time()
+        with self.lock:
+            row = (
+                self.__connect__()
+                .execute(
+                    "SELECT body, etag, last_modified, fetched_at "
+                    "FROM responses WHERE url = ?",
+                    (url,),
+                )
+                .fetchone()
+            )
+        if row:
+            body, etag, last_modified, fetched_at = row
+            if now - fetched_at < ttl_seconds:
+                self.hits += 1
+                self.__touch__(url, refresh=False)
+                return 200, bytes(body)
+        headers = {}
+        if row and etag:
+            headers["If-None-Match"] = etag
+        if row and last_modified:
+            headers["If-Modified-Since"] = last_modified
+        response = self.http.get(url, headers=headers)
+        if response.status_code == 304 and row:
+            logger.debug(f"Revalidated {url}")
+            self.revalidated += 1
+            self.__touch__(url, refresh=True)
+            return 200, bytes(row[0])
+        self.misses += 1
+        if response.status_code == 200:
+            self.__put__(
+                url=url,
+                body=response.content,
+                etag=response.headers.get("ETag", ""),
+                last_modified=response.headers.get("Last-Modified", ""),
+            )
+        return response.status_code, response.content
+
+    def __touch__(self, url: str, refresh: bool) -> None:
+        now = time.time()
+        with self.lock:
+            connection = self.__connect__()
+            if refresh:
+                connection.execute(
+                    "UPDATE responses SET fetched_at = ?, accessed_at = ? "
+                    "WHERE url = ?",
+                    (now, now, url),
+                )
+            else:
+                connection.execute(
+                    "UPDATE responses SET accessed_at = ? WHERE url = ?", (now, url)
+                )
+            connection.commit()
+
+    def __put__(self, url: str, body: bytes, etag: str, last_modified: str) -> None:
+        now = time.time()
+        with self.lock:
+            connection = self.__connect__()
+            connection.execute(
+                "INSERT OR REPLACE INTO responses "
+                "(url, body, etag, last_modified, size, fetched_at, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (url, body, etag, last_modified, len(body), now, now),
+            )
+            self.__evict__(connection)
+            connection.commit()
+
+    def __evict__(self, connection: sqlite3.Connection) -> None:
+        (total,) = connection.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM responses"
+        ).fetchone()
+        if total <= self.max_bytes:
+            return
+        rows = connection.execute(
+            "SELECT url, size FROM responses ORDER BY accessed_at"
+        ).fetchall()
+        evicted = []
+        for url, size in rows:
+            if total <= self.max_bytes:
+                break
+            evicted.append((url,))
+            total -= size
+        logger.debug(f"Evicting {len(evicted)} least recently used responses")
+        connection.executemany("DELETE FROM responses WHERE url = ?", evicted)
+
+    def log_stats(self) -> None:
+        logger.info(
+            f"HTTP cache: {self.hits} hits, {self.revalidated} revalidated, "
+            f"{self.misses} misses"
+        )
+
+    def __len__(self) -> int:
+        with self.lock:
+            (count,) = (
+                self.__connect__().execute("SELECT COUNT(*) FROM responses").fetchone()
+            )
+        return int(count)
+
+    def close(self) -> None:
+        with self.lock:
+            if self.connection is not None:
+                self.connection.close()
+                self.connection = None
+
+
+def default_http_cache() -> HttpCache:
+    """An empty path disables the cache so every request goes to the API"""
+    return HttpCache(
+        path=config.http_cache_path,
+        max_bytes=int(config.http_cache_max_mb * 1024 * 1024),
+        bypass=config.http_cache_bypass or not config.http_cache_path,
+    )
+
+
+# Shared by TrailItem and WaymarkedResult
+http_cache = default_http_cache()
@@ -0,0 +1,128 @@
+import codecs
+import logging
+import threading
+from typing import Iterator
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+import config
+
+logger = logging.getLogger(__name__)
+
+
+class HttpTransport:
+    """One pooled session for all outbound HTTP calls so connections
+    to each host are kept alive and reused between requests and threads.
+
+    Idempotent requests are retried with backoff on connection errors
+    and 429/5xx answers. Requests, bytes and errors are counted per host."""
+
+    retry_statuses = (429, 500, 502, 503, 504)
+
+    def __init__(
+        self,
+        retries: int = config.http_retries,
+        backoff_factor: float = config.http_backoff_factor,
+        pool_size: int = config.http_pool_size,
+        timeout: tuple[float, float] = (
+            config.connect_timeout,
+            config.request_timeout,
+        ),
+    ):
+        self.retries = retries
+        self.backoff_factor = backoff_factor
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.lock = threading.Lock()
+        self.requests: dict[str, int] = {}
+        self.bytes: dict[str, int] = {}
+        self.errors: dict[str, int] = {}
+        self.session = requests.Session()
+        self.instrument(self.session)
+
+    def instrument(self, session: requests.Session) -> None:
+        """Mount our pooled adapters, user agent and counters on a session.
+        This is also used for the sessions WikibaseIntegrator creates"""
+        adapter = HTTPAdapter(
+            pool_connections=self.pool_size,
+            pool_maxsize=self.pool_size,
+            max_retries=Retry(
+                total=self.retries,
+                backoff_factor=self.backoff_factor,
+                status_forcelist=self.retry_statuses,
+                respect_retry_after_header=True,
+                raise_on_status=False,
+            ),
+        )
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        session.headers["User-Agent"] = config.user_agent
+        if self.__count__ not in session.hooks["response"]:
+            session.hooks["response"].append(self.__count__)
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        kwargs.setdefault("timeout", self.timeout)
+        try:
+            return self.session.get(url, **kwargs)
+        except requests.RequestException:
+            self.__increment__(self.errors, urlparse(url).netloc, 1)
+            raise
+
+    def stream(self, url: str, chunk_size: int = 64 * 1024, **kwargs) -> Iterator[str]:
+        """GET url and yield the body as text in chunks as it arrives"""
+        kwargs.setdefault("timeout", self.timeout)
+        host = urlparse(url).netloc
+        try:
+            response = self.session.get(url, stream=True, **kwargs)
+        except requests.RequestException:
+            self.__increment__(self.errors, host, 1)
+            raise
+        with response:
+            response.raise_for_status()
+            decoder = codecs.getincrementaldecoder(response.encoding or "utf-8")()
+            try:
+                for chunk in response.iter_content(chunk_size=chunk_size):
+                    self.__increment__(self.bytes, host, len(chunk))
+                    yield decoder.decode(chunk)
+            except requests.RequestException:
+                self.__increment__(self.errors, host, 1)
+                raise
+            yield decoder.decode(b"", final=True)
+
+    def __count__(self, response: requests.Response, *args, **kwargs) -> None:
+        host = urlparse(response.url).netloc
+        self.__increment__(self.requests, host, 1)
+        # Streamed bodies are counted by stream() as they are read
+        if not kwargs.get("stream"):
+            self.__increment__(self.bytes, host, len(response.content))
+        if response.status_code >= 400:
+            self.__increment__(self.errors, host, 1)
+
+    def __increment__(self, counter: dict[str, int], host: str, value: int) -> None:
+        with self.lock:
+            counter[host] = counter.get(host, 0) + value
+
+    def stats(self) -> dict[str, dict[str, int]]:
+        with self.lock:
+            return {
+                host: {
+                    "requests": self.requests.get(host, 0),
+                    "bytes": self.bytes.get(host, 0),
+                    "errors": self.errors.get(host, 0),
+                }
+                for host in sorted(set(self.requests) | set(self.errors))
+            }
+
+    def log_stats(self) -> None:
+        for host, stats in self.stats().items():
+            logger.info(
+                f"{host}: {stats['requests']} requests, "
+                f"{stats['bytes']} bytes, {stats['errors']} errors"
+            )
+
+
+# Shared by every thread in the process
+transport = HttpTransport()
@@ -0,0 +1,68 @@
+import bz2
+import gzip
+import logging
+import xml.etree.ElementTree as ET
+from typing import IO, Iterator, cast
+
+from src.models.osm_relation import OSMRelation
+
+logger = logging.getLogger(__name__)
+
+
+class OsmExtractReader:
+    """Reads a local .osm, .osm.bz2 or .osm.gz extract in one streaming pass.
+
+    Elements are discarded as soon as they have been looked at so memory use
+    does not depend on the size of the extract."""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def __open__(self) -> IO[bytes]:
+        if self.path.endswith(".bz2"):
+            return bz2.open(self.path, "rb")
+        if self.path.endswith(".gz"):
+            return cast(IO[bytes], gzip.open(self.path, "rb"))
+        return open(self.path, "rb")
+
+    def iter_elements(self, tags: set[str]) -> Iterator[ET.Element]:
+        """Yield every complete element with one of the given tag names.
+        The element is cleared when the caller asks for the next one"""
+        with self.__open__() as f:
+            root = None
+            for event, elem in ET.iterparse(f, events=("start", "end")):
+                if root is None:
+                    root = elem
+                    continue
+                if event != "end" or elem.tag not in ("node", "way", "relation"):
+                    continue
+                if elem.tag in tags:
+                    yield elem
+                # Drop everything parsed so far, the root keeps no children
+                root.clear()
+
+    def iter_relations(self, wanted: set[int] | None = None) -> Iterator[OSMRelation]:
+        """Yield the relations in the extract, only the wanted ones if given.
+        Stops reading as soon as all wanted relations have been found"""
+        remaining = set(wanted) if wanted is not None else None
+        for elem in self.iter_elements({"relation"}):
+            osm_id = int(elem.get("id", 0))
+            if remaining is not None and osm_id not in remaining:
+                continue
+            if elem.get("version") is None:
+                logger.warning(
+                    f"Relation {osm_id} has no version in {self.path}, "
+                    f"JOSM will refuse to upload a patch for it"
+                )
+            yield OSMRelation.from_element(elem)
+            if remaining is not None:
+                remaining.discard(osm_id)
+                if not remaining:
+                    return
+
+    def read_relations(self, wanted: set[int]) -> dict[int, OSMRelation]:
+        relations = {relation.id: relation for relation in self.iter_relations(wanted)}
+        logger.info(
+            f"Found {len(relations)}/{len(wanted)} wanted relations in {self.path}"
+        )
+        return relations
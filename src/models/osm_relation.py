@@ -0,0 +1,39 @@
+import xml.etree.ElementTree as ET
+
+
+class OSMRelation:
+    def __init__(
+        self,
+        osm_id: int,
+        version: int,
+        tags: dict[str, str],
+        members: list[tuple[str, int, str]] | None = None,
+    ):
+        self.id = osm_id
+        self.version = version
+        self.tags = tags
+        self.members = members or []
+
+    @staticmethod
+    def parse_xml(xml: str | bytes) -> list["OSMRelation"]:
+        """Parse every visible <relation> in an OSM API 0.6 XML document"""
+        root = ET.fromstring(xml)
+        return [
+            OSMRelation.from_element(elem)
+            for elem in root.iter("relation")
+            if elem.get("visible", "true") == "true"
+        ]
+
+    @staticmethod
+    def from_element(elem: ET.Element) -> "OSMRelation":
+        tags = {tag.get("k", ""): tag.get("v", "") for tag in elem.findall("tag")}
+        members = [
+            (m.get("type", ""), int(m.get("ref", 0)), m.get("role", ""))
+            for m in elem.findall("member")
+        ]
+        return OSMRelation(
+            osm_id=int(elem.get("id", 0)),
+            version=int(elem.get("version", 0)),
+            tags=tags,
+            members=members,
+        )
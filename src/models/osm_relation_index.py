@@ -0,0 +1,181 @@
+import logging
+import mmap
+import os
+import shutil
+import struct
+import tempfile
+from typing import BinaryIO, Iterable
+
+import config
+from src.models.osm_extract_reader import OsmExtractReader
+from src.models.osm_relation import OSMRelation
+
+logger = logging.getLogger(__name__)
+
+
+class OsmRelationIndex:
+    """Read-only relation index built from an OSM extract, read through mmap.
+
+    Layout (little endian):
+    header    magic (8 bytes) and number of relations (u64)
+    table     (relation id u64, record offset u64) sorted by relation id
+    records   version u32, number of tags u32, number of members u32,
+              tags as (key, value) strings, members as
+              (type u8, ref u64, role string).
+              Strings are a u32 byte length followed by UTF-8.
+
+    Lookups are a binary search in the table followed by decoding one small
+    record. Processes opening the same file share its pages."""
+
+    magic = b"HTMRIDX1"
+    header = struct.Struct("<8sQ")
+    entry = struct.Struct("<QQ")
+    record_header = struct.Struct("<III")
+    member_header = struct.Struct("<BQ")
+    length = struct.Struct("<I")
+    member_types = ("node", "way", "relation")
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            self.mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.count = self.header.unpack_from(self.mmap, 0)
+        if magic != self.magic:
+            raise ValueError(f"{path} is not a relation index")
+        self.table_offset = self.header.size
+
+    def __len__(self) -> int:
+        return int(self.count)
+
+    def __id_at__(self, position: int) -> int:
+        offset = self.table_offset + position * self.entry.size
+        return int(self.entry.unpack_from(self.mmap, offset)[0])
+
+    def __find__(self, osm_id: int) -> int | None:
+        """Binary search the table, returns the record offset"""
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            if self.__id_at__(middle) < osm_id:
+                low = middle + 1
+            else:
+                high = middle
+        if low < self.count:
+            offset = self.table_offset + low * self.entry.size
+            found_id, record_offset = self.entry.unpack_from(self.mmap, offset)
+            if found_id == osm_id:
+                return int(record_offset)
+        return None
+
+    def __read_string__(self, offset: int) -> tuple[str, int]:
+        (size,) = self.length.unpack_from(self.mmap, offset)
+        start = offset + self.length.size
+        return self.mmap[start : start + size].decode("utf-8"), start + size
+
+    def get(self, osm_id: int) -> OSMRelation | None:
+        offset = self.__find__(osm_id)
+        if offset is None:
+            return None
+        version, tag_count, member_count = self.record_header.unpack_from(
+            self.mmap, offset
+        )
+        offset += self.record_header.size
+        tags = {}
+        for _ in range(tag_count):
+            key, offset = self.__read_string__(offset)
+            value, offset = self.__read_string__(offset)
+            tags[key] = value
+        members = []
+        for _ in range(member_count):
+            type_number, ref = self.member_header.unpack_from(self.mmap, offset)
+            role, offset = self.__read_string__(offset + self.member_header.size)
+            members.append((self.member_types[type_number], int(ref), role))
+        return OSMRelation(osm_id=osm_id, version=version, tags=tags, members=members)
+
+    def get_many(self, osm_ids: Iterable[int]) -> dict[int, OSMRelation]:
+        found = {}
+        for osm_id in osm_ids:
+            relation = self.get(osm_id)
+            if relation:
+                found[osm_id] = relation
+        return found
+
+    def close(self) -> None:
+        self.mmap.close()
+
+    @classmethod
+    def __pack_string__(cls, value: str) -> bytes:
+        encoded = value.encode("utf-8")
+        return cls.length.pack(len(encoded)) + encoded
+
+    @classmethod
+    def __pack_relation__(cls, relation: OSMRelation) -> bytes:
+        parts = [
+            cls.record_header.pack(
+                relation.version, len(relation.tags), len(relation.members)
+            )
+        ]
+        for key, value in relation.tags.items():
+            parts.append(cls.__pack_string__(key))
+            parts.append(cls.__pack_string__(value))
+        for member_type, ref, role in relation.members:
+            parts.append(
+                cls.member_header.pack(cls.member_types.index(member_type), ref)
+            )
+            parts.append(cls.__pack_string__(role))
+        return b"".join(parts)
+
+    @classmethod
+    def build(
+        cls, relations: Iterable[OSMRelation], path: str, only_routes: bool = True
+    ) -> int:
+        """Write an index of the relations to path and return how many
+        were written. By default only route and superroute relations are kept"""
+        table: dict[int, int] = {}
+        directory = os.path.dirname(path) or "."
+        os.makedirs(directory, exist_ok=True)
+        with tempfile.TemporaryFile(dir=directory) as records:
+            for relation in relations:
+                if only_routes and relation.tags.get("type") not in (
+                    "route",
+                    "superroute",
+                ):
+                    continue
+                table[relation.id] = records.tell()
+                records.write(cls.__pack_relation__(relation))
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, "wb") as f:
+                cls.__write_index__(f, table, records)
+            os.replace(tmp_path, path)
+        logger.info(f"Wrote {len(table)} relations to {path}")
+        return len(table)
+
+    @classmethod
+    def __write_index__(
+        cls, f: BinaryIO, table: dict[int, int], records: BinaryIO
+    ) -> None:
+        f.write(cls.header.pack(cls.magic, len(table)))
+        records_offset = cls.header.size + len(table) * cls.entry.size
+        for osm_id in sorted(table):
+            f.write(cls.entry.pack(osm_id, records_offset + table[osm_id]))
+        records.seek(0)
+        shutil.copyfileobj(records, f)
+
+    @classmethod
+    def build_from_extract(
+        cls, extract_path: str, path: str, only_routes: bool = True
+    ) -> int:
+        reader = OsmExtractReader(extract_path)
+        return cls.build(reader.iter_relations(), path, only_routes=only_routes)
+
+
+def default_relation_index() -> OsmRelationIndex | None:
+    if not config.relation_index_path:
+        return None
+    if not os.path.exists(config.relation_index_path):
+        logger.warning(
+            f"Relation index {config.relation_index_path} does not exist, "
+            f"build it with app_index.py"
+        )
+        return None
+    return OsmRelationIndex(config.relation_index_path)
@@ -0,0 +1,128 @@
+import logging
+from typing import Iterable
+
+import requests
+
+import config
+from src.enums import Phase
+from src.models.http_transport import transport
+from src.models.osm_relation import OSMRelation
+from src.models.osm_relation_index import OsmRelationIndex, default_relation_index
+from src.models.osm_relation_store import OsmRelationStore, default_relation_store
+from src.models.rate_limiter import rate_limiter
+from src.models.run_metrics import run_metrics
+
+logger = logging.getLogger(__name__)
+
+
+class OsmRelationLookup:
+    """Looks up relations in the local index and store first and fetches
+    the missing or outdated ones from the OSM API"""
+
+    host = "api.openstreetmap.org"
+    endpoint = f"https://{host}/api/0.6"
+
+    def __init__(
+        self,
+        store: OsmRelationStore | None = None,
+        index: OsmRelationIndex | None = None,
+    ):
+        self.store = store
+        self.index = index
+
+    def get_relation(self, osm_id: int) -> OSMRelation | None:
+        return self.get_relations([osm_id]).get(osm_id)
+
+    def get_relations(
+        self, osm_ids: Iterable[int], current: bool = False
+    ) -> dict[int, OSMRelation]:
+        """With current=True the local copies are ignored and every relation
+        is fetched from the API, e.g. before we write a change based on it.
+        The fetched relations refresh the store either way."""
+        ids = list(dict.fromkeys(osm_ids))
+        found = {} if current else self.get_local(ids)
+        missing = [osm_id for osm_id in ids if osm_id not in found]
+        for start in range(0, len(missing), config.osm_batch_size):
+            fetched = self.__fetch_many__(
+                missing[start : start + config.osm_batch_size]
+            )
+            if self.store is not None and fetched:
+                self.store.put_many(fetched.values())
+            found.update(fetched)
+        return found
+
+    def get_local(self, osm_ids: Iterable[int]) -> dict[int, OSMRelation]:
+        """The relations we have in the index or fresh in the store,
+        without asking the API"""
+        ids = list(dict.fromkeys(osm_ids))
+        found: dict[int, OSMRelation] = {}
+        if self.index is not None:
+            found = self.index.get_many(ids)
+            logger.debug(f"Found {len(found)}/{len(ids)} relations in the index")
+        missing = [osm_id for osm_id in ids if osm_id not in found]
+        if self.store is not None and missing:
+            found.update(self.store.get_many(missing))
+            logger.debug(f"Found {len(found)}/{len(ids)} relations locally")
+        return found
+
+    def __request__(self, path: str) -> requests.Response:
+        rate_limiter.wait(self.host)
+        with run_metrics.measure(Phase.OSM_TAG_LOOKUP) as measurement:
+            response = transport.get(f"{self.endpoint}/{path}")
+            measurement.bytes = len(response.content)
+            # A deleted relation is an answer, not an error
+            measurement.error = response.status_code >= 400 and (
+                response.status_code not in (404, 410)
+            )
+        return response
+
+    def __fetch_one__(self, osm_id: int) -> OSMRelation | None:
+        try:
+            response = self.__request__(f"relation/{osm_id}")
+            if response.status_code in (404, 410):
+                logger.warning(f"Relation {osm_id} not found in OSM")
+                return None
+            response.raise_for_status()
+            relations = OSMRelation.parse_xml(response.content)
+            return relations[0] if relations else None
+        except Exception as e:
+            logger.error(f"Failed to fetch relation {osm_id}: {e}")
+            return None
+
+    def __fetch_many__(self, osm_ids: list[int]) -> dict[int, OSMRelation]:
+        """Fetch many relations in one request using the multi-fetch form
+        of the API. The API answers 404 for the whole request if a single
+        id is missing, so we fall back to one request per id in that case.
+        We do the same on any other failure so a bad answer for the chunk
+        does not count all of its relations as missing."""
+        if not osm_ids:
+            return {}
+        if len(osm_ids) > 1:
+            ids = ",".join(str(osm_id) for osm_id in osm_ids)
+            try:
+                response = self.__request__(f"relations?relations={ids}")
+                if response.status_code != 404:
+                    response.raise_for_status()
+                    relations = OSMRelation.parse_xml(response.content)
+                    return {relation.id: relation for relation in relations}
+                logger.warning(
+                    f"Multi-fetch of {len(osm_ids)} relations got 404, "
+                    f"falling back to fetching them one by one"
+                )
+            except Exception as e:
+                logger.error(
+                    f"Failed to fetch {len(osm_ids)} relations: {e}, "
+                    f"falling back to fetching them one by one"
+                )
+        fetched = {}
+        for osm_id in osm_ids:
+            relation = self.__fetch_one__(osm_id)
+            if relation:
+                fetched[osm_id] = relation
+        return fetched
+
+
+# Shared by OsmChangeGenerator and WaymarkedResult
+relation_lookup = OsmRelationLookup(
+    store=default_relation_store(), index=default_relation_index()
+)
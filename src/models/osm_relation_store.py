@@ -0,0 +1,181 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Iterable, Iterator
+
+import config
+from src.models.osm_relation import OSMRelation
+
+logger = logging.getLogger(__name__)
+
+
+class OsmRelationStore:
+    """Local SQLite store of OSM relations (tags, version and members).
+
+    Entries older than ttl_seconds are treated as missing so they get
+    fetched again. When an entry is fetched again with an unchanged version
+    only its timestamp is refreshed. The store never holds more than
+    max_entries relations; the least recently used ones are evicted first."""
+
+    def __init__(self, path: str, ttl_seconds: float, max_entries: int):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.connection: sqlite3.Connection | None = None
+
+    def __connect__(self) -> sqlite3.Connection:
+        if self.connection is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            # We serialize access with self.lock so threads can share it
+            self.connection = sqlite3.connect(
+                self.path, check_same_thread=False, timeout=30
+            )
+            # Lets the processes of a sharded run read while one writes
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS relations (
+                    id INTEGER PRIMARY KEY,
+                    version INTEGER NOT NULL,
+                    tags TEXT NOT NULL,
+                    members TEXT NOT NULL,
+                    fetched_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL
+                )
+                """
+            )
+            self.connection.execute(
+                "CREATE INDEX IF NOT EXISTS relations_accessed_at "
+                "ON relations (accessed_at)"
+            )
+            self.connection.commit()
+        return self.connection
+
+    def __is_fresh__(self, fetched_at: float, now: float) -> bool:
+        return now - fetched_at < self.ttl_seconds
+
+    def get(self, osm_id: int) -> OSMRelation | None:
+        return self.get_many([osm_id]).get(osm_id)
+
+    def get_many(self, osm_ids: Iterable[int]) -> dict[int, OSMRelation]:
+        """Return the fresh relations we have"""
+        ids = list(osm_ids)
+        found: dict[int, OSMRelation] = {}
+        now = time.time()
+        with self.lock:
+            connection = self.__connect__()
+            # Stay well below the SQLite limit on host parameters
+            for start in range(0, len(ids), 500):
+                chunk = ids[start : start + 500]
+                placeholders = ",".join("?" * len(chunk))
+                rows = connection.execute(
+                    f"SELECT id, version, tags, members, fetched_at "
+                    f"FROM relations WHERE id IN ({placeholders})",
+                    chunk,
+                ).fetchall()
+                for osm_id, version, tags, members, fetched_at in rows:
+                    if not self.__is_fresh__(fetched_at, now):
+                        continue
+                    found[osm_id] = OSMRelation(
+                        osm_id=osm_id,
+                        version=version,
+                        tags=json.loads(tags),
+                        members=[tuple(member) for member in json.loads(members)],
+                    )
+            if found:
+                connection.executemany(
+                    "UPDATE relations SET accessed_at = ? WHERE id = ?",
+                    [(now, osm_id) for osm_id in found],
+                )
+                connection.commit()
+        return found
+
+    def put_many(self, relations: Iterable[OSMRelation]) -> None:
+        now = time.time()
+        with self.lock:
+            connection = self.__connect__()
+            for relation in relations:
+                # An unchanged version only needs its timestamps refreshed
+                updated = connection.execute(
+                    "UPDATE relations SET fetched_at = ?, accessed_at = ? "
+                    "WHERE id = ? AND version = ?",
+                    (now, now, relation.id, relation.version),
+                ).rowcount
+                if not updated:
+                    connection.execute(
+                        "INSERT OR REPLACE INTO relations "
+                        "(id, version, tags, members, fetched_at, accessed_at) "
+                        "VALUES (?, ?, ?, ?, ?, ?)",
+                        (
+                            relation.id,
+                            relation.version,
+                            json.dumps(relation.tags, ensure_ascii=False),
+                            json.dumps(relation.members),
+                            now,
+                            now,
+                        ),
+                    )
+            self.__evict__(connection)
+            connection.commit()
+
+    def iter_relations(self) -> Iterator[OSMRelation]:
+        """Yield every stored relation regardless of its age"""
+        with self.lock:
+            rows = (
+                self.__connect__()
+                .execute("SELECT id, version, tags, members FROM relations")
+                .fetchall()
+            )
+        for osm_id, version, tags, members in rows:
+            yield OSMRelation(
+                osm_id=osm_id,
+                version=version,
+                tags=json.loads(tags),
+                members=[tuple(member) for member in json.loads(members)],
+            )
+
+    def delete(self, osm_id: int) -> None:
+        with self.lock:
+            connection = self.__connect__()
+            connection.execute("DELETE FROM relations WHERE id = ?", (osm_id,))
+            connection.commit()
+
+    def __evict__(self, connection: sqlite3.Connection) -> None:
+        (count,) = connection.execute("SELECT COUNT(*) FROM relations").fetchone()
+        excess = count - self.max_entries
+        if excess > 0:
+            logger.debug(f"Evicting {excess} least recently used relations")
+            connection.execute(
+                "DELETE FROM relations WHERE id IN "
+                "(SELECT id FROM relations ORDER BY accessed_at LIMIT ?)",
+                (excess,),
+            )
+
+    def __len__(self) -> int:
+        with self.lock:
+            (count,) = (
+                self.__connect__().execute("SELECT COUNT(*) FROM relations").fetchone()
+            )
+        return int(count)
+
+    def close(self) -> None:
+        with self.lock:
+            if self.connection is not None:
+                self.connection.close()
+                self.connection = None
+
+
+def default_relation_store() -> OsmRelationStore | None:
+    if not config.relation_store_path:
+        return None
+    return OsmRelationStore(
+        path=config.relation_store_path,
+        ttl_seconds=config.relation_store_ttl_days * 24 * 3600,
+        max_entries=config.relation_store_max_entries,
+    )
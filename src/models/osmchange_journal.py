@@ -0,0 +1,94 @@
+import logging
+import os
+from datetime import datetime
+from typing import Dict, List, TextIO, Tuple
+
+from pydantic import BaseModel
+
+from src.models.relation_outcome import RelationOutcome
+
+logger = logging.getLogger(__name__)
+
+
+class JournalHeader(BaseModel):
+    """First line of the journal, tells a resumed run where to write"""
+
+    country_qid: str
+    output_path: str
+    mismatch_report_path: str
+    started: datetime
+
+
+class JournalEntry(RelationOutcome):
+    """A processed relation. Patches carry the tags and members
+    so the modify block can be rebuilt without fetching again"""
+
+    tags: Dict[str, str] = {}
+    members: List[Tuple[str, int, str]] = []
+
+
+class OsmChangeJournal:
+    """Append-only JSON lines journal of the relations processed so far.
+
+    Every entry is flushed when it is appended so a crash or Ctrl+C loses
+    nothing, and sync() forces the data to disk at chunk boundaries."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.file: TextIO | None = None
+
+    def read(self) -> tuple[JournalHeader | None, list[JournalEntry]]:
+        if not os.path.exists(self.path):
+            return None, []
+        header = None
+        entries = []
+        with open(self.path, encoding="utf-8") as f:
+            for number, line in enumerate(f):
+                if not line.endswith("\n"):
+                    # The last line was cut short when we were interrupted
+                    logger.warning(f"Ignoring incomplete journal line {number + 1}")
+                    break
+                if number == 0:
+                    header = JournalHeader.parse_raw(line)
+                else:
+                    entries.append(JournalEntry.parse_raw(line))
+        return header, entries
+
+    def start(self, header: JournalHeader) -> None:
+        """Start a new journal, discarding any earlier one"""
+        self.file = open(self.path, "w", encoding="utf-8")
+        self.__write_line__(header.json(ensure_ascii=False))
+        self.sync()
+
+    def reopen(self, entries: list[JournalEntry], header: JournalHeader) -> None:
+        """Continue a journal we have read, dropping a cut short last line"""
+        self.start(header)
+        for entry in entries:
+            self.append(entry)
+        self.sync()
+
+    def append(self, entry: JournalEntry) -> None:
+        if self.file is None:
+            raise ValueError("the journal has not been started")
+        self.__write_line__(entry.json(ensure_ascii=False))
+
+    def __write_line__(self, line: str) -> None:
+        if self.file is None:
+            raise ValueError("the journal has not been started")
+        self.file.write(line + "\n")
+        self.file.flush()
+
+    def sync(self) -> None:
+        if self.file is not None:
+            os.fsync(self.file.fileno())
+
+    def close(self) -> None:
+        if self.file is not None:
+            self.sync()
+            self.file.close()
+            self.file = None
+
+    def remove(self) -> None:
+        self.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
@@ -0,0 +1,102 @@
+import csv
+import logging
+import os
+import xml.etree.ElementTree as ET
+from typing import Any, Dict, Iterator, List, Tuple
+
+from pydantic import BaseModel
+
+from src.models.relation_outcome import RelationOutcome
+
+logger = logging.getLogger(__name__)
+
+
+class OsmChangeShard(BaseModel):
+    """A contiguous range of the (qid, relation id) pairs examined by one
+    worker process, with the partial files it writes"""
+
+    index: int
+    pairs: List[Tuple[str, int]]
+    output_path: str
+    mismatch_report_path: str
+    batch_size: int
+    workers: int
+    queue_size: int
+
+    @classmethod
+    def split(
+        cls,
+        pairs: List[Tuple[str, int]],
+        count: int,
+        output_path: str,
+        mismatch_report_path: str,
+        batch_size: int,
+        workers: int,
+        queue_size: int,
+    ) -> List["OsmChangeShard"]:
+        """Split the sorted pairs into count ranges of whole chunks, so
+        consecutive ids still share multi-fetch requests"""
+        chunks = -(-len(pairs) // batch_size)
+        per_shard = max(1, -(-chunks // count)) * batch_size
+        return [
+            cls(
+                index=index,
+                pairs=pairs[start : start + per_shard],
+                output_path=f"{output_path}.part{index}",
+                mismatch_report_path=f"{mismatch_report_path}.part{index}",
+                batch_size=batch_size,
+                workers=workers,
+                queue_size=queue_size,
+            )
+            for index, start in enumerate(range(0, len(pairs), per_shard))
+        ]
+
+    def read_blocks(self) -> Iterator[ET.Element]:
+        """Yield the <modify> blocks of the partial osmChange in order,
+        dropping each one from the tree once the next one is asked for"""
+        if not os.path.exists(self.output_path):
+            return
+        root = None
+        depth = 0
+        for event, elem in ET.iterparse(self.output_path, events=("start", "end")):
+            if event == "start":
+                if root is None:
+                    root = elem
+                depth += 1
+                continue
+            depth -= 1
+            if depth == 1 and elem.tag == "modify" and root is not None:
+                yield elem
+                root.remove(elem)
+
+    def read_mismatches(self) -> List[Tuple[int, str, str]]:
+        if not os.path.exists(self.mismatch_report_path):
+            return []
+        with open(self.mismatch_report_path, encoding="utf-8", newline="") as f:
+            reader = csv.reader(f)
+            # Skip the header
+            next(reader, None)
+            return [
+                (int(osm_id), wd_qid, osm_wikidata)
+                for osm_id, wd_qid, osm_wikidata in reader
+            ]
+
+    def remove_files(self) -> None:
+        for path in (self.output_path, self.mismatch_report_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+
+class OsmChangeShardResult(BaseModel):
+    """The counters and outcomes of one shard, summed up by the parent"""
+
+    index: int
+    examined_count: int = 0
+    already_tagged_count: int = 0
+    patched_count: int = 0
+    mismatch_count: int = 0
+    outcomes: Dict[int, RelationOutcome] = {}
+    # Per-phase metrics of the worker, see RunMetrics.stats()
+    metrics: Dict[str, Dict[str, Any]] = {}
+    # Exceptions of the workers are not always picklable
+    error: str = ""
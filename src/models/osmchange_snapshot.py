@@ -0,0 +1,67 @@
+import logging
+import os
+from datetime import datetime, timedelta
+from typing import ClassVar, Dict
+
+from pydantic import BaseModel
+
+from src.models.relation_outcome import RelationOutcome
+
+logger = logging.getLogger(__name__)
+
+
+class OsmChangeSnapshot(BaseModel):
+    """The P402 bindings and per relation outcomes of the last run.
+
+    Incremental runs reuse the outcomes that cannot have been changed by
+    us: relations that were already tagged or mismatched for the same item.
+    Everything else (new bindings, changed QIDs, patches that may not have
+    been uploaded yet and relations we failed to fetch) is examined again.
+
+    Others can fix or remove the tags, so a reusable outcome is examined
+    again when we know of a newer version of the relation or when it was
+    checked longer than max_age ago."""
+
+    country_qid: str
+    created: datetime = datetime.now()
+    outcomes: Dict[int, RelationOutcome] = {}
+
+    reusable_outcomes: ClassVar[set[str]] = {"skip", "mismatch"}
+
+    def reusable_outcome(
+        self,
+        qid: str,
+        osm_id: int,
+        current_version: int = 0,
+        max_age: timedelta | None = None,
+    ) -> RelationOutcome | None:
+        """current_version is the version we know the relation has now,
+        0 if we do not know it"""
+        previous = self.outcomes.get(osm_id)
+        if (
+            not previous
+            or previous.qid != qid
+            or previous.outcome not in self.reusable_outcomes
+        ):
+            return None
+        if current_version and current_version != previous.version:
+            return None
+        if max_age is not None and (
+            not previous.checked or previous.checked < datetime.now() - max_age
+        ):
+            return None
+        return previous
+
+    def save(self, path: str) -> None:
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(self.json(ensure_ascii=False))
+        # Replace atomically so an interrupted save keeps the old snapshot
+        os.replace(tmp_path, path)
+        logger.info(f"Snapshot with {len(self.outcomes)} outcomes written to {path}")
+
+    @classmethod
+    def load(cls, path: str) -> "OsmChangeSnapshot | None":
+        if not os.path.exists(path):
+            return None
+        return cls.parse_file(path)
@@ -0,0 +1,45 @@
+import logging
+import xml.etree.ElementTree as ET
+from typing import TextIO
+
+logger = logging.getLogger(__name__)
+
+
+class OsmChangeWriter:
+    """Streams an osmChange document to disk one <modify> block at a time.
+
+    The output is byte for byte what ElementTree produces when indenting and
+    writing the whole tree, but only the block being written is kept in memory.
+    The file is created when the first block arrives so a run without patches
+    does not leave an empty document behind."""
+
+    header = (
+        "<?xml version='1.0' encoding='UTF-8'?>\n"
+        '<osmChange version="0.6" generator="hiking_trail_matcher">'
+    )
+    footer = "\n</osmChange>"
+
+    def __init__(self, path: str):
+        self.path = path
+        self.file: TextIO | None = None
+        self.block_count = 0
+
+    def write_block(self, block: ET.Element) -> None:
+        if self.file is None:
+            self.file = open(self.path, "w", encoding="utf-8")
+            self.file.write(self.header)
+        block.tail = None
+        ET.indent(block, space="  ", level=1)
+        self.file.write("\n  " + ET.tostring(block, encoding="unicode"))
+        self.file.flush()
+        self.block_count += 1
+
+    def close(self) -> bool:
+        """Finish the document. Returns False if nothing was written"""
+        if self.file is None:
+            return False
+        self.file.write(self.footer)
+        self.file.close()
+        self.file = None
+        logger.debug(f"Wrote {self.block_count} blocks to {self.path}")
+        return True
@@ -1,10 +1,14 @@
 from pydantic import BaseModel
-from wikibaseintegrator import wbi_config  # type: ignore
+from wikibaseintegrator import wbi_config, wbi_helpers  # type: ignore
 
 import config
+from src.models.http_transport import transport
 
 
 class ProjectBaseModel(BaseModel):
     @staticmethod
     def setup_wbi():
         wbi_config.config["USER_AGENT"] = config.user_agent
+        # Let WikibaseIntegrator reuse our pooled connections and counters
+        transport.instrument(wbi_helpers.default_session)
+        transport.instrument(wbi_helpers.helpers_session)
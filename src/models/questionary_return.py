@@ -6,3 +6,5 @@ class QuestionaryReturn(ProjectBaseModel):
     more_information: bool = False
     no_match: bool = False
     skip: bool = False
+    # Show the details of the candidates that were shown in compact form
+    expand: bool = False
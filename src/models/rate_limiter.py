@@ -0,0 +1,58 @@
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from typing import Iterator
+
+import config
+
+logger = logging.getLogger(__name__)
+
+
+class HostRateLimiter:
+    """Spaces out requests to each host so that all threads together
+    stay below requests_per_second for that host"""
+
+    def __init__(self, requests_per_second: float):
+        self.interval = 1 / requests_per_second if requests_per_second > 0 else 0.0
+        self.lock = threading.Lock()
+        self.next_slot: dict[str, float] = {}
+
+    def wait(self, host: str) -> None:
+        """Block until the calling thread may send a request to host"""
+        if not self.interval:
+            return
+        with self.lock:
+            now = time.monotonic()
+            slot = max(now, self.next_slot.get(host, now))
+            self.next_slot[host] = slot + self.interval
+        delay = slot - now
+        if delay > 0:
+            logger.debug(f"Rate limiting {host}, sleeping {delay:.2f}s")
+            time.sleep(delay)
+
+
+class HostConcurrencyLimiter:
+    """Caps the requests in flight to each host across all threads,
+    also when several thread pools talk to the same host"""
+
+    def __init__(self, max_requests: int):
+        self.max_requests = max(1, max_requests)
+        self.lock = threading.Lock()
+        self.semaphores: dict[str, threading.BoundedSemaphore] = {}
+
+    @contextmanager
+    def slot(self, host: str) -> Iterator[None]:
+        """Hold one of the slots of host while the block runs"""
+        with self.lock:
+            semaphore = self.semaphores.get(host)
+            if semaphore is None:
+                semaphore = threading.BoundedSemaphore(self.max_requests)
+                self.semaphores[host] = semaphore
+        with semaphore:
+            yield
+
+
+# Shared by every thread in the process
+rate_limiter = HostRateLimiter(requests_per_second=config.requests_per_second_per_host)
+concurrency_limiter = HostConcurrencyLimiter(max_requests=config.max_requests_per_host)
@@ -0,0 +1,17 @@
+from datetime import datetime
+
+from pydantic import BaseModel
+
+
+class RelationOutcome(BaseModel):
+    """What happened to one relation when generating an osmChange"""
+
+    osm_id: int
+    qid: str
+    # One of skip, patch, mismatch or missing
+    outcome: str
+    version: int = 0
+    # The wikidata tag found in OSM, only set for mismatches
+    osm_wikidata: str = ""
+    # When the relation was fetched and classified, kept when reused
+    checked: datetime | None = None
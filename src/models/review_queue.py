@@ -0,0 +1,132 @@
+import logging
+import os
+from typing import Dict, Iterator, List, TextIO
+
+from pydantic import BaseModel
+from wikibaseintegrator import WikibaseIntegrator  # type: ignore
+from wikibaseintegrator.entities import ItemEntity  # type: ignore
+
+from src.exceptions import UnfinishedQueueError
+from src.models.trail_item import TrailItem
+from src.models.waymarked_result import WaymarkedResult
+
+logger = logging.getLogger(__name__)
+
+
+class ReviewQueueEntry(BaseModel):
+    """Everything a prepared TrailItem needs to be reviewed
+    without asking any API again"""
+
+    qid: str
+    label: str = ""
+    description: str = ""
+    entity: Dict
+    osm_wikidata_link_data: Dict = {}
+    # Candidates from Waymarked Trails with their similarity scores
+    waymarked_results: List[Dict] = []
+    prepared_waymarked_results: bool = False
+
+    @classmethod
+    def from_trail_item(cls, trail_item: TrailItem) -> "ReviewQueueEntry":
+        return cls(
+            qid=trail_item.qid,
+            label=trail_item.label,
+            description=trail_item.description,
+            entity=trail_item.entity_json,
+            osm_wikidata_link_data=trail_item.osm_wikidata_link_data,
+            waymarked_results=[
+                # The raw details are already parsed into the other fields
+                result.dict(exclude={"details"})
+                for result in trail_item.waymarked_results
+            ],
+            prepared_waymarked_results=trail_item.prepared_waymarked_results,
+        )
+
+    def to_trail_item(self, wbi: WikibaseIntegrator) -> TrailItem:
+        return TrailItem(
+            qid=self.qid,
+            wbi=wbi,
+            label=self.label,
+            description=self.description,
+            item=ItemEntity(api=wbi).from_json(self.entity),
+            entity_json=self.entity,
+            already_fetched_item_details=True,
+            osm_wikidata_link_data=self.osm_wikidata_link_data,
+            fetched_osm_wikidata_link_data=True,
+            waymarked_results=[
+                WaymarkedResult(**result) for result in self.waymarked_results
+            ],
+            prepared_waymarked_results=self.prepared_waymarked_results,
+        )
+
+
+class ReviewQueue:
+    """JSON lines file of prepared items written by the prepare mode
+    and read by the review mode.
+
+    The QIDs of reviewed entries are appended to a file next to the queue
+    so an interrupted review continues where it stopped. An earlier queue
+    with entries left to review is only replaced when overwrite is set."""
+
+    def __init__(self, path: str, overwrite: bool = False):
+        self.path = path
+        self.reviewed_path = f"{path}.reviewed"
+        self.overwrite = overwrite
+        self.file: TextIO | None = None
+
+    def unfinished(self) -> bool:
+        """True if an earlier queue has entries that are not reviewed yet"""
+        if not os.path.exists(self.path):
+            return False
+        return next(iter(self), None) is not None
+
+    def check_replaceable(self) -> None:
+        """Raise unless start() may discard the earlier queue"""
+        if not self.overwrite and self.unfinished():
+            raise UnfinishedQueueError(
+                f"{self.path} has items that are not reviewed yet, "
+                f"review them first or overwrite the queue with --overwrite"
+            )
+
+    def start(self) -> None:
+        """Start a new queue, discarding any earlier one and its progress"""
+        self.check_replaceable()
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.file = open(self.path, "w", encoding="utf-8")
+        if os.path.exists(self.reviewed_path):
+            os.remove(self.reviewed_path)
+
+    def append(self, entry: ReviewQueueEntry) -> None:
+        if self.file is None:
+            raise ValueError("the queue has not been started")
+        self.file.write(entry.json(ensure_ascii=False) + "\n")
+        self.file.flush()
+
+    def close(self) -> None:
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def reviewed_qids(self) -> set[str]:
+        if not os.path.exists(self.reviewed_path):
+            return set()
+        with open(self.reviewed_path, encoding="utf-8") as f:
+            return {line.strip() for line in f if line.strip()}
+
+    def mark_reviewed(self, qid: str) -> None:
+        with open(self.reviewed_path, "a", encoding="utf-8") as f:
+            f.write(qid + "\n")
+
+    def __iter__(self) -> Iterator[ReviewQueueEntry]:
+        """Yield the entries that have not been reviewed yet"""
+        reviewed = self.reviewed_qids()
+        with open(self.path, encoding="utf-8") as f:
+            for number, line in enumerate(f, start=1):
+                if not line.endswith("\n"):
+                    logger.warning(f"Ignoring incomplete queue line {number}")
+                    break
+                entry = ReviewQueueEntry.parse_raw(line)
+                if entry.qid not in reviewed:
+                    yield entry
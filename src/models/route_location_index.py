@@ -0,0 +1,134 @@
+import json
+import logging
+import math
+import os
+from functools import lru_cache
+from typing import Dict, List, Tuple
+
+import config
+from src.models.osm_extract_reader import OsmExtractReader
+
+logger = logging.getLogger(__name__)
+
+# min_lat, min_lon, max_lat, max_lon
+BoundingBox = Tuple[float, float, float, float]
+
+
+class RouteLocationIndex:
+    """Bounding boxes of route relations by OSM ID, so candidates can
+    be ranked by how far they are from the item. The distance to a route
+    is the distance to its box, 0 if the point is inside it."""
+
+    earth_radius_km = 6371.0
+
+    def __init__(self, boxes: Dict[int, BoundingBox] | None = None):
+        self.boxes: Dict[int, BoundingBox] = dict(boxes or {})
+
+    def __len__(self) -> int:
+        return len(self.boxes)
+
+    def add(self, osm_id: int, box: BoundingBox) -> None:
+        self.boxes[osm_id] = box
+
+    @classmethod
+    def __haversine_km__(
+        cls, lat1: float, lon1: float, lat2: float, lon2: float
+    ) -> float:
+        phi1, phi2 = math.radians(lat1), math.radians(lat2)
+        dphi = phi2 - phi1
+        dlambda = math.radians(lon2 - lon1)
+        a = (
+            math.sin(dphi / 2) ** 2
+            + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2) ** 2
+        )
+        return 2 * cls.earth_radius_km * math.asin(math.sqrt(a))
+
+    def distance_km(self, osm_id: int, lat: float, lon: float) -> float | None:
+        """Distance from the point to the box of the route or None
+        if we do not know where the route is"""
+        box = self.boxes.get(osm_id)
+        if box is None:
+            return None
+        min_lat, min_lon, max_lat, max_lon = box
+        # The closest point of the box
+        closest_lat = min(max(lat, min_lat), max_lat)
+        closest_lon = min(max(lon, min_lon), max_lon)
+        return self.__haversine_km__(lat, lon, closest_lat, closest_lon)
+
+    @classmethod
+    def build_from_extract(
+        cls, extract_path: str, routes: Tuple[str, ...] = ("hiking", "foot")
+    ) -> "RouteLocationIndex":
+        """Three streaming passes since the ways and nodes come before the
+        relations in an extract: the ways of the routes, their nodes and
+        then the coordinates of those nodes"""
+        reader = OsmExtractReader(extract_path)
+        route_ways: Dict[int, List[int]] = {}
+        for elem in reader.iter_elements({"relation"}):
+            tags = {tag.get("k"): tag.get("v") for tag in elem.findall("tag")}
+            if tags.get("route") in routes:
+                route_ways[int(elem.get("id", 0))] = [
+                    int(member.get("ref", 0))
+                    for member in elem.findall("member")
+                    if member.get("type") == "way"
+                ]
+        wanted_ways = {way for ways in route_ways.values() for way in ways}
+        way_nodes: Dict[int, List[int]] = {}
+        for elem in reader.iter_elements({"way"}):
+            way_id = int(elem.get("id", 0))
+            if way_id in wanted_ways:
+                way_nodes[way_id] = [int(nd.get("ref", 0)) for nd in elem.findall("nd")]
+        wanted_nodes = {node for nodes in way_nodes.values() for node in nodes}
+        coordinates: Dict[int, Tuple[float, float]] = {}
+        for elem in reader.iter_elements({"node"}):
+            node_id = int(elem.get("id", 0))
+            if node_id in wanted_nodes:
+                coordinates[node_id] = (
+                    float(elem.get("lat", 0)),
+                    float(elem.get("lon", 0)),
+                )
+        index = cls()
+        for osm_id, ways in route_ways.items():
+            points = [
+                coordinates[node]
+                for way in ways
+                for node in way_nodes.get(way, [])
+                if node in coordinates
+            ]
+            if points:
+                lats = [lat for lat, _ in points]
+                lons = [lon for _, lon in points]
+                index.add(osm_id, (min(lats), min(lons), max(lats), max(lons)))
+        logger.info(f"Located {len(index)}/{len(route_ways)} routes in {extract_path}")
+        return index
+
+    def save(self, path: str) -> None:
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({str(osm_id): box for osm_id, box in self.boxes.items()}, f)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "RouteLocationIndex":
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        return cls(boxes={int(osm_id): tuple(box) for osm_id, box in data.items()})
+
+
+@lru_cache(maxsize=None)
+def default_route_location_index() -> RouteLocationIndex | None:
+    """The index from config.route_location_index_path, loaded once"""
+    if not config.route_location_index_path:
+        return None
+    if not os.path.exists(config.route_location_index_path):
+        logger.warning(
+            f"Route location index {config.route_location_index_path} "
+            f"does not exist, build it with app_index.py"
+        )
+        return None
+    index = RouteLocationIndex.load(config.route_location_index_path)
+    logger.info(f"Loaded route location index with {len(index)} routes")
+    return index
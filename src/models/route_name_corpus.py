@@ -0,0 +1,53 @@
+import json
+import logging
+import os
+from typing import Iterable, List, Tuple
+
+from src.models.osm_extract_reader import OsmExtractReader
+from src.models.osm_relation import OSMRelation
+
+logger = logging.getLogger(__name__)
+
+
+class RouteNameCorpus:
+    """Names of the hiking route relations in OSM, used to match
+    many labels at once without asking Waymarked Trails"""
+
+    routes = ("hiking", "foot")
+
+    def __init__(self, names: List[Tuple[int, str]] | None = None):
+        # (relation id, name) pairs
+        self.names = names or []
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    @classmethod
+    def build_from_relations(
+        cls, relations: Iterable[OSMRelation]
+    ) -> "RouteNameCorpus":
+        corpus = cls()
+        for relation in relations:
+            name = relation.tags.get("name", "")
+            if name and relation.tags.get("route") in cls.routes:
+                corpus.names.append((relation.id, name))
+        logger.info(f"Collected {len(corpus)} route names")
+        return corpus
+
+    @classmethod
+    def build_from_extract(cls, extract_path: str) -> "RouteNameCorpus":
+        return cls.build_from_relations(OsmExtractReader(extract_path).iter_relations())
+
+    def save(self, path: str) -> None:
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.names, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "RouteNameCorpus":
+        with open(path, encoding="utf-8") as f:
+            return cls(names=[(int(osm_id), name) for osm_id, name in json.load(f)])
@@ -0,0 +1,217 @@
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, Iterator, List
+
+from src.console import console
+from src.enums import Phase
+
+logger = logging.getLogger(__name__)
+
+
+class Measurement:
+    """Handed out by RunMetrics.measure() so the caller can add the
+    size of the body once it has it and flag error answers"""
+
+    __slots__ = ("bytes", "error")
+
+    def __init__(self):
+        self.bytes = 0
+        self.error = False
+
+
+class PhaseMetrics:
+    """Calls, errors, bytes and a latency histogram of one phase"""
+
+    # Upper bounds of the histogram buckets in seconds, the last one is open
+    buckets = (0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.bytes = 0
+        self.seconds = 0.0
+        self.max_seconds = 0.0
+        self.histogram: List[int] = [0] * (len(self.buckets) + 1)
+
+    def add(self, seconds: float, bytes_: int = 0, error: bool = False) -> None:
+        self.count += 1
+        self.errors += int(error)
+        self.bytes += bytes_
+        self.seconds += seconds
+        self.max_seconds = max(self.max_seconds, seconds)
+        for index, bound in enumerate(self.buckets):
+            if seconds <= bound:
+                self.histogram[index] += 1
+                return
+        self.histogram[-1] += 1
+
+    def quantile(self, q: float) -> float:
+        """The upper bound of the bucket the quantile falls in,
+        never more than the slowest call"""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for index, bucket_count in enumerate(self.histogram[:-1]):
+            seen += bucket_count
+            if seen >= rank:
+                return float(min(self.buckets[index], self.max_seconds))
+        return float(self.max_seconds)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "count": self.count,
+            "errors": self.errors,
+            "bytes": self.bytes,
+            "seconds": round(self.seconds, 3),
+            "max_seconds": round(self.max_seconds, 3),
+            "p50_seconds": round(self.quantile(0.5), 3),
+            "p90_seconds": round(self.quantile(0.9), 3),
+            "histogram": {
+                **{str(bound): n for bound, n in zip(self.buckets, self.histogram)},
+                "inf": self.histogram[-1],
+            },
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "PhaseMetrics":
+        phase = cls()
+        phase.count = data["count"]
+        phase.errors = data["errors"]
+        phase.bytes = data["bytes"]
+        phase.seconds = data["seconds"]
+        phase.max_seconds = data["max_seconds"]
+        phase.histogram = [
+            data["histogram"].get(str(bound), 0) for bound in cls.buckets
+        ] + [data["histogram"].get("inf", 0)]
+        return phase
+
+    def merge(self, other: "PhaseMetrics") -> None:
+        self.count += other.count
+        self.errors += other.errors
+        self.bytes += other.bytes
+        self.seconds += other.seconds
+        self.max_seconds = max(self.max_seconds, other.max_seconds)
+        self.histogram = [a + b for a, b in zip(self.histogram, other.histogram)]
+
+
+class RunMetrics:
+    """Latency, call, byte and error counters per phase of a run, so we
+    can see if the network or the reviewer is the bottleneck.
+
+    The think time is the time a prompt waits for the reviewer.
+    Bytes are counted where the body is at hand, the entity fetches and
+    writes go through WikibaseIntegrator so they have none."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started = time.monotonic()
+        self.phases: Dict[Phase, PhaseMetrics] = {}
+
+    def reset(self) -> None:
+        with self.lock:
+            self.started = time.monotonic()
+            self.phases = {}
+
+    def record(
+        self, phase: Phase, seconds: float, bytes_: int = 0, error: bool = False
+    ) -> None:
+        with self.lock:
+            self.phases.setdefault(phase, PhaseMetrics()).add(seconds, bytes_, error)
+
+    @contextmanager
+    def measure(self, phase: Phase) -> Iterator[Measurement]:
+        """Time the block and count it as an error if it raises"""
+        measurement = Measurement()
+        start = time.perf_counter()
+        try:
+            yield measurement
+        except BaseException:
+            self.record(
+                phase, time.perf_counter() - start, measurement.bytes, error=True
+            )
+            raise
+        self.record(
+            phase, time.perf_counter() - start, measurement.bytes, measurement.error
+        )
+
+    def stream(self, phase: Phase, chunks: Iterable[str]) -> Iterator[str]:
+        """Pass the chunks of a streamed body through. The latency is the
+        time to the first chunk because the rest is read as fast as the
+        caller consumes it, which includes the time spent on the items"""
+        start = time.perf_counter()
+        latency = None
+        size = 0
+        error = False
+        try:
+            for chunk in chunks:
+                if latency is None:
+                    latency = time.perf_counter() - start
+                size += len(chunk.encode("utf-8"))
+                yield chunk
+        except Exception:
+            error = True
+            raise
+        finally:
+            # Also when the caller stops reading early
+            if latency is None:
+                latency = time.perf_counter() - start
+            self.record(phase, latency, size, error)
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        with self.lock:
+            return {
+                phase.value: self.phases[phase].to_dict()
+                for phase in Phase
+                if phase in self.phases
+            }
+
+    def merge(self, stats: Dict[str, Dict[str, Any]]) -> None:
+        """Add the stats of a worker process"""
+        with self.lock:
+            for name, data in stats.items():
+                self.phases.setdefault(Phase(name), PhaseMetrics()).merge(
+                    PhaseMetrics.from_dict(data)
+                )
+
+    def log_summary(self) -> None:
+        stats = self.stats()
+        if not stats:
+            return
+        elapsed = max(time.monotonic() - self.started, 0.001)
+        console.print(f"Time per phase of this run of {elapsed:.0f}s:")
+        for name, phase in stats.items():
+            mean = phase["seconds"] / phase["count"] if phase["count"] else 0
+            console.print(
+                f"{name}: {phase['count']} calls, {phase['seconds']:.1f}s "
+                f"({phase['seconds'] / elapsed:.0%}), mean {mean:.2f}s, "
+                f"p50 {phase['p50_seconds']:.2f}s, p90 {phase['p90_seconds']:.2f}s, "
+                f"max {phase['max_seconds']:.2f}s, {phase['bytes']} bytes, "
+                f"{phase['errors']} errors"
+            )
+
+    def save(self, path: str, **run: Any) -> None:
+        """Append the stats as one JSON line with the given run details"""
+        if not path:
+            return
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        entry = {
+            "time": datetime.now(tz=timezone.utc).isoformat(timespec="seconds"),
+            **run,
+            "elapsed_seconds": round(time.monotonic() - self.started, 3),
+            "phases": self.stats(),
+        }
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry) + "\n")
+        logger.info(f"Wrote the metrics of this run to {path}")
+
+
+# One instance per process shared by all the models of a run
+run_metrics = RunMetrics()
@@ -0,0 +1,152 @@
+import logging
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import get_context
+from typing import Dict, List
+
+from pydantic import BaseModel
+
+import config
+from src.console import console
+from src.models.enrich_hiking_trails import EnrichHikingTrails
+from src.models.review_queue import ReviewQueue
+from src.models.route_name_corpus import RouteNameCorpus
+from src.models.run_metrics import run_metrics
+from src.models.worker_environment import per_host_limits, worker_environment
+
+logger = logging.getLogger(__name__)
+
+
+class Shard(BaseModel):
+    """One country and label language of a sharded run"""
+
+    country_qid: str
+    language_code: str
+
+    @classmethod
+    def parse(cls, value: str) -> "Shard":
+        """Parse COUNTRY_QID:LANGUAGE_CODE, e.g. Q34:sv"""
+        country_qid, separator, language_code = value.strip().partition(":")
+        if not separator or not country_qid.startswith("Q") or not language_code:
+            raise ValueError(f"expected COUNTRY_QID:LANGUAGE_CODE, got '{value}'")
+        return cls(country_qid=country_qid, language_code=language_code)
+
+    @classmethod
+    def parse_list(cls, value: str) -> List["Shard"]:
+        return [cls.parse(part) for part in value.split(",") if part.strip()]
+
+    @property
+    def queue_path(self) -> str:
+        return f"output/review-queue-{self.language_code}-{self.country_qid}.jsonl"
+
+    @property
+    def matches_path(self) -> str:
+        return f"output/label-matches-{self.language_code}-{self.country_qid}.jsonl"
+
+    def output_path(self, mode: str) -> str:
+        return self.queue_path if mode == "prepare" else self.matches_path
+
+    def __str__(self) -> str:
+        return f"{self.country_qid}:{self.language_code}"
+
+
+class ShardResult(BaseModel):
+    shard: Shard
+    output_path: str
+    # Items written to the queue or items with candidates
+    count: int = 0
+    seconds: float = 0
+    # Exceptions of the workers are not always picklable
+    error: str = ""
+
+
+def run_shard(mode: str, shard: Shard, overwrite: bool = False) -> ShardResult:
+    """Run the prepare or match mode for one shard in a worker process"""
+    # A worker can be handed several shards, report each one on its own
+    run_metrics.reset()
+    config.country_qid = shard.country_qid
+    config.language_code = shard.language_code
+    start = time.perf_counter()
+    eht = EnrichHikingTrails()
+    output_path = shard.output_path(mode)
+    result = ShardResult(shard=shard, output_path=output_path)
+    try:
+        if mode == "prepare":
+            result.count = eht.prepare_review_queue(
+                queue=ReviewQueue(output_path, overwrite=overwrite)
+            )
+        elif mode == "match":
+            result.count = eht.match_labels_in_bulk(
+                corpus=RouteNameCorpus.load(config.route_name_corpus_path),
+                output_path=output_path,
+            )
+        else:
+            raise ValueError(f"{mode} cannot be sharded")
+    except Exception as e:
+        logger.exception(f"Shard {shard} failed")
+        result.error = f"{type(e).__name__}: {e}"
+    result.seconds = time.perf_counter() - start
+    return result
+
+
+class ShardRunner:
+    """Runs the headless modes for several countries and languages
+    in parallel worker processes.
+
+    The workers use the same HTTP cache and relation store. They are
+    started with the per-host limits divided between them so the whole
+    run is as polite as a single one. Each shard writes its own output
+    and run log entry."""
+
+    modes = ("prepare", "match")
+
+    def __init__(
+        self,
+        shards: List[Shard],
+        workers: int = config.shard_workers,
+        overwrite: bool = False,
+    ):
+        self.shards = shards
+        self.workers = max(1, min(workers, len(shards)))
+        # Replace review queues that still have unreviewed items
+        self.overwrite = overwrite
+
+    def __worker_environment__(self) -> Dict[str, str]:
+        return {
+            **per_host_limits(processes=self.workers),
+            "PREPARE_WORKERS": str(max(1, config.prepare_workers // self.workers)),
+        }
+
+    def run(self, mode: str) -> List[ShardResult]:
+        if mode not in self.modes:
+            raise ValueError(f"{mode} cannot be sharded")
+        if mode == "prepare":
+            # Refuse before any worker starts instead of failing some shards
+            for shard in self.shards:
+                ReviewQueue(
+                    shard.queue_path, overwrite=self.overwrite
+                ).check_replaceable()
+        console.print(
+            f"Running {mode} for {len(self.shards)} shards "
+            f"in {self.workers} processes"
+        )
+        results: List[ShardResult] = []
+        with worker_environment(self.__worker_environment__()):
+            with ProcessPoolExecutor(
+                max_workers=self.workers, mp_context=get_context("spawn")
+            ) as executor:
+                futures = [
+                    executor.submit(run_shard, mode, shard, self.overwrite)
+                    for shard in self.shards
+                ]
+                for future in as_completed(futures):
+                    result = future.result()
+                    if result.error:
+                        console.print(f"Shard {result.shard} failed: {result.error}")
+                    else:
+                        console.print(
+                            f"Shard {result.shard} done in {result.seconds:.0f}s: "
+                            f"{result.count} items in {result.output_path}"
+                        )
+                    results.append(result)
+        return results
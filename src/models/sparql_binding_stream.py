@@ -0,0 +1,112 @@
+import json
+import logging
+import threading
+from collections import deque
+from typing import Any, Deque, Dict, Iterable, Iterator
+
+logger = logging.getLogger(__name__)
+
+
+class SparqlBindingStream:
+    """Yields the bindings of a SPARQL JSON result while it is read.
+
+    The chunks can be split anywhere. Only the binding being decoded
+    and the rest of the current chunk are kept in memory."""
+
+    whitespace = " \t\r\n,"
+
+    def __init__(self, chunks: Iterable[str]):
+        self.chunks = iter(chunks)
+        self.buffer = ""
+        self.count = 0
+
+    def __read__(self) -> bool:
+        chunk = next(self.chunks, None)
+        if chunk is None:
+            return False
+        self.buffer += chunk
+        return True
+
+    def __skip_to_bindings__(self) -> None:
+        while True:
+            start = self.buffer.find('"bindings"')
+            if start != -1:
+                bracket = self.buffer.find("[", start)
+                if bracket != -1:
+                    self.buffer = self.buffer[bracket + 1 :]
+                    return
+            if not self.__read__():
+                raise ValueError("the SPARQL result has no bindings")
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        decoder = json.JSONDecoder()
+        self.__skip_to_bindings__()
+        position = 0
+        while True:
+            while position < len(self.buffer) and self.buffer[position] in (
+                self.whitespace
+            ):
+                position += 1
+            if position < len(self.buffer):
+                if self.buffer[position] == "]":
+                    logger.debug(f"Read {self.count} bindings")
+                    return
+                try:
+                    binding, position = decoder.raw_decode(self.buffer, position)
+                except json.JSONDecodeError:
+                    # Incomplete, wait for the next chunk
+                    pass
+                else:
+                    self.count += 1
+                    yield binding
+                    continue
+            self.buffer = self.buffer[position:]
+            position = 0
+            if not self.__read__():
+                raise ValueError(f"the SPARQL result ended after {self.count} bindings")
+
+
+class BackgroundBindingReader:
+    """Reads the bindings of a SPARQL result into a deque in a background
+    thread while they are yielded.
+
+    The response is read as fast as it arrives instead of as fast as the
+    reviewer answers, so the connection is not kept open for the whole
+    session. An error while reading is raised when the bindings read
+    before it are used up."""
+
+    def __init__(self, chunks: Iterable[str]):
+        self.bindings: Deque[Dict[str, Any]] = deque()
+        self.arrived = threading.Condition()
+        self.done = False
+        self.error: BaseException | None = None
+        self.thread = threading.Thread(
+            target=self.__read__, args=(chunks,), name="sparql-reader", daemon=True
+        )
+        self.thread.start()
+
+    def __read__(self, chunks: Iterable[str]) -> None:
+        try:
+            for binding in SparqlBindingStream(chunks):
+                with self.arrived:
+                    self.bindings.append(binding)
+                    self.arrived.notify()
+        except BaseException as e:
+            self.error = e
+        finally:
+            with self.arrived:
+                self.done = True
+                self.arrived.notify()
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        while True:
+            with self.arrived:
+                while not self.bindings and not self.done:
+                    self.arrived.wait()
+                if self.bindings:
+                    binding = self.bindings.popleft()
+                elif self.error is not None:
+                    raise self.error
+                else:
+                    return
+            yield binding
@@ -1,13 +1,13 @@
 import json
 import logging
 import textwrap
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
-from typing import Dict, List
+from typing import ClassVar, Dict, List
 from urllib.parse import quote
 
 import pydash
 import questionary
-import requests
 from dateutil.parser import parse  # type: ignore
 from dateutil.tz import tzutc  # type: ignore
 from questionary import Choice
@@ -24,24 +24,40 @@ from wikibaseintegrator.wbi_enums import (  # type: ignore
 
 import config
 from src.console import console
-from src.enums import ItemEnum, OsmIdSource, Property, Status
+from src.enums import ItemEnum, OsmIdSource, Phase, Property, Status
 from src.exceptions import NoItemError, QidException, SummaryError
+from src.models.http_cache import http_cache
+from src.models.http_transport import transport
+from src.models.osm_relation_lookup import OsmRelationLookup, relation_lookup
 from src.models.osm_wikidata_link_result import OsmWikidataLinkResult
 from src.models.osm_wikidata_link_return import OsmWikidataLinkReturn
 from src.models.project_base_model import ProjectBaseModel
 from src.models.questionary_return import QuestionaryReturn
+from src.models.rate_limiter import concurrency_limiter
+from src.models.route_location_index import (
+    RouteLocationIndex,
+    default_route_location_index,
+)
+from src.models.run_metrics import run_metrics
+from src.models.waymarked_candidate import WaymarkedCandidate
 from src.models.waymarked_result import WaymarkedResult
+from src.models.wikidata_tag_index import default_wikidata_tag_index
 from src.models.wikidata_time_format import WikidataTimeFormat
+from src.models.wikidata_write_queue import WikidataWriteQueue
 
 logger = logging.getLogger(__name__)
 osm_wikidata_link = "OSM Wikidata Link"
 
 
 class TrailItem(ProjectBaseModel):
+    # Search results before scoring, see WaymarkedCandidate
+    waymarked_candidates: List[WaymarkedCandidate] = []
     waymarked_results: List[WaymarkedResult] = []
     choices: List[Choice] = []
     label: str = ""
     item: ItemEntity | None = None
+    # The filtered wbgetentities data of a prefetched item
+    entity_json: Dict = dict()
     description: str = ""
     wbi: WikibaseIntegrator
     qid: str = ""
@@ -52,11 +68,17 @@ class TrailItem(ProjectBaseModel):
     osm_wikidata_link_match_prompt_return: Status | None = None
     osm_wikidata_link_data: Dict = dict()
     already_fetched_item_details: bool = False
+    # Set by prepare() so the interactive steps can skip the network calls
+    fetched_osm_wikidata_link_data: bool = False
+    prepared_waymarked_results: bool = False
     osm_id_source: OsmIdSource | None = None
     chosen_osm_id: int = 0
     last_update: datetime | None = None
     summary: str = ""
     testing: bool = False
+    # Edits are written in the background if set
+    write_queue: WikidataWriteQueue | None = None
+    lookup: ClassVar[OsmRelationLookup] = relation_lookup
 
     class Config:
         arbitrary_types_allowed = True
@@ -64,7 +86,7 @@ class TrailItem(ProjectBaseModel):
     @property
     def naturkartan_url(self) -> str:
         if self.item:
-            nk_claim = self.item.claims.get(property="P10467")
+            nk_claim = self.item.claims.get(property=Property.NATURKARTAN_ID.value)
             if nk_claim:
                 return f'https://api.naturkartan.se/{nk_claim[0].mainsnak.datavalue["value"]}'
         return ""
@@ -73,11 +95,23 @@ class TrailItem(ProjectBaseModel):
     def has_osm_way_property(self) -> bool:
         if not self.item:
             raise NoItemError()
-        if self.item.claims.get(property="P10689"):
+        if self.item.claims.get(property=Property.OSM_WAY_ID.value):
             return True
         else:
             return False
 
+    @property
+    def coordinates(self) -> tuple[float, float] | None:
+        """Latitude and longitude of the first coordinate location"""
+        if not self.item:
+            raise NoItemError()
+        for claim in self.item.claims.get(property=Property.COORDINATE_LOCATION.value):
+            datavalue = claim.mainsnak.datavalue
+            if datavalue:
+                value = datavalue["value"]
+                return value["latitude"], value["longitude"]
+        return None
+
     @property
     def open_in_josm_urls(self) -> str:
         if self.osm_ids:
@@ -106,10 +140,17 @@ class TrailItem(ProjectBaseModel):
                 title += f" ({result.id})"
             if result.ref:
                 title += f", ref: {result.ref}"
-            if result.number_of_subroutes:
-                title += f", subroutes #: {result.number_of_subroutes}"
-            if result.names_of_subroutes_as_string:
-                title += f", subroutes: {result.names_of_subroutes_as_string}"
+            # Candidates below the cap are shown in compact form
+            # until the user asks for their details
+            if result.details_loaded:
+                if result.number_of_subroutes:
+                    title += f", subroutes #: {result.number_of_subroutes}"
+                if result.names_of_subroutes_as_string:
+                    title += f", subroutes: {result.names_of_subroutes_as_string}"
+            else:
+                title += f", similarity: {result.similarity:.2f}"
+            if result.distance_km is not None:
+                title += f", distance: {result.distance_km:.0f} km"
             # if result.description:
             #     title += f", description: {result.description}"
             if result.group:
@@ -130,21 +171,20 @@ class TrailItem(ProjectBaseModel):
         else:
             logger.debug("Excluded relation that already has Wikidata tag")
 
-    def __remove_waymaked_result_duplicates__(self):
-        self.waymarked_results = list(set(self.waymarked_results))
-        logger.debug(f"Results after deduplication: {len(self.waymarked_results)}")
-
     # def __clear_attributes__(self):
     #     self.waymarked_results = self.choices = []
     #     self.label = self.qid = self.description = ""
     #     self.item = None
 
     def __get_item_details__(self):
-        """Get the details we need from Wikidata"""
+        """Get the details we need from Wikidata unless the
+        entity was already prefetched by EnrichHikingTrails"""
         if not self.already_fetched_item_details:
-            if not self.wbi:
-                raise ValueError("self.wbi missing")
-            self.item = self.wbi.item.get(self.qid)
+            if not self.item:
+                if not self.wbi:
+                    raise ValueError("self.wbi missing")
+                with run_metrics.measure(Phase.ENTITY_FETCH):
+                    self.item = self.wbi.item.get(self.qid)
             if self.item:
                 label = self.item.labels.get(config.language_code)
                 if label:
@@ -223,26 +263,64 @@ class TrailItem(ProjectBaseModel):
                 f"was empty in the chosen language"
             )
             if not self.testing:
-                console.input("Press enter to continue")
+                with run_metrics.measure(Phase.THINK_TIME):
+                    console.input("Press enter to continue")
             return
         if not isinstance(self.label, str):
             raise TypeError("self.label was not a str")
         logger.info(f"looking up: {self.label}")
-        self.__fetch_waymarked_data__()
-        self.__remove_waymaked_result_duplicates__()
-        self.__filter_waymarked_results_by_similarity__()
-        self.__get_details_from_waymarked_trails__()
+        if not self.prepared_waymarked_results:
+            self.__prepare_waymarked_results__()
         self.__prepare_choices__()
-        # the last 3 choices are not matchable
-        if len(self.choices) > 3:
+        if self.waymarked_results:
             self.questionary_return = self.__ask_question__()
         else:
             # Assuming no match because we got nothing from WT API
             self.__set_no_match__()
 
+    def __prepare_waymarked_results__(self, verbose: bool = True) -> None:
+        self.__fetch_waymarked_data__()
+        self.__filter_waymarked_results_by_similarity__(verbose=verbose)
+        self.__filter_waymarked_results_by_distance__()
+        self.__get_details_from_waymarked_trails__()
+        self.prepared_waymarked_results = True
+
+    def prepare(self, complete: bool = False) -> None:
+        """Do all the network calls needed before prompting the user
+        without printing or asking anything. This is run in the background
+        for the next items while the user answers the prompts of the current one.
+
+        Waymarked Trails is only searched if OSM Wikidata Link has no
+        relation for the item, because otherwise the user might never need it.
+        With complete=True it is also searched when there is a single relation
+        the user might decline, so the review needs no network at all.
+        """
+        self.__get_item_details__()
+        self.__fetch_osm_wikidata_link_data__()
+        relations = [
+            osm_object
+            for osm_object in self.osm_wikidata_link_data.get("osm") or []
+            if osm_object.get("type") == "relation"
+        ]
+        if len(relations) > 1 or (relations and not complete):
+            return
+        if self.label and not self.has_osm_way_property:
+            self.__prepare_waymarked_results__(verbose=False)
+
     def __prepare_choices__(self):
         logger.debug(f"Preparing {len(self.waymarked_results)} results")
         self.__convert_waymarked_results_to_choices__()
+        compact = [
+            result for result in self.waymarked_results if not result.details_loaded
+        ]
+        if compact:
+            self.choices.append(
+                Choice(
+                    title=f"Show the details of the {len(compact)} "
+                    f"candidates in compact form",
+                    value=QuestionaryReturn(expand=True),
+                )
+            )
         self.choices.append(
             Choice(
                 title="Unable to decide whether these match, show me more information",
@@ -259,15 +337,19 @@ class TrailItem(ProjectBaseModel):
         # present the result to the user to choose from
         if not self.item:
             raise NoItemError()
-        return_ = questionary.select(
-            (
-                f"Which of these match '{self.label}' "
-                f"with description '{self.description}'?\n"
-                f"(see {self.item.get_entity_url()} and \n"
-                f"{self.naturkartan_url})"
-            ),
-            choices=self.choices,
-        ).ask()  # returns value of selection or None if user cancels
+        with run_metrics.measure(Phase.THINK_TIME):
+            return_ = questionary.select(
+                (
+                    f"Which of these match '{self.label}' "
+                    f"with description '{self.description}'?\n"
+                    f"(see {self.item.get_entity_url()} and \n"
+                    f"{self.naturkartan_url})"
+                ),
+                choices=self.choices,
+            ).ask()  # returns value of selection or None if user cancels
+        if isinstance(return_, QuestionaryReturn) and return_.expand:
+            self.__expand_candidates__()
+            return self.__ask_question__()
         if isinstance(return_, QuestionaryReturn):
             return return_
         else:
@@ -276,30 +358,31 @@ class TrailItem(ProjectBaseModel):
 
     def __fetch_waymarked_data__(self) -> None:
         """
-        Fetch raw data from Waymarked Trails API and store it in self.waymarked_results
-        as WaymarkedResult instances.
+        Fetch raw data from Waymarked Trails API and store it in
+        self.waymarked_candidates as WaymarkedCandidate instances.
         """
         url = (
             f"https://hiking.waymarkedtrails.org/api/v1/list/search?query={self.label}"
         )
-        response = requests.get(url=url, timeout=config.request_timeout)
+        with concurrency_limiter.slot(WaymarkedResult.host):
+            with run_metrics.measure(Phase.WT_SEARCH) as measurement:
+                status_code, content = http_cache.get(
+                    url, ttl_seconds=config.waymarked_search_ttl_hours * 3600
+                )
+                measurement.bytes = len(content)
+                measurement.error = status_code != 200
 
-        if response.status_code != 200:
+        if status_code != 200:
             raise RuntimeError(
-                f"Waymarked Trails API returned status code {response.status_code}"
+                f"Waymarked Trails API returned status code {status_code}"
             )
 
-        data = response.json()
+        data = json.loads(content)
 
         if config.loglevel == logging.DEBUG and config.debug_json:
             console.print(data)
 
-        # Parse each item into a WaymarkedResult before storing
-        self.waymarked_results = [
-            WaymarkedResult(**item)
-            for item in data.get("results", [])
-            if isinstance(item, dict)
-        ]
+        self.waymarked_candidates = WaymarkedCandidate.parse_results(data)
 
     @staticmethod
     def __clean_name__(name: str) -> str:
@@ -315,29 +398,35 @@ class TrailItem(ProjectBaseModel):
         filtered = [w for w in words if w not in config.EXCLUDED_TERM_WORDS]
         return " ".join(filtered)
 
-    def __filter_waymarked_results_by_similarity__(self) -> None:
+    def __filter_waymarked_results_by_similarity__(self, verbose: bool = True) -> None:
         """
-        Process self.waymarked_results: remove term words from names,
+        Process self.waymarked_candidates: remove term words from names,
         filter by similarity, sort, and store in self.waymarked_results.
         """
 
         results = []
-        if self.waymarked_results:
-            logger.info(f"Got {len(self.waymarked_results)} from WT")
+        if self.waymarked_candidates:
+            logger.info(f"Got {len(self.waymarked_candidates)} from WT")
             label_clean = self.__clean_name__(self.label)
-            for item in self.waymarked_results:
+            for item in self.waymarked_candidates:
                 item_name_clean = self.__clean_name__(item.name)
                 # Use token_sort_ratio so that word order doesn't matter
                 # e.g. "falerum åtvidaberg" == "åtvidaberg falerum" → 1.0
                 # but avoid false positives from subsets
                 # e.g. "glotternskogen lilla älgsjön" vs "lilla" → 0.36 (not 1.0)
                 similarity = fuzz.token_sort_ratio(label_clean, item_name_clean) / 100
-                print(
+                message = (
                     f"Similarity for '{label_clean}' -> "
                     + f"'{item_name_clean}': {similarity:.2f}"
                 )
+                if verbose:
+                    print(message)
+                else:
+                    logger.debug(message)
                 if similarity >= config.min_similarity:
-                    results.append((similarity, item))
+                    results.append(
+                        (similarity, item.to_waymarked_result(similarity=similarity))
+                    )
         else:
             logger.info("Got no results from Waymarked trails")
 
@@ -348,16 +437,71 @@ class TrailItem(ProjectBaseModel):
 
         # Store the filtered and sorted results
         self.waymarked_results = [res for _, res in results]
+        self.waymarked_candidates = []
         logger.debug(f"Found {len(results)} similar results from waymarked trails")
         # pprint(self.waymarked_results)
 
+    @staticmethod
+    def __route_location_index__() -> RouteLocationIndex | None:
+        return default_route_location_index()
+
+    def __filter_waymarked_results_by_distance__(self) -> None:
+        """Drop the candidates farther than config.candidate_radius_km
+        from the item before fetching any details. Candidates missing
+        from the route location index are kept."""
+        if not config.candidate_radius_km or not self.waymarked_results:
+            return
+        coordinates = self.coordinates if self.item else None
+        index = self.__route_location_index__()
+        if not coordinates or not index:
+            return
+        lat, lon = coordinates
+        results = []
+        for result in self.waymarked_results:
+            result.distance_km = index.distance_km(result.id, lat, lon)
+            if (
+                result.distance_km is not None
+                and result.distance_km > config.candidate_radius_km
+            ):
+                logger.debug(
+                    f"Dropped {result.name} ({result.id}) "
+                    f"{result.distance_km:.0f} km away"
+                )
+                continue
+            results.append(result)
+        logger.debug(
+            f"Kept {len(results)}/{len(self.waymarked_results)} candidates "
+            f"within {config.candidate_radius_km} km"
+        )
+        self.waymarked_results = results
+
     def __get_details_from_waymarked_trails__(self) -> None:
-        updated_results = []
+        """Fetch the details of the best candidates at once and the wikidata
+        tags of all of them in one request to OSM. The rest of the details
+        are fetched if the user asks for them."""
+        if not self.waymarked_results:
+            return
+        self.__load_details__(self.waymarked_results[: config.max_detailed_candidates])
+        relations = self.lookup.get_relations(
+            [result.id for result in self.waymarked_results]
+        )
         for result in self.waymarked_results:
-            result_copy = result.copy()
-            result_copy.get_details()
-            updated_results.append(result_copy)
-        self.waymarked_results = updated_results
+            result.set_wikidata_tag(relation=relations.get(result.id))
+
+    @staticmethod
+    def __load_details__(results: List[WaymarkedResult]) -> None:
+        results = [result for result in results if not result.details_loaded]
+        if not results:
+            return
+        workers = min(config.max_requests_per_host, len(results))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            # list() to wait for them and raise any error here
+            list(executor.map(WaymarkedResult.get_details, results))
+
+    def __expand_candidates__(self) -> None:
+        self.__load_details__(self.waymarked_results)
+        self.choices = []
+        self.__prepare_choices__()
 
     def fetch_and_lookup_from_waymarked_trails_and_present_choice_to_user(self):
         """We collect all the information and help
@@ -420,14 +564,26 @@ class TrailItem(ProjectBaseModel):
                         print("Please validate that this json looks okay")
                         if config.loglevel == logging.DEBUG and config.debug_json:
                             console.print(self.item.get_json())
-                        console.input("Press enter to upload or ctrl+c to quit")
+                        with run_metrics.measure(Phase.THINK_TIME):
+                            console.input("Press enter to upload or ctrl+c to quit")
                     if self.summary:
-                        self.item.write(summary=self.summary)
                         message = f"Upload done, see {self.item.get_entity_url()} "
                         if self.questionary_return.osm_id:
                             message += "and https://hiking.waymarkedtrails.org/"
                             message += f"#route?id={self.questionary_return.osm_id}"
-                        console.print(message)
+                        if self.write_queue:
+                            self.write_queue.put(
+                                qid=self.qid,
+                                data=self.item.get_json(),
+                                summary=self.summary,
+                                message=message,
+                                baserevid=self.item.lastrevid or 0,
+                            )
+                            console.print("Edit queued for upload")
+                        else:
+                            with run_metrics.measure(Phase.WIKIDATA_WRITE):
+                                self.item.write(summary=self.summary)
+                            console.print(message)
                     else:
                         raise SummaryError()
                 else:
@@ -468,22 +624,37 @@ class TrailItem(ProjectBaseModel):
 
     def lookup_using_osm_wikidata_link(self) -> None:
         """Lookup first in OSM
-        See documentation here https://osm.wikidata.link/tagged/"""
+        See documentation here https://osm.wikidata.link/tagged/
+        If a local wikidata tag index is configured we use that instead"""
+        self.__fetch_osm_wikidata_link_data__()
+        self.__parse_response_from_osm_wikidata_link__()
+
+    def __fetch_osm_wikidata_link_data__(self) -> None:
+        if self.fetched_osm_wikidata_link_data:
+            return
+        index = default_wikidata_tag_index()
+        if index:
+            logger.debug(f"Looking up {self.qid} in the local wikidata tag index")
+            self.osm_wikidata_link_data = index.lookup(self.qid)
+            self.fetched_osm_wikidata_link_data = True
+            return
         logger.debug(
             f"Looking up in OSM Wikidata Link, see {self.osm_wikidata_link_url}"
         )
-        result = requests.get(
-            self.osm_wikidata_link_url,
-            timeout=config.request_timeout,
-            # cert expired
-            verify=False,
-        )
+        with run_metrics.measure(Phase.OSM_WIKIDATA_LINK) as measurement:
+            result = transport.get(
+                self.osm_wikidata_link_url,
+                # cert expired
+                verify=False,
+            )
+            measurement.bytes = len(result.content)
+            measurement.error = result.status_code != 200
         if result.status_code == 200:
             data = result.json()
             if config.loglevel == logging.DEBUG and config.debug_json:
                 console.print(data)
             self.osm_wikidata_link_data = data
-            self.__parse_response_from_osm_wikidata_link__()
+            self.fetched_osm_wikidata_link_data = True
         else:
             raise Exception(f"Got {result.status_code} from the API")
 
@@ -534,7 +705,8 @@ class TrailItem(ProjectBaseModel):
                 f"Does the above match '{self.label}' "
                 f"(description missing) in Wikidata?(Y/n)"
             )
-        answer = console.input(question)
+        with run_metrics.measure(Phase.THINK_TIME):
+            answer = console.input(question)
         if answer == "" or answer.lower() == "y":
             # we got enter/yes
             self.osm_id_source = OsmIdSource.OSM_WIKIDATA_LINK
@@ -569,7 +741,8 @@ class TrailItem(ProjectBaseModel):
             f"{self.open_in_josm_urls}"
         )
         if not self.testing:
-            console.input("Press enter to continue")
+            with run_metrics.measure(Phase.THINK_TIME):
+                console.input("Press enter to continue")
         self.osm_wikidata_link_return = OsmWikidataLinkReturn(multiple_matches=True)
 
     def __handle_single_match__(self):
@@ -623,13 +796,17 @@ class TrailItem(ProjectBaseModel):
 
     def time_to_check_again(self) -> bool:
         logger.debug("time_to_check_again: running")
-        if self.last_update:
+        return self.is_due(last_update=self.last_update)
+
+    @staticmethod
+    def is_due(last_update: datetime | None) -> bool:
+        if last_update:
             latest_date_for_new_check = datetime.now(tz=tzutc()) - timedelta(
                 days=config.max_days_between_new_check
             )
-            if latest_date_for_new_check > self.last_update:
+            if latest_date_for_new_check > last_update:
                 # Maximum number of days passed, let's check again
-                logger.info(f"Time to check again based on {self.last_update}")
+                logger.info(f"Time to check again based on {last_update}")
                 return True
             else:
                 return False
@@ -640,6 +817,16 @@ class TrailItem(ProjectBaseModel):
             )
             return True
 
+    def release(self) -> None:
+        """Drop the entity, answers and candidates once the item is done"""
+        self.item = None
+        self.entity_json = dict()
+        self.osm_wikidata_link_data = dict()
+        self.osm_wikidata_link_results = []
+        self.waymarked_candidates = []
+        self.waymarked_results = []
+        self.choices = []
+
     def __add_or_replace_not_found_in_openstreetmap_claim__(self):
         claim = Item(
             prop_nr=Property.NOT_FOUND_IN.value,
@@ -707,13 +894,14 @@ class TrailItem(ProjectBaseModel):
 
     def try_matching_again(self):
         if self.questionary_return.more_information:
-            result = questionary.select(
-                "Do you want to match again after manually ",
-                choices=[
-                    Choice(title="Yes", value=True),
-                    Choice(title="No", value=False),
-                ],
-            ).ask()
+            with run_metrics.measure(Phase.THINK_TIME):
+                result = questionary.select(
+                    "Do you want to match again after manually ",
+                    choices=[
+                        Choice(title="Yes", value=True),
+                        Choice(title="No", value=False),
+                    ],
+                ).ask()
             if result:
                 self.questionary_return = self.__ask_question__()
 
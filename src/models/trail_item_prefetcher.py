@@ -0,0 +1,57 @@
+import logging
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from src.models.trail_item import TrailItem
+
+logger = logging.getLogger(__name__)
+
+
+class TrailItemPrefetcher:
+    """Prepares the next items in a background thread while the user
+    answers the prompts of the current one.
+
+    At most lookahead items are scheduled ahead of the one on screen,
+    so skipped or abandoned items never cost more than that."""
+
+    def __init__(self, lookahead: int):
+        self.lookahead = lookahead
+        self.futures: dict[str, Future] = {}
+        self.executor: ThreadPoolExecutor | None = None
+        if lookahead > 0:
+            # One thread is enough to stay ahead of a human
+            # and keeps us polite towards the APIs
+            self.executor = ThreadPoolExecutor(
+                max_workers=1, thread_name_prefix="prefetch"
+            )
+
+    def schedule(self, trail_item: TrailItem) -> None:
+        if self.executor and trail_item.qid not in self.futures:
+            logger.debug(f"Scheduling {trail_item.qid} for preparation")
+            self.futures[trail_item.qid] = self.executor.submit(
+                self.__prepare__, trail_item
+            )
+
+    def is_scheduled(self, trail_item: TrailItem) -> bool:
+        """True while the background thread may be working on the item"""
+        return trail_item.qid in self.futures
+
+    def wait(self, trail_item: TrailItem) -> None:
+        """Wait until the item is prepared so only one thread touches it
+        at a time. Items that were never scheduled are returned right away
+        and the usual interactive steps fetch what they need."""
+        future = self.futures.pop(trail_item.qid, None)
+        if future:
+            future.result()
+
+    def close(self) -> None:
+        if self.executor:
+            self.executor.shutdown(wait=True, cancel_futures=True)
+        self.futures.clear()
+
+    @staticmethod
+    def __prepare__(trail_item: TrailItem) -> None:
+        try:
+            trail_item.prepare()
+        except Exception as e:
+            # The interactive steps redo whatever did not get prepared
+            logger.warning(f"Could not prepare {trail_item.qid} in advance: {e}")
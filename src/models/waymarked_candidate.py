@@ -0,0 +1,58 @@
+import logging
+from typing import Any, Dict, List, Tuple
+
+from src.models.waymarked_result import WaymarkedResult
+
+logger = logging.getLogger(__name__)
+
+
+class WaymarkedCandidate:
+    """A Waymarked Trails search result before it is scored.
+
+    Most search results are dropped by the similarity filter, so they are
+    kept in slots with only the fields we show and a WaymarkedResult
+    is built for the ones that pass."""
+
+    __slots__ = ("id", "name", "group", "ref", "itinerary")
+
+    def __init__(
+        self,
+        id: int,
+        name: str,
+        group: str = "",
+        ref: str = "",
+        itinerary: Tuple[str, ...] = (),
+    ):
+        self.id = id
+        self.name = name
+        self.group = group
+        self.ref = ref
+        self.itinerary = itinerary
+
+    @classmethod
+    def parse_results(cls, data: Dict[str, Any]) -> List["WaymarkedCandidate"]:
+        """Parse the results of a search answer, dropping duplicates"""
+        candidates: Dict[int, WaymarkedCandidate] = {}
+        for result in data.get("results", []):
+            if not isinstance(result, dict) or "id" not in result:
+                continue
+            osm_id = int(result["id"])
+            if osm_id not in candidates:
+                candidates[osm_id] = cls(
+                    id=osm_id,
+                    name=result.get("name") or "",
+                    group=result.get("group") or "",
+                    ref=result.get("ref") or "",
+                    itinerary=tuple(result.get("itinerary") or ()),
+                )
+        return list(candidates.values())
+
+    def to_waymarked_result(self, similarity: float = 0) -> WaymarkedResult:
+        return WaymarkedResult(
+            id=self.id,
+            name=self.name,
+            group=self.group,
+            ref=self.ref,
+            itinerary=list(self.itinerary),
+            similarity=similarity,
+        )
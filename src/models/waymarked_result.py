@@ -1,28 +1,34 @@
+import json
 import logging
-from typing import Dict, List
+from typing import ClassVar, Dict, List
 
-from OSMPythonTools.api import Api  # type: ignore
 from pydantic import BaseModel
-from requests import Session
 
 import config
 from src.console import console
+from src.enums import Phase
+from src.models.http_cache import http_cache
+from src.models.osm_relation import OSMRelation
+from src.models.osm_relation_lookup import relation_lookup
+from src.models.rate_limiter import concurrency_limiter
+from src.models.run_metrics import run_metrics
 from src.models.subroute import Subroute
 
-# Silence chatty warning messages
-logging.getLogger("OSMPythonTools").setLevel(logging.ERROR)
 logger = logging.getLogger(__name__)
 
 
 class WaymarkedResult(BaseModel):
-    """Models the JSON response from the Waymarked Trails API"""
+    """Models the JSON response from the Waymarked Trails API
+
+    The details are only fetched when get_details() is called because
+    only the best candidates are shown with them. Until then the detail
+    fields have their defaults."""
 
     id: int
     group: str = ""
     name: str
     ref: str = ""
     itinerary: List[str] = []
-    session: Session = Session()
     subroutes: List[Subroute] = []
     details: Dict = {}
     # These are meters
@@ -30,6 +36,13 @@ class WaymarkedResult(BaseModel):
     mapped_length: float = 0
     description: str = ""
     wikidata: str = ""
+    checked_wikidata_tag: bool = False
+    # Similarity of the name to the label of the item, 0 to 1
+    similarity: float = 0
+    # Distance to the coordinates of the item if we know where the route is
+    distance_km: float | None = None
+    details_loaded: bool = False
+    host: ClassVar[str] = "hiking.waymarkedtrails.org"
 
     class Config:
         arbitrary_types_allowed = True
@@ -41,21 +54,31 @@ class WaymarkedResult(BaseModel):
         return self.id
 
     def get_details(self):
-        self.__fetch_details__()
+        """Fetch and parse the details unless they are loaded already"""
+        if self.details_loaded:
+            return
+        # The detail pools of all prepare workers share the slots
+        with concurrency_limiter.slot(self.host):
+            self.__fetch_details__()
         self.__parse_details__()
+        self.details_loaded = True
 
     def __fetch_details__(self):
         url = f"https://hiking.waymarkedtrails.org/api/v1/details/relation/{self.id}"
-        # pass the session to this
-        response = self.session.get(url, timeout=config.request_timeout)
-        if response.status_code == 200:
-            self.details = response.json()
+        with run_metrics.measure(Phase.WT_DETAILS) as measurement:
+            status_code, content = http_cache.get(
+                url, ttl_seconds=config.waymarked_details_ttl_days * 24 * 3600
+            )
+            measurement.bytes = len(content)
+            measurement.error = status_code != 200
+        if status_code == 200:
+            self.details = json.loads(content)
             logging.debug("Got details from Waymarked Trails API")
             if config.loglevel == logging.DEBUG and config.debug_json:
                 console.print(self.details)
         else:
             raise Exception(
-                f"got {response.status_code} from the "
+                f"got {status_code} from the "
                 f"Waymarked Trails API when trying to fetch details, see {url}"
             )
 
@@ -90,12 +113,17 @@ class WaymarkedResult(BaseModel):
             return ""
 
     def fetch_wikidata_tag_information(self) -> None:
-        """This check uses the Openstreetmap API because it is very fast"""
-        api = Api()
-        relation = api.query(f"relation/{self.id}")
-        wikidata = relation.tag("wikidata")
+        """This check uses the Openstreetmap API because it is very fast.
+        Relations we have seen recently are served from the local store"""
+        if self.checked_wikidata_tag:
+            return
+        self.set_wikidata_tag(relation=relation_lookup.get_relation(self.id))
+
+    def set_wikidata_tag(self, relation: OSMRelation | None) -> None:
+        wikidata = relation.tags.get("wikidata", "") if relation else ""
         if wikidata:
             self.wikidata = wikidata
             logging.debug(f"wikidata tag: {wikidata}")
         else:
             logger.debug(f"No wikidata tag found for {self.id}")
+        self.checked_wikidata_tag = True
@@ -0,0 +1,97 @@
+import json
+import logging
+import os
+from functools import lru_cache
+from typing import Any, Dict, Iterable, List
+
+import config
+from src.models.osm_extract_reader import OsmExtractReader
+from src.models.osm_relation import OSMRelation
+
+logger = logging.getLogger(__name__)
+
+
+class WikidataTagIndex:
+    """Maps a QID to the OSM objects carrying it in their wikidata tag.
+
+    The entries have the same shape as the "osm" list in the responses from
+    OSM Wikidata Link so TrailItem can parse them the same way."""
+
+    def __init__(self, entries: Dict[str, List[Dict[str, Any]]] | None = None):
+        self.entries = entries or {}
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def lookup(self, qid: str) -> Dict[str, Any]:
+        """Return data shaped like the OSM Wikidata Link API response"""
+        return {"osm": self.entries.get(qid, [])}
+
+    def add(self, osm_type: str, osm_id: int, tags: Dict[str, str]) -> None:
+        wikidata = tags.get("wikidata", "")
+        # Multiple values are separated by semicolons
+        for qid in (value.strip() for value in wikidata.split(";")):
+            if qid:
+                self.entries.setdefault(qid, []).append(
+                    {
+                        "type": osm_type,
+                        "id": osm_id,
+                        "tags": {
+                            "name": tags.get("name", ""),
+                            "ref": tags.get("ref", ""),
+                        },
+                    }
+                )
+
+    @classmethod
+    def build_from_extract(cls, extract_path: str) -> "WikidataTagIndex":
+        index = cls()
+        reader = OsmExtractReader(extract_path)
+        for elem in reader.iter_elements({"node", "way", "relation"}):
+            tags = {tag.get("k", ""): tag.get("v", "") for tag in elem.findall("tag")}
+            if "wikidata" in tags:
+                index.add(elem.tag, int(elem.get("id", 0)), tags)
+        logger.info(f"Indexed {len(index)} QIDs from {extract_path}")
+        return index
+
+    @classmethod
+    def build_from_relations(
+        cls, relations: Iterable[OSMRelation]
+    ) -> "WikidataTagIndex":
+        """Build from relations only, e.g. the ones in the relation store"""
+        index = cls()
+        for relation in relations:
+            if "wikidata" in relation.tags:
+                index.add("relation", relation.id, relation.tags)
+        logger.info(f"Indexed {len(index)} QIDs from relations")
+        return index
+
+    def save(self, path: str) -> None:
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.entries, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "WikidataTagIndex":
+        with open(path, encoding="utf-8") as f:
+            return cls(entries=json.load(f))
+
+
+@lru_cache(maxsize=None)
+def default_wikidata_tag_index() -> WikidataTagIndex | None:
+    """The index from config.wikidata_tag_index_path, loaded once"""
+    if not config.wikidata_tag_index_path:
+        return None
+    if not os.path.exists(config.wikidata_tag_index_path):
+        logger.warning(
+            f"Wikidata tag index {config.wikidata_tag_index_path} does not exist, "
+            f"build it with app_index.py"
+        )
+        return None
+    index = WikidataTagIndex.load(config.wikidata_tag_index_path)
+    logger.info(f"Loaded wikidata tag index with {len(index)} QIDs")
+    return index
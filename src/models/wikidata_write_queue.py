@@ -0,0 +1,295 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+import requests
+from wikibaseintegrator import WikibaseIntegrator  # type: ignore
+from wikibaseintegrator.wbi_exceptions import (  # type: ignore
+    MaxRetriesReachedException,
+)
+from wikibaseintegrator.wbi_helpers import edit_entity  # type: ignore
+
+import config
+from src.console import console
+from src.enums import Phase
+from src.models.rate_limiter import HostRateLimiter
+from src.models.run_metrics import run_metrics
+
+logger = logging.getLogger(__name__)
+
+
+class WikidataWriteQueue:
+    """Durable queue of Wikidata edits written by a background thread
+    so the review never waits for Wikidata to save.
+
+    Edits are stored in SQLite before put() returns and removed once they
+    are saved. The writer sends maxlag with every edit and WikibaseIntegrator
+    waits when the servers lag or throttle us. On top of that we space edits
+    out to edits_per_minute and wait for Retry-After on HTTP 429. Edits that
+    are still pending are written in the next session, edits that failed are
+    kept until retry_failed() is called.
+
+    The revision of the item at enqueue time is sent as baserevid so
+    Wikidata refuses the edit with a conflict instead of overwriting
+    statements other editors changed in the meantime.
+
+    The writer never prints because its output would end up in the middle
+    of the prompts. The messages of the saved edits are logged and shown
+    when the queue is closed."""
+
+    host = "www.wikidata.org"
+
+    def __init__(
+        self,
+        path: str,
+        wbi: WikibaseIntegrator,
+        edits_per_minute: float = config.wikidata_edits_per_minute,
+        max_attempts: int = config.wikidata_write_attempts,
+    ):
+        self.path = path
+        self.wbi = wbi
+        self.max_attempts = max_attempts
+        self.rate_limiter = HostRateLimiter(requests_per_second=edits_per_minute / 60)
+        self.lock = threading.Lock()
+        self.wakeup = threading.Condition(self.lock)
+        self.stopping = False
+        self.connection: sqlite3.Connection | None = None
+        self.thread: threading.Thread | None = None
+        self.written = 0
+        # Messages of the saved edits, shown by close()
+        self.messages: list[str] = []
+
+    def __connect__(self) -> sqlite3.Connection:
+        if self.connection is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            # We serialize access with self.lock so threads can share it
+            self.connection = sqlite3.connect(
+                self.path, check_same_thread=False, timeout=30
+            )
+            self.connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS edits (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    qid TEXT NOT NULL,
+                    data TEXT NOT NULL,
+                    summary TEXT NOT NULL,
+                    message TEXT NOT NULL,
+                    failed INTEGER NOT NULL DEFAULT 0,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    last_error TEXT NOT NULL DEFAULT '',
+                    baserevid INTEGER NOT NULL DEFAULT 0
+                )
+                """
+            )
+            columns = {
+                row[1] for row in self.connection.execute("PRAGMA table_info(edits)")
+            }
+            if "baserevid" not in columns:
+                # Queues written before we stored the base revision
+                self.connection.execute(
+                    "ALTER TABLE edits ADD COLUMN baserevid INTEGER NOT NULL DEFAULT 0"
+                )
+            self.connection.commit()
+        return self.connection
+
+    def start(self) -> None:
+        """Start the writer. Pending edits left over from an earlier
+        session are written first, failed edits are left alone"""
+        with self.lock:
+            connection = self.__connect__()
+            (left_over,) = connection.execute(
+                "SELECT COUNT(*) FROM edits WHERE failed = 0"
+            ).fetchone()
+            connection.execute("UPDATE edits SET attempts = 0 WHERE failed = 0")
+            connection.commit()
+        if left_over:
+            console.print(f"Writing {left_over} edits left from an earlier session")
+        self.stopping = False
+        self.thread = threading.Thread(
+            target=self.__run__, name="wikidata-writer", daemon=True
+        )
+        self.thread.start()
+
+    def retry_failed(self) -> int:
+        """Mark the failed edits as pending again and return how many"""
+        with self.lock:
+            connection = self.__connect__()
+            cursor = connection.execute(
+                "UPDATE edits SET failed = 0, attempts = 0 WHERE failed = 1"
+            )
+            connection.commit()
+            self.wakeup.notify()
+        if cursor.rowcount:
+            console.print(f"Retrying {cursor.rowcount} failed edits")
+        return cursor.rowcount
+
+    def put(
+        self, qid: str, data: dict, summary: str, message: str = "", baserevid: int = 0
+    ) -> None:
+        """Queue an edit of the item at revision baserevid, 0 if unknown"""
+        with self.lock:
+            connection = self.__connect__()
+            connection.execute(
+                "INSERT INTO edits (qid, data, summary, message, baserevid) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (
+                    qid,
+                    json.dumps(data, ensure_ascii=False),
+                    summary,
+                    message,
+                    baserevid,
+                ),
+            )
+            connection.commit()
+            self.wakeup.notify()
+
+    def __next_edit__(self) -> tuple[int, str, dict, str, str, int, int] | None:
+        """Block until there is a pending edit or we are stopping"""
+        with self.lock:
+            while True:
+                row = (
+                    self.__connect__()
+                    .execute(
+                        "SELECT id, qid, data, summary, message, attempts, baserevid "
+                        "FROM edits WHERE failed = 0 ORDER BY id LIMIT 1"
+                    )
+                    .fetchone()
+                )
+                if row:
+                    edit_id, qid, data, summary, message, attempts, baserevid = row
+                    return (
+                        edit_id,
+                        qid,
+                        json.loads(data),
+                        summary,
+                        message,
+                        attempts,
+                        baserevid,
+                    )
+                if self.stopping:
+                    return None
+                self.wakeup.wait()
+
+    def __run__(self) -> None:
+        while True:
+            edit = self.__next_edit__()
+            if edit is None:
+                return
+            edit_id, qid, data, summary, message, attempts, baserevid = edit
+            self.rate_limiter.wait(self.host)
+            try:
+                with run_metrics.measure(Phase.WIKIDATA_WRITE):
+                    self.__save__(
+                        qid=qid, data=data, summary=summary, baserevid=baserevid
+                    )
+            except Exception as e:
+                self.__handle_failure__(edit_id, qid, attempts + 1, e)
+                continue
+            with self.lock:
+                connection = self.__connect__()
+                connection.execute("DELETE FROM edits WHERE id = ?", (edit_id,))
+                connection.commit()
+                self.written += 1
+                if message:
+                    self.messages.append(message)
+            logger.info(f"Saved edit of {qid}")
+            if message:
+                logger.info(message)
+
+    def __save__(self, qid: str, data: dict, summary: str, baserevid: int) -> None:
+        edit_entity(
+            data=data,
+            id=qid,
+            type="item",
+            baserevid=baserevid or None,
+            summary=summary,
+            is_bot=self.wbi.is_bot,
+            login=self.wbi.login,
+            maxlag=config.wikidata_maxlag,
+        )
+
+    def __handle_failure__(
+        self, edit_id: int, qid: str, attempts: int, error: Exception
+    ) -> None:
+        delay = self.__retry_delay__(error, attempts)
+        failed = delay is None or attempts >= self.max_attempts
+        with self.lock:
+            connection = self.__connect__()
+            connection.execute(
+                "UPDATE edits SET attempts = ?, failed = ?, last_error = ? "
+                "WHERE id = ?",
+                (attempts, int(failed), str(error), edit_id),
+            )
+            connection.commit()
+        if failed:
+            logger.error(f"Giving up on the edit of {qid} for now: {error}")
+        elif delay:
+            logger.warning(f"Edit of {qid} failed, retrying in {delay:.0f}s: {error}")
+            time.sleep(delay)
+
+    @staticmethod
+    def __retry_delay__(error: Exception, attempts: int) -> float | None:
+        """Seconds to wait before trying again or None if retrying is useless.
+        Maxlag and throttling are already waited out by WikibaseIntegrator
+        until it gives up with MaxRetriesReachedException"""
+        if isinstance(error, requests.HTTPError) and error.response is not None:
+            status_code = error.response.status_code
+            if status_code == 429:
+                retry_after = error.response.headers.get("Retry-After", "")
+                return float(retry_after) if retry_after.isdigit() else 60.0
+            if status_code >= 500:
+                return 2.0**attempts
+            return None
+        if isinstance(error, (requests.ConnectionError, requests.Timeout)):
+            return 2.0**attempts
+        if isinstance(error, MaxRetriesReachedException):
+            return 60.0
+        return None
+
+    def failures(self) -> list[tuple[str, str]]:
+        """QIDs and errors of the edits that could not be saved"""
+        with self.lock:
+            return (
+                self.__connect__()
+                .execute("SELECT qid, last_error FROM edits WHERE failed = 1")
+                .fetchall()
+            )
+
+    def __len__(self) -> int:
+        with self.lock:
+            (count,) = (
+                self.__connect__().execute("SELECT COUNT(*) FROM edits").fetchone()
+            )
+        return int(count)
+
+    def close(self) -> None:
+        """Wait for the pending edits to be written and report the failures"""
+        if self.thread is not None:
+            if len(self):
+                console.print("Waiting for the queued edits to be saved")
+            with self.lock:
+                self.stopping = True
+                self.wakeup.notify()
+            self.thread.join()
+            self.thread = None
+        failures = self.failures()
+        console.print(f"Saved {self.written} edits to Wikidata")
+        for message in self.messages:
+            console.print(message)
+        self.messages = []
+        if failures:
+            console.print(
+                f"{len(failures)} edits failed and are kept in {self.path}, "
+                f"retry them with --retry-failed-edits:"
+            )
+            for qid, error in failures:
+                console.print(f"* {qid}: {error}")
+        with self.lock:
+            if self.connection is not None:
+                self.connection.close()
+                self.connection = None
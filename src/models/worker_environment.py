@@ -0,0 +1,33 @@
+import os
+from contextlib import contextmanager
+from typing import Dict, Iterator
+
+import config
+
+
+def per_host_limits(processes: int) -> Dict[str, str]:
+    """The per-host limits of config divided between processes, as the
+    environment variables config reads them from"""
+    return {
+        "REQUESTS_PER_SECOND_PER_HOST": str(
+            config.requests_per_second_per_host / processes
+        ),
+        "MAX_REQUESTS_PER_HOST": str(max(1, config.max_requests_per_host // processes)),
+    }
+
+
+@contextmanager
+def worker_environment(values: Dict[str, str]) -> Iterator[None]:
+    """Set environment variables for the worker processes started inside
+    the block. Spawned workers import config again and read them there.
+    The previous values are restored afterwards."""
+    saved = {key: os.environ.get(key) for key in values}
+    os.environ.update(values)
+    try:
+        yield
+    finally:
+        for key, value in saved.items():
+            if value is None:
+                os.environ.pop(key, None)
+            else:
+                os.environ[key] = value
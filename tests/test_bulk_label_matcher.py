@@ -0,0 +1,60 @@
+from unittest import TestCase
+
+from src.models.bulk_label_matcher import BulkLabelMatcher
+from src.models.osm_relation import OSMRelation
+from src.models.route_name_corpus import RouteNameCorpus
+
+
+class TestBulkLabelMatcher(TestCase):
+    corpus = RouteNameCorpus(
+        names=[
+            (1, "Falerum - Åtvidaberg"),
+            (2, "Glotternskogen"),
+            (3, "Lilla Älgsjön runt"),
+            (4, "Åtvidaberg Falerum vandringsled"),
+            (5, "Kungsleden"),
+        ]
+    )
+
+    def test_match(self):
+        matcher = BulkLabelMatcher(corpus=self.corpus, block_size=2, workers=1)
+        matches = matcher.match(
+            {
+                "Q1": "Åtvidaberg-Falerum",
+                "Q2": "Glotternskogen Lilla Älgsjön",
+                "Q3": "Kebnekaise",
+            },
+            top_k=1,
+            min_similarity=0.8,
+        )
+        assert [match.osm_id for match in matches["Q1"]] == [1]
+        assert matches["Q1"][0].similarity == 1.0
+        # "lilla" alone must not be a match
+        assert matches["Q2"] == []
+        # No shared token means no comparison at all
+        assert matches["Q3"] == []
+
+    def test_top_k_keeps_best_first(self):
+        matcher = BulkLabelMatcher(corpus=self.corpus, workers=1)
+        matches = matcher.match({"Q1": "Falerum Åtvidaberg"}, top_k=5)
+        assert [match.osm_id for match in matches["Q1"]] == [1, 4]
+
+    def test_labels_are_only_compared_with_their_own_candidates(self):
+        matcher = BulkLabelMatcher(corpus=self.corpus, workers=1)
+        matcher.match(
+            {"Q1": "Åtvidaberg-Falerum", "Q2": "Kungsleden", "Q3": "Kebnekaise"}
+        )
+        # Q1 shares tokens with 1 and 4, Q2 with 5 and Q3 with none
+        assert matcher.comparisons == 3
+
+    def test_build_corpus_from_relations(self):
+        corpus = RouteNameCorpus.build_from_relations(
+            [
+                OSMRelation(
+                    osm_id=1, version=1, tags={"route": "hiking", "name": "Leden"}
+                ),
+                OSMRelation(osm_id=2, version=1, tags={"route": "bus", "name": "4"}),
+                OSMRelation(osm_id=3, version=1, tags={"route": "foot"}),
+            ]
+        )
+        assert corpus.names == [(1, "Leden")]
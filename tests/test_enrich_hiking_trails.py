@@ -1,6 +1,85 @@
+import json
+from datetime import datetime, timedelta, timezone
+from typing import ClassVar
 from unittest import TestCase
+from unittest.mock import patch
 
+import requests
+from wikibaseintegrator import WikibaseIntegrator  # type: ignore
+
+import config
 from src.models.enrich_hiking_trails import EnrichHikingTrails
+from src.models.trail_item import TrailItem
+
+
+class LocalEnrichHikingTrails(EnrichHikingTrails):
+    def __iter_sparql_bindings__(self):
+        recent = datetime.now(timezone.utc) - timedelta(days=1)
+        yield {"item": {"value": "http://www.wikidata.org/entity/Q1"}}
+        yield {
+            "item": {"value": "http://www.wikidata.org/entity/Q2"},
+            "lastUpdate": {"value": recent.isoformat()},
+        }
+        yield {"item": {"value": "http://www.wikidata.org/entity/Q3"}}
+
+
+class PagedEnrichHikingTrails(EnrichHikingTrails):
+    queries: ClassVar[list[str]] = []
+
+    @classmethod
+    def __query_wdqs__(cls, query):
+        cls.queries.append(query)
+        page = len(cls.queries)
+        bindings = [
+            {"item": {"value": f"http://www.wikidata.org/entity/Q{number}"}}
+            for number in {1: [1, 2], 2: [3]}.get(page, [])
+        ]
+        return [json.dumps({"results": {"bindings": bindings}})]
+
+
+class DroppedEnrichHikingTrails(EnrichHikingTrails):
+    """WDQS drops the connection in the middle of the review"""
+
+    calls: ClassVar[list[str]] = []
+
+    def setup_wbi(self):
+        pass
+
+    def __login_to_wikidata__(self):
+        pass
+
+    def __start_write_queue__(self):
+        self.calls.append("start")
+
+    def __iterate_items__(self):
+        raise requests.exceptions.ChunkedEncodingError("connection dropped")
+
+    def __stop_write_queue__(self):
+        self.calls.append("stop")
+
+    def __add_to_runlog__(self, action: str = "matched", count: int | None = None):
+        self.calls.append("runlog")
+
+
+class OfflineTrailItem(TrailItem):
+    def prepare(self, complete: bool = False) -> None:
+        pass
+
+
+class PrefetchingEnrichHikingTrails(EnrichHikingTrails):
+    """Records the QIDs of every entity batch instead of fetching them"""
+
+    batches: ClassVar[list[list[str]]] = []
+
+    def __iter_due_trail_items__(self):
+        for number in range(1, 6):
+            yield OfflineTrailItem(wbi=WikibaseIntegrator(), qid=f"Q{number}")
+
+    def __prefetch_item_entities__(self, items):
+        self.batches.append([trail_item.qid for trail_item in items])
+
+    def __review_item__(self, trail_item):
+        pass
 
 
 class TestEnrichHikingTrails(TestCase):
@@ -18,6 +97,76 @@ class TestEnrichHikingTrails(TestCase):
         eht = EnrichHikingTrails()
         eht.setup_wbi()
 
+    def test___filter_entity_json__(self):
+        eht = EnrichHikingTrails()
+        data = {
+            "id": "Q1",
+            "claims": {"P402": [{"id": "a"}], "P31": [{"id": "b"}], "P9660": []},
+        }
+        filtered = eht.__filter_entity_json__(data)
+        assert sorted(filtered["claims"]) == ["P402", "P9660"]
+
+    def test___iter_due_items__(self):
+        eht = LocalEnrichHikingTrails(wbi=WikibaseIntegrator())
+        due_items = eht.__iter_due_items__()
+        # Items are created as the bindings arrive
+        assert next(due_items).qid == "Q1"
+        assert eht.due_count == 1
+        assert [trail_item.qid for trail_item in due_items] == ["Q3"]
+        assert eht.due_count == 2
+        assert eht.skipped_count == 1
+
+    def test___sparql_query__(self):
+        query = EnrichHikingTrails.__sparql_query__(
+            cutoff=datetime(2024, 1, 2, tzinfo=timezone.utc), limit=100
+        )
+        assert (
+            '?lastUpdate < "2024-01-02T00:00:00Z"'
+            "^^<http://www.w3.org/2001/XMLSchema#dateTime>" in query
+        )
+        assert "ORDER BY ?lastUpdate STR(?item)" in query
+        assert "LIMIT 100" in query
+
+    def test___page_filter__(self):
+        item = {"value": "http://www.wikidata.org/entity/Q2"}
+        assert (
+            EnrichHikingTrails.__page_filter__({"item": item})
+            == 'FILTER(BOUND(?lastUpdate) || STR(?item) > "http://www.wikidata.org/entity/Q2")'
+        )
+        page_filter = EnrichHikingTrails.__page_filter__(
+            {"item": item, "lastUpdate": {"value": "2023-06-23T00:00:00Z"}}
+        )
+        assert page_filter.startswith("FILTER(BOUND(?lastUpdate) && (?lastUpdate > ")
+
+    def test___iter_sparql_bindings___pages(self):
+        with patch.object(config, "wdqs_page_size", 2):
+            bindings = list(PagedEnrichHikingTrails().__iter_sparql_bindings__())
+        assert [binding["item"]["value"][-2:] for binding in bindings] == [
+            "Q1",
+            "Q2",
+            "Q3",
+        ]
+        # The second page continues after the last binding of the first
+        assert len(PagedEnrichHikingTrails.queries) == 2
+        assert "LIMIT 2" in PagedEnrichHikingTrails.queries[1]
+        assert 'STR(?item) > "http://www.wikidata.org/entity/Q2"' in (
+            PagedEnrichHikingTrails.queries[1]
+        )
+
+    def test_dropped_wdqs_connection_still_stops_the_write_queue(self):
+        DroppedEnrichHikingTrails().add_osm_property_to_items()
+        assert DroppedEnrichHikingTrails.calls == ["start", "stop", "runlog"]
+
+    @patch.object(config, "lookahead_depth", 2)
+    def test_scheduled_items_are_left_out_of_entity_batches(self):
+        PrefetchingEnrichHikingTrails.batches = []
+        PrefetchingEnrichHikingTrails().__iterate_items__()
+        # Q3 was scheduled with Q2 so the background thread owns it
+        assert PrefetchingEnrichHikingTrails.batches[:2] == [
+            ["Q1", "Q2", "Q3", "Q4", "Q5"],
+            ["Q2", "Q4", "Q5"],
+        ]
+
     # def test___get_en_usa_hiking_trails_missing_osm_id__(self):
     #     eht = EnrichHikingTrails()
     #     # This controls which hiking trails to fetch and work on
@@ -1,6 +1,60 @@
+import os
+import random
+import tempfile
+import time
+import xml.etree.ElementTree as ET
+from datetime import datetime, timedelta
 from unittest import TestCase
+from unittest.mock import patch
 
+import requests
+
+import config
 from src.models.generate_osmchange import OsmChangeGenerator, OSMRelation
+from src.models.osm_relation_lookup import OsmRelationLookup
+from src.models.osm_relation_store import OsmRelationStore
+from src.models.osmchange_shard import OsmChangeShard
+from src.models.osmchange_snapshot import OsmChangeSnapshot
+from src.models.relation_outcome import RelationOutcome
+
+RELATIONS_XML = b"""<?xml version="1.0" encoding="UTF-8"?>
+<osm version="0.6">
+  <relation id="1" version="3" visible="true">
+    <tag k="wikidata" v="Q1"/>
+  </relation>
+  <relation id="2" version="5" visible="true">
+    <tag k="name" v="Test"/>
+  </relation>
+</osm>
+"""
+
+
+class FakeApiLookup(OsmRelationLookup):
+    """Answers every API request with RELATIONS_XML or
+    multi-fetches with multi_fetch_status if it is set"""
+
+    def __init__(
+        self, multi_fetch_status: int = 200, store: OsmRelationStore | None = None
+    ):
+        super().__init__(store=store)
+        self.multi_fetch_status = multi_fetch_status
+        self.paths: list[str] = []
+
+    def __request__(self, path: str) -> requests.Response:
+        self.paths.append(path)
+        response = requests.Response()
+        response.status_code = 200
+        response._content = RELATIONS_XML
+        if path.startswith("relations?"):
+            response.status_code = self.multi_fetch_status
+        else:
+            osm_id = path.split("/")[-1]
+            relation = ET.fromstring(RELATIONS_XML).find(f"relation[@id='{osm_id}']")
+            root = ET.Element("osm")
+            if relation is not None:
+                root.append(relation)
+            response._content = ET.tostring(root)
+        return response
 
 
 class TestOsmChangeGenerator(TestCase):
@@ -45,3 +99,350 @@ class TestOsmChangeGenerator(TestCase):
         self.assertEqual(tags.get("wikidata"), "Q12345")
         self.assertEqual(tags.get("name"), "Test")
         self.assertEqual(tags.get("route"), "hiking")
+
+    def test_chunk(self):
+        chunks = self.gen.__chunk__(list(range(250)), 100)
+        self.assertEqual([len(chunk) for chunk in chunks], [100, 100, 50])
+
+    def test_extract_qid_and_osm_id_sorted_by_relation_id(self):
+        prefix = self.gen.rdf_entity_prefix
+        items = [
+            {"item": {"value": f"{prefix}Q2"}, "osm": {"value": "20"}},
+            {"item": {"value": f"{prefix}Q1"}, "osm": {"value": "10"}},
+            {"item": {"value": f"{prefix}Q3"}, "osm": {"value": "not a number"}},
+        ]
+        pairs = self.gen.__extract_qid_and_osm_id__(items)
+        self.assertEqual(pairs, [("Q1", 10), ("Q2", 20)])
+
+    def test_concurrent_fetch_keeps_chunk_order(self):
+        class SlowGenerator(OsmChangeGenerator):
+            def __fetch_chunk__(self, chunk):
+                time.sleep(random.uniform(0, 0.01))
+                return {
+                    osm_id: OSMRelation(osm_id=osm_id, version=1, tags={})
+                    for _, osm_id in chunk
+                }
+
+        gen = SlowGenerator(workers=4, queue_size=2)
+        chunks = gen.__chunk__([(f"Q{i}", i) for i in range(50)], 3)
+        result = list(gen.__iterate_fetched_chunks__(chunks))
+        self.assertEqual([chunk for chunk, _ in result], chunks)
+        for chunk, relations in result:
+            self.assertEqual(sorted(relations), [osm_id for _, osm_id in chunk])
+
+    def test_fetch_through_the_lookup(self):
+        class ApiGenerator(OsmChangeGenerator):
+            lookup = FakeApiLookup()
+
+        gen = ApiGenerator()
+        relations = gen.__fetch_osm_relations__([1, 2])
+        self.assertEqual(ApiGenerator.lookup.paths, ["relations?relations=1,2"])
+        self.assertEqual(relations[1].tags, {"wikidata": "Q1"})
+        self.assertEqual(relations[2].version, 5)
+        # The shared lookup is not a descriptor
+        self.assertIsInstance(OsmChangeGenerator().lookup, OsmRelationLookup)
+
+    def test_parse_multi_fetch_xml(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            store = OsmRelationStore(
+                path=os.path.join(tmp, "relations.sqlite"),
+                ttl_seconds=3600,
+                max_entries=10,
+            )
+            lookup = FakeApiLookup(store=store)
+            relations = lookup.get_relations([1, 2])
+            self.assertEqual(sorted(relations), [1, 2])
+            self.assertEqual(relations[1].version, 3)
+            self.assertEqual(relations[1].tags, {"wikidata": "Q1"})
+            self.assertEqual(relations[2].tags, {"name": "Test"})
+            # The parsed relations come back the same from the store
+            stored = store.get_many([1, 2])
+            self.assertEqual(
+                [(r.id, r.version, r.tags) for r in stored.values()],
+                [(r.id, r.version, r.tags) for r in relations.values()],
+            )
+            store.close()
+
+    def test_osmchange_uses_the_current_relations(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            store = OsmRelationStore(
+                path=os.path.join(tmp, "relations.sqlite"),
+                ttl_seconds=3600,
+                max_entries=10,
+            )
+            store.put_many([OSMRelation(osm_id=2, version=4, tags={})])
+
+            class ApiGenerator(OsmChangeGenerator):
+                lookup = FakeApiLookup(store=store)
+
+            relations = ApiGenerator().__fetch_osm_relations__([2])
+            self.assertEqual(ApiGenerator.lookup.paths, ["relation/2"])
+            self.assertEqual(relations[2].version, 5)
+            self.assertEqual(store.get(2).version, 5)
+            store.close()
+
+    def test_failed_multi_fetch_falls_back_to_single_fetches(self):
+        lookup = FakeApiLookup(multi_fetch_status=500)
+        relations = lookup.get_relations([1, 2])
+        self.assertEqual(
+            lookup.paths, ["relations?relations=1,2", "relation/1", "relation/2"]
+        )
+        self.assertEqual(sorted(relations), [1, 2])
+        self.assertEqual(relations[1].tags, {"wikidata": "Q1"})
+
+    def test_incremental_reuses_skip_and_mismatch_outcomes(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "snapshot.json")
+            checked = datetime.now()
+            OsmChangeSnapshot(
+                country_qid=config.country_qid,
+                outcomes={
+                    1: RelationOutcome(
+                        osm_id=1, qid="Q1", outcome="skip", checked=checked
+                    ),
+                    2: RelationOutcome(
+                        osm_id=2,
+                        qid="Q2",
+                        outcome="mismatch",
+                        osm_wikidata="Q9",
+                        checked=checked,
+                    ),
+                    3: RelationOutcome(
+                        osm_id=3, qid="Q3", outcome="patch", checked=checked
+                    ),
+                    4: RelationOutcome(
+                        osm_id=4, qid="Q4", outcome="skip", checked=checked
+                    ),
+                },
+            ).save(path)
+            self.gen.snapshot_path = path
+            pairs = [("Q1", 1), ("Q2", 2), ("Q3", 3), ("Q44", 4), ("Q5", 5)]
+            remaining = self.gen.__reuse_previous_outcomes__(pairs)
+        self.assertEqual(remaining, [("Q3", 3), ("Q44", 4), ("Q5", 5)])
+        self.assertEqual(self.gen.reused_count, 2)
+        self.assertEqual(self.gen.already_tagged_count, 1)
+        self.assertEqual(self.gen.mismatches, [(2, "Q2", "Q9")])
+        self.assertEqual(sorted(self.gen.outcomes), [1, 2])
+
+    def test_incremental_examines_changed_and_old_outcomes_again(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            store = OsmRelationStore(
+                path=os.path.join(tmp, "relations.sqlite"),
+                ttl_seconds=3600,
+                max_entries=10,
+            )
+            # Relation 2 was edited since the last run
+            store.put_many(
+                [
+                    OSMRelation(osm_id=1, version=3, tags={"wikidata": "Q1"}),
+                    OSMRelation(osm_id=2, version=6, tags={"wikidata": "Q2"}),
+                ]
+            )
+
+            class LocalGenerator(OsmChangeGenerator):
+                lookup = OsmRelationLookup(store=store)
+
+            path = os.path.join(tmp, "snapshot.json")
+            OsmChangeSnapshot(
+                country_qid=config.country_qid,
+                outcomes={
+                    1: RelationOutcome(
+                        osm_id=1,
+                        qid="Q1",
+                        outcome="skip",
+                        version=3,
+                        checked=datetime.now(),
+                    ),
+                    2: RelationOutcome(
+                        osm_id=2,
+                        qid="Q2",
+                        outcome="mismatch",
+                        version=5,
+                        osm_wikidata="Q9",
+                        checked=datetime.now(),
+                    ),
+                    3: RelationOutcome(
+                        osm_id=3,
+                        qid="Q3",
+                        outcome="skip",
+                        checked=datetime.now() - timedelta(days=60),
+                    ),
+                    # From a snapshot written before outcomes had a date
+                    4: RelationOutcome(osm_id=4, qid="Q4", outcome="skip"),
+                },
+            ).save(path)
+            gen = LocalGenerator(snapshot_path=path)
+            with patch.object(config, "osm_snapshot_max_age_days", 30):
+                remaining = gen.__reuse_previous_outcomes__(
+                    [("Q1", 1), ("Q2", 2), ("Q3", 3), ("Q4", 4)]
+                )
+            store.close()
+        self.assertEqual(remaining, [("Q2", 2), ("Q3", 3), ("Q4", 4)])
+        self.assertEqual(gen.reused_count, 1)
+        self.assertEqual(gen.mismatches, [])
+
+    def test_resume_after_interruption_gives_same_output(self):
+        prefix = self.gen.rdf_entity_prefix
+        items = [
+            {"item": {"value": f"{prefix}Q{i}"}, "osm": {"value": str(i)}}
+            for i in range(1, 8)
+        ]
+
+        class FakeGenerator(OsmChangeGenerator):
+            interrupt_at_chunk: int = -1
+            fetched_chunks: int = 0
+
+            def setup_wbi(self):
+                pass
+
+            def __get_items_with_osm_id__(self):
+                return items
+
+            def __fetch_chunk__(self, chunk):
+                if self.fetched_chunks == self.interrupt_at_chunk:
+                    raise KeyboardInterrupt()
+                self.fetched_chunks += 1
+                relations = {}
+                for _, osm_id in chunk:
+                    # Even ids lack the tag, 3 has another one, the rest are tagged
+                    tags = {"name": f"Trail {osm_id}"}
+                    if osm_id == 3:
+                        tags["wikidata"] = "Q999"
+                    elif osm_id % 2:
+                        tags["wikidata"] = f"Q{osm_id}"
+                    relations[osm_id] = OSMRelation(
+                        osm_id=osm_id, version=1, tags=tags, members=[("way", 1, "")]
+                    )
+                return relations
+
+        def read(path):
+            with open(path, encoding="utf-8") as f:
+                return f.read()
+
+        cwd = os.getcwd()
+        with tempfile.TemporaryDirectory() as tmp:
+            os.chdir(tmp)
+            try:
+                complete = FakeGenerator(batch_size=2)
+                expected = complete.generate()
+                expected_osc = read(complete.output_path)
+                expected_csv = read(complete.mismatch_report_path)
+
+                interrupted = FakeGenerator(batch_size=2, interrupt_at_chunk=2)
+                with self.assertRaises(KeyboardInterrupt):
+                    interrupted.generate()
+                self.assertTrue(os.path.exists(interrupted.journal_path))
+                # What was processed before the interruption is on disk
+                self.assertIn("<modify>", read(interrupted.output_path))
+
+                resumed = FakeGenerator(batch_size=2, resume=True)
+                summary = resumed.generate()
+                self.assertEqual(summary["resumed"], 4)
+                self.assertEqual(resumed.fetched_chunks, 2)
+                self.assertEqual(read(resumed.output_path), expected_osc)
+                self.assertEqual(read(resumed.mismatch_report_path), expected_csv)
+                for key in ("examined", "already_tagged", "patched", "mismatched"):
+                    self.assertEqual(summary[key], expected[key])
+                self.assertFalse(os.path.exists(resumed.journal_path))
+            finally:
+                os.chdir(cwd)
+
+    def test_instances_do_not_share_state(self):
+        other = OsmChangeGenerator()
+        self.gen.__append_mismatch__(1, "Q1", "Q2")
+        self.gen.outcomes[1] = RelationOutcome(osm_id=1, qid="Q1", outcome="skip")
+        self.gen.examined_count += 1
+        self.assertEqual(other.mismatches, [])
+        self.assertEqual(other.outcomes, {})
+        self.assertEqual(other.examined_count, 0)
+
+    def test_split_into_shards_of_whole_chunks(self):
+        pairs = [(f"Q{i}", i) for i in range(1, 11)]
+        shards = OsmChangeShard.split(
+            pairs,
+            count=3,
+            output_path="out.osc",
+            mismatch_report_path="out.csv",
+            batch_size=2,
+            workers=1,
+            queue_size=1,
+        )
+        self.assertEqual([len(shard.pairs) for shard in shards], [4, 4, 2])
+        self.assertEqual(shards[2].pairs, [("Q9", 9), ("Q10", 10)])
+        self.assertEqual(shards[1].output_path, "out.osc.part1")
+
+    def test_mismatch_report_keeps_commas_in_the_wikidata_tag(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            shard = OsmChangeShard(
+                index=0,
+                pairs=[],
+                output_path=os.path.join(tmp, "out.osc"),
+                mismatch_report_path=os.path.join(tmp, "out.csv"),
+                batch_size=1,
+                workers=1,
+                queue_size=1,
+            )
+            self.gen.mismatch_report_path = shard.mismatch_report_path
+            self.gen.__append_mismatch__(5, "Q1", "Q2, Q3")
+            self.gen.__append_mismatch__(6, "Q4", "Q5")
+            self.gen.__write_mismatch_report__()
+            self.assertEqual(
+                shard.read_mismatches(), [(5, "Q1", "Q2, Q3"), (6, "Q4", "Q5")]
+            )
+
+    def test_sharded_run_gives_same_output(self):
+        prefix = self.gen.rdf_entity_prefix
+        items = [
+            {"item": {"value": f"{prefix}Q{i}"}, "osm": {"value": str(i)}}
+            for i in range(1, 12)
+        ]
+
+        class FakeGenerator(OsmChangeGenerator):
+            def setup_wbi(self):
+                pass
+
+            def __get_items_with_osm_id__(self):
+                return items
+
+            def __fetch_chunk__(self, chunk):
+                relations = {}
+                for _, osm_id in chunk:
+                    tags = {"name": f"Trail {osm_id}"}
+                    if osm_id % 5 == 0:
+                        tags["wikidata"] = "Q999"
+                    elif osm_id % 2:
+                        tags["wikidata"] = f"Q{osm_id}"
+                    relations[osm_id] = OSMRelation(
+                        osm_id=osm_id, version=1, tags=tags, members=[("way", 1, "")]
+                    )
+                return relations
+
+            def __map_shards__(self, shards):
+                # The worker processes would do the same
+                return [self.run_shard(shard) for shard in shards]
+
+        def read(path):
+            with open(path, encoding="utf-8") as f:
+                return f.read()
+
+        cwd = os.getcwd()
+        with tempfile.TemporaryDirectory() as tmp:
+            os.chdir(tmp)
+            try:
+                single = FakeGenerator(batch_size=2, extract_path="")
+                expected = single.generate()
+                expected_osc = read(single.output_path)
+                expected_csv = read(single.mismatch_report_path)
+
+                sharded = FakeGenerator(batch_size=2, extract_path="", processes=3)
+                summary = sharded.generate()
+                self.assertEqual(summary, expected)
+                self.assertEqual(read(sharded.output_path), expected_osc)
+                self.assertEqual(read(sharded.mismatch_report_path), expected_csv)
+                self.assertEqual(sorted(sharded.outcomes), list(range(1, 12)))
+                # The partial files are removed after the merge
+                self.assertFalse(
+                    [name for name in os.listdir("output") if ".part" in name]
+                )
+            finally:
+                os.chdir(cwd)
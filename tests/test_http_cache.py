@@ -0,0 +1,84 @@
+import os
+import tempfile
+from unittest import TestCase
+
+import requests
+
+from src.models.http_cache import HttpCache
+from src.models.http_transport import HttpTransport
+
+
+class FakeTransport(HttpTransport):
+    """Answers every request with the next status code and remembers
+    the headers it was sent"""
+
+    def __init__(self, status_codes: list[int]):
+        super().__init__()
+        self.status_codes = status_codes
+        self.sent_headers: list[dict] = []
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        self.sent_headers.append(kwargs.get("headers", {}))
+        response = requests.Response()
+        response.url = url
+        response.status_code = self.status_codes.pop(0)
+        response._content = b"" if response.status_code == 304 else b'{"a": 1}'
+        response.headers["ETag"] = '"v1"'
+        return response
+
+
+class TestHttpCache(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "http.sqlite")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_fresh_response_is_served_from_disk(self):
+        http = FakeTransport([200])
+        cache = HttpCache(path=self.path, max_bytes=1000, http=http)
+        assert cache.get("https://example.org/a", ttl_seconds=60) == (200, b'{"a": 1}')
+        assert cache.get("https://example.org/a", ttl_seconds=60) == (200, b'{"a": 1}')
+        assert cache.hits == 1
+        assert len(http.sent_headers) == 1
+        cache.close()
+
+    def test_stale_response_is_revalidated(self):
+        http = FakeTransport([200, 304])
+        cache = HttpCache(path=self.path, max_bytes=1000, http=http)
+        cache.get("https://example.org/a", ttl_seconds=0)
+        assert cache.get("https://example.org/a", ttl_seconds=0) == (200, b'{"a": 1}')
+        assert http.sent_headers[1] == {"If-None-Match": '"v1"'}
+        assert cache.revalidated == 1
+        cache.close()
+
+    def test_errors_are_not_cached(self):
+        http = FakeTransport([503, 200])
+        cache = HttpCache(path=self.path, max_bytes=1000, http=http)
+        assert cache.get("https://example.org/a", ttl_seconds=60)[0] == 503
+        assert cache.get("https://example.org/a", ttl_seconds=60)[0] == 200
+        cache.close()
+
+    def test_evicts_least_recently_used(self):
+        http = FakeTransport([200, 200, 200])
+        # Room for two bodies of 8 bytes
+        cache = HttpCache(path=self.path, max_bytes=16, http=http)
+        cache.get("https://example.org/a", ttl_seconds=60)
+        cache.get("https://example.org/b", ttl_seconds=60)
+        cache.get("https://example.org/a", ttl_seconds=60)
+        cache.get("https://example.org/c", ttl_seconds=60)
+        assert len(cache) == 2
+        # a was used after b so b is the one that got evicted
+        cache.get("https://example.org/a", ttl_seconds=60)
+        assert cache.hits == 2
+        cache.close()
+
+    def test_bypass(self):
+        http = FakeTransport([200, 200])
+        cache = HttpCache(path=self.path, max_bytes=1000, bypass=True, http=http)
+        cache.get("https://example.org/a", ttl_seconds=60)
+        cache.get("https://example.org/a", ttl_seconds=60)
+        assert len(http.sent_headers) == 2
+        assert len(cache) == 0
+        cache.close()
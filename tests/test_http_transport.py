@@ -0,0 +1,46 @@
+from unittest import TestCase
+
+import requests
+
+import config
+from src.models.http_transport import HttpTransport
+
+
+class TestHttpTransport(TestCase):
+    @staticmethod
+    def __response__(status_code: int, content: bytes) -> requests.Response:
+        response = requests.Response()
+        response.url = "https://example.org/api"
+        response.status_code = status_code
+        response._content = content
+        return response
+
+    def test_counts_requests_bytes_and_errors_per_host(self):
+        transport = HttpTransport()
+        transport.__count__(self.__response__(200, b"abc"))
+        transport.__count__(self.__response__(503, b"down"))
+        assert transport.stats() == {
+            "example.org": {"requests": 2, "bytes": 7, "errors": 1}
+        }
+
+    def test_streamed_bodies_are_not_read_by_the_counter(self):
+        transport = HttpTransport()
+        response = requests.Response()
+        response.url = "https://example.org/api"
+        response.status_code = 200
+        transport.__count__(response, stream=True)
+        # Reading the content would have consumed the missing raw body
+        assert response._content is False
+        assert transport.stats() == {
+            "example.org": {"requests": 1, "bytes": 0, "errors": 0}
+        }
+
+    def test_instrument(self):
+        transport = HttpTransport(retries=2)
+        session = requests.Session()
+        transport.instrument(session)
+        transport.instrument(session)
+        adapter = session.get_adapter("https://example.org")
+        assert adapter.max_retries.total == 2
+        assert session.headers["User-Agent"] == config.user_agent
+        assert session.hooks["response"].count(transport.__count__) == 1
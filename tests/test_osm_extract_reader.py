@@ -0,0 +1,53 @@
+import bz2
+import os
+import tempfile
+from unittest import TestCase
+
+from src.models.osm_extract_reader import OsmExtractReader
+
+EXTRACT = b"""<?xml version="1.0" encoding="UTF-8"?>
+<osm version="0.6" generator="test">
+  <node id="1" version="1" lat="59.0" lon="18.0">
+    <tag k="wikidata" v="Q1"/>
+  </node>
+  <way id="2" version="1">
+    <nd ref="1"/>
+  </way>
+  <relation id="10" version="4">
+    <member type="way" ref="2" role=""/>
+    <tag k="name" v="Sjoslingan"/>
+  </relation>
+  <relation id="11" version="2">
+    <member type="way" ref="2" role=""/>
+  </relation>
+  <relation id="12" version="7">
+    <member type="node" ref="1" role=""/>
+  </relation>
+</osm>
+"""
+
+
+class TestOsmExtractReader(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def __write__(self, name: str, compress: bool = False) -> str:
+        path = os.path.join(self.tmp.name, name)
+        with open(path, "wb") as f:
+            f.write(bz2.compress(EXTRACT) if compress else EXTRACT)
+        return path
+
+    def test_only_wanted_relations(self):
+        reader = OsmExtractReader(self.__write__("sweden.osm.bz2", compress=True))
+        relations = reader.read_relations({10, 12, 99})
+        self.assertEqual(sorted(relations), [10, 12])
+        self.assertEqual(relations[10].version, 4)
+        self.assertEqual(relations[10].tags, {"name": "Sjoslingan"})
+        self.assertEqual(relations[12].members, [("node", 1, "")])
+
+    def test_all_relations(self):
+        reader = OsmExtractReader(self.__write__("sweden.osm"))
+        self.assertEqual([r.id for r in reader.iter_relations()], [10, 11, 12])
@@ -0,0 +1,43 @@
+import os
+import tempfile
+from unittest import TestCase
+
+from src.models.osm_relation import OSMRelation
+from src.models.osm_relation_index import OsmRelationIndex
+
+
+class TestOsmRelationIndex(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "relations.idx")
+        relations = [
+            OSMRelation(
+                osm_id=osm_id,
+                version=osm_id % 7 + 1,
+                tags={"type": "route", "name": f"Sjöslingan {osm_id}"},
+                members=[("way", osm_id * 10, ""), ("node", 2**40, "start")],
+            )
+            for osm_id in (500, 3, 17, 9000000000)
+        ]
+        relations.append(OSMRelation(osm_id=4, version=1, tags={"type": "boundary"}))
+        OsmRelationIndex.build(relations, self.path)
+        self.index = OsmRelationIndex(self.path)
+
+    def tearDown(self):
+        self.index.close()
+        self.tmp.cleanup()
+
+    def test_lookup(self):
+        self.assertEqual(len(self.index), 4)
+        relation = self.index.get(17)
+        assert relation is not None
+        self.assertEqual(relation.version, 4)
+        self.assertEqual(relation.tags["name"], "Sjöslingan 17")
+        self.assertEqual(relation.members, [("way", 170, ""), ("node", 2**40, "start")])
+        self.assertIsNotNone(self.index.get(9000000000))
+
+    def test_missing_and_filtered(self):
+        self.assertIsNone(self.index.get(1))
+        self.assertIsNone(self.index.get(4))
+        self.assertIsNone(self.index.get(10**12))
+        self.assertEqual(sorted(self.index.get_many([3, 4, 500])), [3, 500])
@@ -0,0 +1,78 @@
+import os
+import tempfile
+import time
+from unittest import TestCase
+
+from src.models.osm_relation import OSMRelation
+from src.models.osm_relation_store import OsmRelationStore
+
+
+class TestOsmRelationStore(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.store = OsmRelationStore(
+            path=os.path.join(self.tmp.name, "relations.sqlite"),
+            ttl_seconds=3600,
+            max_entries=2,
+        )
+
+    def tearDown(self):
+        self.store.close()
+        self.tmp.cleanup()
+
+    @staticmethod
+    def __relation__(osm_id: int, version: int = 1) -> OSMRelation:
+        return OSMRelation(
+            osm_id=osm_id,
+            version=version,
+            tags={"name": "Sjöslingan"},
+            members=[("way", 1, ""), ("node", 2, "start")],
+        )
+
+    def test_roundtrip(self):
+        self.store.put_many([self.__relation__(1)])
+        relation = self.store.get(1)
+        assert relation is not None
+        self.assertEqual(relation.tags, {"name": "Sjöslingan"})
+        self.assertEqual(relation.members, [("way", 1, ""), ("node", 2, "start")])
+
+    def test_expired_entries_count_as_missing(self):
+        self.store.ttl_seconds = 0
+        self.store.put_many([self.__relation__(1)])
+        self.assertIsNone(self.store.get(1))
+        # Fetching it again with the same version makes it fresh
+        self.store.ttl_seconds = 3600
+        self.store.put_many([self.__relation__(1)])
+        self.assertIsNotNone(self.store.get(1))
+
+    def test_evicts_least_recently_used(self):
+        self.store.put_many([self.__relation__(1), self.__relation__(2)])
+        time.sleep(0.01)
+        self.store.get(1)
+        time.sleep(0.01)
+        self.store.put_many([self.__relation__(3)])
+        self.assertEqual(len(self.store), 2)
+        self.assertIsNone(self.store.get(2))
+        self.assertIsNotNone(self.store.get(1))
+
+
+class TestOSMRelation(TestCase):
+    def test_parse_multi_fetch_xml(self):
+        xml = """<?xml version="1.0" encoding="UTF-8"?>
+        <osm version="0.6" generator="test">
+          <relation id="1" version="3">
+            <member type="way" ref="11" role=""/>
+            <tag k="name" v="One"/>
+          </relation>
+          <relation id="2" version="5">
+            <member type="node" ref="22" role="start"/>
+            <member type="way" ref="23" role=""/>
+            <tag k="wikidata" v="Q2"/>
+          </relation>
+          <relation id="3" version="2" visible="false"/>
+        </osm>"""
+        relations = OSMRelation.parse_xml(xml)
+        self.assertEqual([r.id for r in relations], [1, 2])
+        self.assertEqual(relations[0].version, 3)
+        self.assertEqual(relations[0].tags, {"name": "One"})
+        self.assertEqual(relations[1].members, [("node", 22, "start"), ("way", 23, "")])
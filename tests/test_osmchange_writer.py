@@ -0,0 +1,43 @@
+import os
+import tempfile
+import xml.etree.ElementTree as ET
+from unittest import TestCase
+
+from src.models.osmchange_writer import OsmChangeWriter
+
+
+class TestOsmChangeWriter(TestCase):
+    @staticmethod
+    def __block__(osm_id: int) -> ET.Element:
+        modify = ET.Element("modify")
+        elem = ET.SubElement(modify, "relation", id=str(osm_id), version="2")
+        ET.SubElement(elem, "member", type="way", ref="1", role="")
+        ET.SubElement(elem, "tag", k="name", v="Å & ö")
+        ET.SubElement(elem, "tag", k="wikidata", v=f"Q{osm_id}")
+        return modify
+
+    def test_same_output_as_indented_tree(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            tree_path = os.path.join(tmp, "tree.osc")
+            stream_path = os.path.join(tmp, "stream.osc")
+            root = ET.Element(
+                "osmChange", version="0.6", generator="hiking_trail_matcher"
+            )
+            for osm_id in (1, 2):
+                root.append(self.__block__(osm_id))
+            tree = ET.ElementTree(root)
+            ET.indent(tree, space="  ")
+            tree.write(tree_path, encoding="UTF-8", xml_declaration=True)
+            writer = OsmChangeWriter(stream_path)
+            for osm_id in (1, 2):
+                writer.write_block(self.__block__(osm_id))
+            self.assertTrue(writer.close())
+            with open(tree_path, "rb") as expected, open(stream_path, "rb") as actual:
+                self.assertEqual(expected.read(), actual.read())
+
+    def test_no_blocks_no_file(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "empty.osc")
+            writer = OsmChangeWriter(path)
+            self.assertFalse(writer.close())
+            self.assertFalse(os.path.exists(path))
@@ -0,0 +1,49 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest import TestCase
+
+from src.models.rate_limiter import HostConcurrencyLimiter, HostRateLimiter
+
+
+class TestHostRateLimiter(TestCase):
+    def test_spaces_requests_to_same_host(self):
+        limiter = HostRateLimiter(requests_per_second=50)
+        start = time.monotonic()
+        for _ in range(5):
+            limiter.wait("example.org")
+        self.assertGreaterEqual(time.monotonic() - start, 4 * 0.02 * 0.9)
+
+    def test_hosts_are_independent(self):
+        limiter = HostRateLimiter(requests_per_second=1)
+        start = time.monotonic()
+        limiter.wait("a.example.org")
+        limiter.wait("b.example.org")
+        self.assertLess(time.monotonic() - start, 0.5)
+
+
+class TestHostConcurrencyLimiter(TestCase):
+    def test_caps_requests_in_flight_across_pools(self):
+        limiter = HostConcurrencyLimiter(max_requests=2)
+        lock = threading.Lock()
+        in_flight = []
+        peak = []
+
+        def request(_):
+            with limiter.slot("example.org"):
+                with lock:
+                    in_flight.append(1)
+                    peak.append(len(in_flight))
+                time.sleep(0.01)
+                with lock:
+                    in_flight.pop()
+
+        def worker(_):
+            # Each worker has its own pool like the prepare workers do
+            with ThreadPoolExecutor(max_workers=4) as executor:
+                list(executor.map(request, range(4)))
+
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            list(executor.map(worker, range(4)))
+        self.assertEqual(len(peak), 16)
+        self.assertEqual(max(peak), 2)
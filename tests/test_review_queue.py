@@ -0,0 +1,76 @@
+import os
+import tempfile
+from unittest import TestCase
+
+from wikibaseintegrator import WikibaseIntegrator  # type: ignore
+
+from src.exceptions import UnfinishedQueueError
+from src.models.review_queue import ReviewQueue, ReviewQueueEntry
+from src.models.waymarked_result import WaymarkedResult
+
+
+class TestReviewQueue(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.queue = ReviewQueue(os.path.join(self.tmp.name, "queue.jsonl"))
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    @staticmethod
+    def __entry__(qid: str) -> ReviewQueueEntry:
+        result = WaymarkedResult(
+            id=1, name="Sjöslingan", similarity=0.9, checked_wikidata_tag=True
+        )
+        return ReviewQueueEntry(
+            qid=qid,
+            label="Sjöslingan",
+            entity={
+                "type": "item",
+                "id": qid,
+                "lastrevid": 1,
+                "labels": {"sv": {"language": "sv", "value": "Sjöslingan"}},
+                "claims": {},
+            },
+            osm_wikidata_link_data={"osm": []},
+            waymarked_results=[result.dict(exclude={"details"})],
+            prepared_waymarked_results=True,
+        )
+
+    def test_round_trip_to_trail_item(self):
+        self.queue.start()
+        self.queue.append(self.__entry__("Q1"))
+        self.queue.close()
+        (entry,) = list(self.queue)
+        trail_item = entry.to_trail_item(wbi=WikibaseIntegrator())
+        assert trail_item.item.id == "Q1"
+        assert trail_item.already_fetched_item_details is True
+        assert trail_item.fetched_osm_wikidata_link_data is True
+        assert trail_item.waymarked_results[0].similarity == 0.9
+        assert trail_item.waymarked_results[0].checked_wikidata_tag is True
+
+    def test_reviewed_entries_are_skipped(self):
+        self.queue.start()
+        self.queue.append(self.__entry__("Q1"))
+        self.queue.append(self.__entry__("Q2"))
+        self.queue.close()
+        self.queue.mark_reviewed("Q1")
+        assert [entry.qid for entry in self.queue] == ["Q2"]
+        # A new queue starts the review from the beginning
+        queue = ReviewQueue(self.queue.path, overwrite=True)
+        queue.start()
+        queue.close()
+        assert queue.reviewed_qids() == set()
+
+    def test_unfinished_queue_is_not_replaced(self):
+        self.queue.start()
+        self.queue.append(self.__entry__("Q1"))
+        self.queue.close()
+        with self.assertRaises(UnfinishedQueueError):
+            self.queue.start()
+        assert [entry.qid for entry in self.queue] == ["Q1"]
+        # Once everything is reviewed the queue can be replaced
+        self.queue.mark_reviewed("Q1")
+        self.queue.start()
+        self.queue.close()
+        assert list(self.queue) == []
@@ -0,0 +1,63 @@
+import os
+import tempfile
+from unittest import TestCase
+
+from src.models.route_location_index import RouteLocationIndex
+
+EXTRACT = b"""<?xml version="1.0" encoding="UTF-8"?>
+<osm version="0.6" generator="test">
+  <node id="1" version="1" lat="59.0" lon="18.0"/>
+  <node id="2" version="1" lat="59.2" lon="18.4"/>
+  <node id="3" version="1" lat="67.9" lon="18.6"/>
+  <way id="20" version="1">
+    <nd ref="1"/>
+    <nd ref="2"/>
+  </way>
+  <way id="21" version="1">
+    <nd ref="3"/>
+  </way>
+  <relation id="10" version="4">
+    <member type="way" ref="20" role=""/>
+    <tag k="route" v="hiking"/>
+  </relation>
+  <relation id="11" version="2">
+    <member type="way" ref="21" role=""/>
+    <tag k="route" v="foot"/>
+  </relation>
+  <relation id="12" version="7">
+    <member type="way" ref="21" role=""/>
+    <tag k="route" v="bus"/>
+  </relation>
+</osm>
+"""
+
+
+class TestRouteLocationIndex(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.extract_path = os.path.join(self.tmp.name, "extract.osm")
+        with open(self.extract_path, "wb") as f:
+            f.write(EXTRACT)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_build_from_extract(self):
+        index = RouteLocationIndex.build_from_extract(self.extract_path)
+        assert index.boxes == {
+            10: (59.0, 18.0, 59.2, 18.4),
+            11: (67.9, 18.6, 67.9, 18.6),
+        }
+
+    def test_distance_km(self):
+        index = RouteLocationIndex(boxes={10: (59.0, 18.0, 59.2, 18.4)})
+        assert index.distance_km(10, 59.1, 18.2) == 0
+        # One degree of latitude is about 111 km
+        assert round(index.distance_km(10, 60.2, 18.2)) == 111
+        assert index.distance_km(99, 59.1, 18.2) is None
+
+    def test_save_and_load(self):
+        path = os.path.join(self.tmp.name, "cache", "route_locations.json")
+        RouteLocationIndex(boxes={10: (59.0, 18.0, 59.2, 18.4)}).save(path)
+        index = RouteLocationIndex.load(path)
+        assert index.boxes == {10: (59.0, 18.0, 59.2, 18.4)}
@@ -0,0 +1,82 @@
+import json
+import os
+import tempfile
+from unittest import TestCase
+
+from src.enums import Phase
+from src.models.run_metrics import PhaseMetrics, RunMetrics
+
+
+class TestRunMetrics(TestCase):
+    def test_record_and_histogram(self):
+        metrics = RunMetrics()
+        for seconds in (0.005, 0.2, 0.2, 3.0):
+            metrics.record(Phase.WT_SEARCH, seconds, bytes_=100)
+        metrics.record(Phase.WT_SEARCH, 400.0, error=True)
+        stats = metrics.stats()["wt_search"]
+        assert stats["count"] == 5
+        assert stats["errors"] == 1
+        assert stats["bytes"] == 400
+        assert stats["max_seconds"] == 400.0
+        assert stats["histogram"]["0.01"] == 1
+        assert stats["histogram"]["0.25"] == 2
+        assert stats["histogram"]["5.0"] == 1
+        assert stats["histogram"]["inf"] == 1
+        assert stats["p50_seconds"] == 0.25
+        assert stats["p90_seconds"] == 400.0
+
+    def test_measure(self):
+        metrics = RunMetrics()
+        with metrics.measure(Phase.OSM_TAG_LOOKUP) as measurement:
+            measurement.bytes = 10
+        with metrics.measure(Phase.OSM_TAG_LOOKUP) as measurement:
+            measurement.error = True
+        with self.assertRaises(ValueError):
+            with metrics.measure(Phase.OSM_TAG_LOOKUP):
+                raise ValueError()
+        stats = metrics.stats()
+        assert list(stats) == ["osm_tag_lookup"]
+        assert stats["osm_tag_lookup"]["count"] == 3
+        assert stats["osm_tag_lookup"]["errors"] == 2
+        assert stats["osm_tag_lookup"]["bytes"] == 10
+
+    def test_stream(self):
+        metrics = RunMetrics()
+        chunks = metrics.stream(Phase.SPARQL_QUERY, iter(["{}", "åäö"]))
+        assert "".join(chunks) == "{}åäö"
+        # Stopping early is not an error
+        chunks = metrics.stream(Phase.SPARQL_QUERY, iter(["{", "}"]))
+        next(chunks)
+        chunks.close()
+        stats = metrics.stats()["sparql_query"]
+        assert stats["count"] == 2
+        assert stats["errors"] == 0
+        assert stats["bytes"] == 9
+
+    def test_merge(self):
+        worker = RunMetrics()
+        worker.record(Phase.OSM_TAG_LOOKUP, 0.2, bytes_=5)
+        metrics = RunMetrics()
+        metrics.record(Phase.OSM_TAG_LOOKUP, 2.0, bytes_=5, error=True)
+        metrics.merge(worker.stats())
+        stats = metrics.stats()["osm_tag_lookup"]
+        assert stats["count"] == 2
+        assert stats["errors"] == 1
+        assert stats["bytes"] == 10
+        assert stats["max_seconds"] == 2.0
+        assert stats["histogram"]["0.25"] == 1
+        assert stats["histogram"]["2.5"] == 1
+        assert PhaseMetrics.from_dict(stats).to_dict() == stats
+
+    def test_save(self):
+        metrics = RunMetrics()
+        metrics.record(Phase.THINK_TIME, 12.0)
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "metrics", "run.jsonl")
+            metrics.save(path, action="matched", count=1)
+            metrics.save(path, action="matched", count=2)
+            with open(path, encoding="utf-8") as f:
+                entries = [json.loads(line) for line in f]
+        assert [entry["count"] for entry in entries] == [1, 2]
+        assert entries[0]["action"] == "matched"
+        assert entries[0]["phases"]["think_time"]["seconds"] == 12.0
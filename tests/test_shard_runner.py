@@ -0,0 +1,44 @@
+from unittest import TestCase
+from unittest.mock import patch
+
+import config
+from src.enums import Phase
+from src.models.run_metrics import run_metrics
+from src.models.shard_runner import Shard, ShardRunner, run_shard
+
+
+class TestShardRunner(TestCase):
+    def test_parse_list(self):
+        shards = Shard.parse_list("Q34:sv, Q20:nb,Q33:fi")
+        assert [str(shard) for shard in shards] == ["Q34:sv", "Q20:nb", "Q33:fi"]
+        assert shards[1].queue_path == "output/review-queue-nb-Q20.jsonl"
+        assert shards[2].output_path("match") == "output/label-matches-fi-Q33.jsonl"
+
+    def test_parse_invalid(self):
+        for value in ("Q34", "sv:Q34", "Q34:"):
+            with self.assertRaises(ValueError):
+                Shard.parse(value)
+
+    @patch.object(config, "requests_per_second_per_host", 2.0)
+    @patch.object(config, "max_requests_per_host", 4)
+    @patch.object(config, "prepare_workers", 4)
+    def test_limits_are_divided_between_the_workers(self):
+        runner = ShardRunner(shards=Shard.parse_list("Q34:sv,Q20:nb"), workers=8)
+        assert runner.workers == 2
+        assert runner.__worker_environment__() == {
+            "REQUESTS_PER_SECOND_PER_HOST": "1.0",
+            "MAX_REQUESTS_PER_HOST": "2",
+            "PREPARE_WORKERS": "2",
+        }
+
+    def test_interactive_modes_cannot_be_sharded(self):
+        with self.assertRaises(ValueError):
+            ShardRunner(shards=Shard.parse_list("Q34:sv")).run(mode="review")
+
+    @patch.object(config, "country_qid", config.country_qid)
+    @patch.object(config, "language_code", config.language_code)
+    def test_each_shard_starts_with_empty_metrics(self):
+        run_metrics.record(Phase.SPARQL_QUERY, 1.0)
+        result = run_shard(mode="review", shard=Shard.parse("Q34:sv"))
+        assert result.error
+        assert run_metrics.stats() == {}
@@ -0,0 +1,82 @@
+import json
+from unittest import TestCase
+
+import requests
+
+from src.models.sparql_binding_stream import (
+    BackgroundBindingReader,
+    SparqlBindingStream,
+)
+
+RESULT = json.dumps(
+    {
+        "head": {"vars": ["item", "lastUpdate"]},
+        "results": {
+            "bindings": [
+                {"item": {"type": "uri", "value": "http://www.wikidata.org/entity/Q1"}},
+                {
+                    "item": {
+                        "type": "uri",
+                        "value": "http://www.wikidata.org/entity/Q2",
+                    },
+                    "lastUpdate": {"type": "literal", "value": "2023-06-23T00:00:00Z"},
+                },
+                {"item": {"type": "uri", "value": "http://www.wikidata.org/entity/Q3"}},
+            ]
+        },
+    },
+    indent=1,
+)
+
+
+class TestSparqlBindingStream(TestCase):
+    def test_whole_result(self):
+        bindings = list(SparqlBindingStream([RESULT]))
+        assert bindings == json.loads(RESULT)["results"]["bindings"]
+
+    def test_any_chunk_size(self):
+        expected = json.loads(RESULT)["results"]["bindings"]
+        for size in (1, 2, 7, 64):
+            chunks = [RESULT[i : i + size] for i in range(0, len(RESULT), size)]
+            assert list(SparqlBindingStream(chunks)) == expected
+
+    def test_yields_before_the_end_arrives(self):
+        def chunks():
+            yield RESULT[: RESULT.index("Q2")]
+            raise AssertionError("read more than needed for the first binding")
+
+        stream = iter(SparqlBindingStream(chunks()))
+        assert next(stream)["item"]["value"].endswith("Q1")
+
+    def test_empty(self):
+        assert list(SparqlBindingStream(['{"results": {"bindings": []}}'])) == []
+
+    def test_truncated(self):
+        with self.assertRaises(ValueError):
+            list(SparqlBindingStream([RESULT[: RESULT.index("Q3")]]))
+
+
+class TestBackgroundBindingReader(TestCase):
+    def test_reads_the_whole_result_before_it_is_used(self):
+        read = []
+
+        def chunks():
+            for chunk in (RESULT[:100], RESULT[100:]):
+                read.append(chunk)
+                yield chunk
+
+        reader = BackgroundBindingReader(chunks())
+        reader.thread.join(timeout=5)
+        assert "".join(read) == RESULT
+        assert list(reader) == json.loads(RESULT)["results"]["bindings"]
+
+    def test_raises_after_the_bindings_read_before_the_error(self):
+        def chunks():
+            yield RESULT[: RESULT.index("Q3")]
+            raise requests.ConnectionError("connection dropped")
+
+        bindings = iter(BackgroundBindingReader(chunks()))
+        assert next(bindings)["item"]["value"].endswith("Q1")
+        assert next(bindings)["item"]["value"].endswith("Q2")
+        with self.assertRaises(requests.ConnectionError):
+            next(bindings)
@@ -1,15 +1,32 @@
+import os
+import tempfile
+import time
 from datetime import datetime
 from unittest import TestCase
+from unittest.mock import patch
 
 from dateutil.tz import tzutc
 from wikibaseintegrator import WikibaseIntegrator  # type: ignore
+from wikibaseintegrator.entities import ItemEntity  # type: ignore
 
 import config
 from src.console import console
+from src.models.osm_relation import OSMRelation
+from src.models.osm_relation_lookup import OsmRelationLookup
+from src.models.osm_relation_store import OsmRelationStore
+from src.models.route_location_index import RouteLocationIndex
 from src.models.trail_item import TrailItem
+from src.models.waymarked_candidate import WaymarkedCandidate
 from src.models.waymarked_result import WaymarkedResult
 
 
+class FakeWaymarkedResult(WaymarkedResult):
+    def __fetch_details__(self):
+        # Finish in reverse order to check that the order is kept
+        time.sleep(0.01 * (10 - self.id))
+        self.details = {"description": f"details of {self.id}"}
+
+
 class TestTrailItem(TestCase):
     last_update_test_item = (
         "Q7407905"  # small trail in USA which I hope won't change much
@@ -22,13 +39,25 @@ class TestTrailItem(TestCase):
     #     assert len(trail_item.waymarked_results) == 2
     #     assert trail_item.waymarked_results[0].id == 254324
 
-    def test_remove_duplicates(self):
-        trail_item = TrailItem(wbi=WikibaseIntegrator())
-        trail_item.waymarked_results.append(WaymarkedResult(name="test", id=1))
-        trail_item.waymarked_results.append(WaymarkedResult(name="test", id=1))
-        assert len(trail_item.waymarked_results) == 2
-        trail_item.__remove_waymaked_result_duplicates__()
-        assert len(trail_item.waymarked_results) == 1
+    def test___filter_waymarked_results_by_similarity__(self):
+        trail_item = TrailItem(wbi=WikibaseIntegrator(), label="Åtvidaberg-Falerum")
+        trail_item.waymarked_candidates = [
+            WaymarkedCandidate(id=1, name="Lilla Älgsjön runt"),
+            WaymarkedCandidate(id=2, name="Falerum - Åtvidaberg"),
+        ]
+        trail_item.__filter_waymarked_results_by_similarity__(verbose=False)
+        assert [result.id for result in trail_item.waymarked_results] == [2]
+        assert trail_item.waymarked_results[0].similarity == 1.0
+        assert trail_item.waymarked_candidates == []
+
+    def test_release(self):
+        trail_item = TrailItem(wbi=WikibaseIntegrator(), qid="Q1", label="test")
+        trail_item.entity_json = {"id": "Q1"}
+        trail_item.waymarked_results = [WaymarkedResult(name="test", id=1)]
+        trail_item.release()
+        assert trail_item.entity_json == {}
+        assert trail_item.waymarked_results == []
+        assert trail_item.qid == "Q1"
 
     def test_convert_to_choices(self):
         trail_item = TrailItem(wbi=WikibaseIntegrator())
@@ -38,6 +67,100 @@ class TestTrailItem(TestCase):
         assert trail_item.choices[0].title == "test (10528596)"
         assert trail_item.choices[0].value.osm_id == 10528596
 
+    def test___get_details_from_waymarked_trails__(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            store = OsmRelationStore(
+                path=os.path.join(tmp, "relations.sqlite"),
+                ttl_seconds=3600,
+                max_entries=10,
+            )
+            store.put_many(
+                OSMRelation(osm_id=osm_id, version=1, tags={"wikidata": f"Q{osm_id}"})
+                for osm_id in range(1, 6)
+            )
+
+            class LocalTrailItem(TrailItem):
+                lookup = OsmRelationLookup(store=store)
+
+            trail_item = LocalTrailItem(wbi=WikibaseIntegrator())
+            trail_item.waymarked_results = [
+                FakeWaymarkedResult(name="test", id=osm_id) for osm_id in range(1, 6)
+            ]
+            with patch.object(config, "max_detailed_candidates", 3):
+                trail_item.__get_details_from_waymarked_trails__()
+            store.close()
+        results = trail_item.waymarked_results
+        assert [result.id for result in results] == [1, 2, 3, 4, 5]
+        assert [result.details_loaded for result in results] == [
+            True,
+            True,
+            True,
+            False,
+            False,
+        ]
+        assert results[4].wikidata == "Q5"
+        # Reading or serializing a compact candidate does not load its details
+        assert results[4].description == ""
+        assert results[4].dict()["description"] == ""
+        assert results[4].details_loaded is False
+        # Only asking for them does
+        results[4].get_details()
+        assert results[4].description == "details of 5"
+        assert results[4].details_loaded is True
+
+    def test___filter_waymarked_results_by_distance__(self):
+        class LocalTrailItem(TrailItem):
+            @staticmethod
+            def __route_location_index__():
+                return RouteLocationIndex(
+                    boxes={1: (59.0, 18.0, 59.2, 18.4), 2: (67.9, 18.6, 67.9, 18.6)}
+                )
+
+        wbi = WikibaseIntegrator()
+        trail_item = LocalTrailItem(wbi=wbi, qid="Q1")
+        trail_item.item = ItemEntity(api=wbi).from_json(
+            {
+                "type": "item",
+                "id": "Q1",
+                "lastrevid": 1,
+                "labels": {},
+                "descriptions": {},
+                "claims": {
+                    "P625": [
+                        {
+                            "mainsnak": {
+                                "snaktype": "value",
+                                "property": "P625",
+                                "datatype": "globe-coordinate",
+                                "datavalue": {
+                                    "value": {
+                                        "latitude": 59.1,
+                                        "longitude": 18.2,
+                                        "altitude": None,
+                                        "precision": 0.0001,
+                                        "globe": "http://www.wikidata.org/entity/Q2",
+                                    },
+                                    "type": "globecoordinate",
+                                },
+                            },
+                            "type": "statement",
+                            "id": "Q1$1",
+                            "rank": "normal",
+                        }
+                    ]
+                },
+            }
+        )
+        trail_item.waymarked_results = [
+            WaymarkedResult(name="test", id=osm_id) for osm_id in (1, 2, 3)
+        ]
+        with patch.object(config, "candidate_radius_km", 50):
+            trail_item.__filter_waymarked_results_by_distance__()
+        # The far one is dropped and the unknown one kept
+        assert [result.id for result in trail_item.waymarked_results] == [1, 3]
+        assert trail_item.waymarked_results[0].distance_km == 0
+        assert trail_item.waymarked_results[1].distance_km is None
+
     def test_lookup_in_osm_wikidata_link_api_no_match(self):
         trail_item = TrailItem(wbi=WikibaseIntegrator(), qid="Q820225")
         trail_item.lookup_using_osm_wikidata_link()
@@ -76,6 +199,24 @@ class TestTrailItem(TestCase):
         assert trail_item.label == ""
         assert trail_item.description == ""
 
+    def test___get_item_details_prefetched(self):
+        wbi = WikibaseIntegrator()
+        trail_item = TrailItem(wbi=wbi, qid="Q1")
+        trail_item.item = ItemEntity(api=wbi).from_json(
+            {
+                "type": "item",
+                "id": "Q1",
+                "lastrevid": 1,
+                "labels": {"sv": {"language": "sv", "value": "Testleden"}},
+                "descriptions": {},
+                "claims": {},
+            }
+        )
+        with patch.object(config, "language_code", "sv"):
+            trail_item.__get_item_details__()
+        assert trail_item.label == "Testleden"
+        assert trail_item.description == ""
+
     def test___get_item_details_no_value(self):
         trail_item = TrailItem(wbi=WikibaseIntegrator(), qid=self.last_update_test_item)
         trail_item.__get_item_details__()
@@ -0,0 +1,50 @@
+from unittest import TestCase
+
+from wikibaseintegrator import WikibaseIntegrator  # type: ignore
+
+from src.models.trail_item import TrailItem
+from src.models.trail_item_prefetcher import TrailItemPrefetcher
+
+
+class FakeTrailItem(TrailItem):
+    prepared: bool = False
+
+    def prepare(self, complete: bool = False) -> None:
+        if self.qid == "Q2":
+            raise Exception("network is down")
+        self.prepared = True
+
+
+class TestTrailItemPrefetcher(TestCase):
+    def test_prepares_scheduled_items(self):
+        prefetcher = TrailItemPrefetcher(lookahead=2)
+        item = FakeTrailItem(wbi=WikibaseIntegrator(), qid="Q1")
+        prefetcher.schedule(item)
+        prefetcher.wait(item)
+        prefetcher.close()
+        assert item.prepared is True
+
+    def test_is_scheduled_until_waited_for(self):
+        prefetcher = TrailItemPrefetcher(lookahead=2)
+        item = FakeTrailItem(wbi=WikibaseIntegrator(), qid="Q1")
+        assert prefetcher.is_scheduled(item) is False
+        prefetcher.schedule(item)
+        assert prefetcher.is_scheduled(item) is True
+        prefetcher.wait(item)
+        prefetcher.close()
+        assert prefetcher.is_scheduled(item) is False
+
+    def test_failed_preparation_is_not_raised(self):
+        prefetcher = TrailItemPrefetcher(lookahead=2)
+        item = FakeTrailItem(wbi=WikibaseIntegrator(), qid="Q2")
+        prefetcher.schedule(item)
+        prefetcher.wait(item)
+        prefetcher.close()
+        assert item.prepared is False
+
+    def test_disabled(self):
+        prefetcher = TrailItemPrefetcher(lookahead=0)
+        item = FakeTrailItem(wbi=WikibaseIntegrator(), qid="Q1")
+        prefetcher.schedule(item)
+        prefetcher.wait(item)
+        assert item.prepared is False
@@ -0,0 +1,30 @@
+from unittest import TestCase
+
+from src.models.waymarked_candidate import WaymarkedCandidate
+
+
+class TestWaymarkedCandidate(TestCase):
+    def test_parse_results(self):
+        candidates = WaymarkedCandidate.parse_results(
+            {
+                "results": [
+                    {"id": 2, "name": "Sjöslingan", "ref": "S", "itinerary": ["A"]},
+                    {"id": 1, "name": "Kungsleden", "group": "NAT"},
+                    {"id": 2, "name": "Sjöslingan"},
+                    "not a result",
+                ]
+            }
+        )
+        assert [candidate.id for candidate in candidates] == [2, 1]
+        assert candidates[0].itinerary == ("A",)
+        assert candidates[1].group == "NAT"
+        assert not hasattr(candidates[0], "__dict__")
+
+    def test_to_waymarked_result(self):
+        candidate = WaymarkedCandidate(id=1, name="Kungsleden", itinerary=("A", "B"))
+        result = candidate.to_waymarked_result(similarity=0.9)
+        assert result.id == 1
+        assert result.name == "Kungsleden"
+        assert result.itinerary == ["A", "B"]
+        assert result.similarity == 0.9
+        assert result.details_loaded is False
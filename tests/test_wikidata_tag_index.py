@@ -0,0 +1,56 @@
+import os
+import tempfile
+from unittest import TestCase
+
+from src.models.osm_relation import OSMRelation
+from src.models.osm_wikidata_link_result import OsmWikidataLinkResult
+from src.models.wikidata_tag_index import WikidataTagIndex
+
+EXTRACT = b"""<?xml version="1.0" encoding="UTF-8"?>
+<osm version="0.6" generator="test">
+  <node id="1" version="1" lat="59.0" lon="18.0">
+    <tag k="wikidata" v="Q1"/>
+    <tag k="name" v="Start"/>
+  </node>
+  <way id="2" version="1">
+    <nd ref="1"/>
+  </way>
+  <relation id="10" version="4">
+    <member type="way" ref="2" role=""/>
+    <tag k="name" v="Sjoslingan"/>
+    <tag k="ref" v="S1"/>
+    <tag k="wikidata" v="Q1;Q2"/>
+  </relation>
+</osm>
+"""
+
+
+class TestWikidataTagIndex(TestCase):
+    def test_build_from_extract(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "extract.osm")
+            with open(path, "wb") as f:
+                f.write(EXTRACT)
+            index = WikidataTagIndex.build_from_extract(path)
+            index_path = os.path.join(tmp, "index.json")
+            index.save(index_path)
+            index = WikidataTagIndex.load(index_path)
+        data = index.lookup("Q1")
+        self.assertEqual(
+            [(o["type"], o["id"]) for o in data["osm"]], [("node", 1), ("relation", 10)]
+        )
+        relation = OsmWikidataLinkResult(**data["osm"][1])
+        self.assertEqual(relation.tags.name, "Sjoslingan")
+        self.assertEqual(relation.tags.ref, "S1")
+        self.assertEqual(len(index.lookup("Q2")["osm"]), 1)
+        self.assertEqual(index.lookup("Q3"), {"osm": []})
+
+    def test_build_from_relations(self):
+        index = WikidataTagIndex.build_from_relations(
+            [
+                OSMRelation(osm_id=5, version=1, tags={"wikidata": "Q5"}),
+                OSMRelation(osm_id=6, version=1, tags={"name": "Untagged"}),
+            ]
+        )
+        self.assertEqual(len(index), 1)
+        self.assertEqual(index.lookup("Q5")["osm"][0]["tags"]["name"], "")
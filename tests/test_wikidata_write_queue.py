@@ -0,0 +1,131 @@
+import os
+import sqlite3
+import tempfile
+from unittest import TestCase
+
+import requests
+from wikibaseintegrator import WikibaseIntegrator  # type: ignore
+
+from src.console import console
+from src.models.wikidata_write_queue import WikidataWriteQueue
+
+
+class FakeWriteQueue(WikidataWriteQueue):
+    """Saves to a list instead of Wikidata and fails for Q2"""
+
+    saved: list[str] = []
+    baserevids: list[int] = []
+    failing: set[str] = {"Q2"}
+
+    def __save__(self, qid: str, data: dict, summary: str, baserevid: int) -> None:
+        if qid in self.failing:
+            raise ValueError("modification-failed")
+        self.saved.append(qid)
+        self.baserevids.append(baserevid)
+
+
+class TestWikidataWriteQueue(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "edits.sqlite")
+        FakeWriteQueue.saved = []
+        FakeWriteQueue.baserevids = []
+        FakeWriteQueue.failing = {"Q2"}
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def __queue__(self) -> FakeWriteQueue:
+        return FakeWriteQueue(
+            path=self.path, wbi=WikibaseIntegrator(), edits_per_minute=0
+        )
+
+    def test_writes_in_order_and_keeps_failures(self):
+        queue = self.__queue__()
+        queue.start()
+        for qid in ["Q1", "Q2", "Q3"]:
+            queue.put(qid=qid, data={"claims": {}}, summary="test")
+        queue.close()
+        assert FakeWriteQueue.saved == ["Q1", "Q3"]
+        # The failed edit is kept but not retried in the next session
+        queue = self.__queue__()
+        assert len(queue) == 1
+        assert queue.failures() == [("Q2", "modification-failed")]
+        queue.start()
+        queue.close()
+        assert FakeWriteQueue.saved == ["Q1", "Q3"]
+        assert len(queue) == 1
+
+    def test_failed_edits_are_written_after_an_explicit_retry(self):
+        queue = self.__queue__()
+        queue.start()
+        queue.put(qid="Q2", data={}, summary="test")
+        queue.close()
+        FakeWriteQueue.failing = set()
+        queue = self.__queue__()
+        assert queue.retry_failed() == 1
+        queue.start()
+        queue.close()
+        assert FakeWriteQueue.saved == ["Q2"]
+        assert len(queue) == 0
+
+    def test_sends_the_revision_at_enqueue_time(self):
+        queue = self.__queue__()
+        queue.put(qid="Q1", data={}, summary="test", baserevid=1234)
+        queue.start()
+        queue.close()
+        assert FakeWriteQueue.baserevids == [1234]
+
+    def test_adds_the_baserevid_column_to_an_old_queue(self):
+        connection = sqlite3.connect(self.path)
+        connection.execute(
+            "CREATE TABLE edits (id INTEGER PRIMARY KEY AUTOINCREMENT, "
+            "qid TEXT NOT NULL, data TEXT NOT NULL, summary TEXT NOT NULL, "
+            "message TEXT NOT NULL, failed INTEGER NOT NULL DEFAULT 0, "
+            "attempts INTEGER NOT NULL DEFAULT 0, "
+            "last_error TEXT NOT NULL DEFAULT '')"
+        )
+        connection.execute(
+            "INSERT INTO edits (qid, data, summary, message) "
+            "VALUES ('Q1', '{}', 'test', '')"
+        )
+        connection.commit()
+        connection.close()
+        queue = self.__queue__()
+        queue.start()
+        queue.close()
+        assert FakeWriteQueue.saved == ["Q1"]
+        assert FakeWriteQueue.baserevids == [0]
+
+    def test_edits_survive_until_started(self):
+        queue = self.__queue__()
+        queue.put(qid="Q1", data={}, summary="test")
+        queue.close()
+        queue = self.__queue__()
+        queue.start()
+        queue.close()
+        assert FakeWriteQueue.saved == ["Q1"]
+
+    def test_messages_are_shown_when_closed(self):
+        queue = self.__queue__()
+        queue.put(qid="Q1", data={}, summary="test", message="Upload done")
+        queue.put(qid="Q2", data={}, summary="test", message="Not shown")
+        queue.start()
+        with console.capture() as capture:
+            queue.close()
+        output = capture.get()
+        assert "Saved 1 edits to Wikidata\nUpload done\n" in output
+        assert "Not shown" not in output
+
+    def test_retry_delay(self):
+        response = requests.Response()
+        response.status_code = 429
+        response.headers["Retry-After"] = "7"
+        error = requests.HTTPError(response=response)
+        assert WikidataWriteQueue.__retry_delay__(error, attempts=1) == 7
+        response.status_code = 400
+        assert WikidataWriteQueue.__retry_delay__(error, attempts=1) is None
+        assert (
+            WikidataWriteQueue.__retry_delay__(requests.ConnectionError(), attempts=2)
+            == 4
+        )